@@ -3,12 +3,21 @@ import json
 import os
 import hashlib
 import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from PIL import Image
 import random
 import time
+import heapq
+import math
+from utils.lazy_imports import lazy_import
+from utils.account_summary import SUMMARY_FIELD, summarize, update_account_summary
+from utils import amortization
+from utils.transaction_snapshot import append_transactions
+from utils.transaction_monitor import monitor_transactions
+
+# Charting and data libraries are imported the first time a page uses them
+pd = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
 
 # Set page configuration
 st.set_page_config(
@@ -234,8 +243,57 @@ def get_transactions(username):
     
     return transactions[username]
 
-def add_transaction(username, transaction_type, amount, description):
-    """Add a transaction for a user."""
+def get_recent_transactions(username, limit=5, cursor=None):
+    """Get a user's newest transactions, newest first, and a cursor for older ones."""
+    transactions = get_transactions(username)
+    
+    # Transactions are appended in time order, so the newest are at the end
+    end = len(transactions) if cursor is None else min(cursor, len(transactions))
+    start = max(0, end - limit)
+    
+    return transactions[start:end][::-1], (start if start > 0 else None)
+
+def query_transactions(username, transaction_type=None, sort_by="newest", limit=25, cursor=None):
+    """Get one page of a user's transactions, filtered and sorted, and a cursor for the next page."""
+    transactions = get_transactions(username)
+    
+    def matches(t):
+        return transaction_type is None or t["type"] == transaction_type
+    
+    if sort_by in ("newest", "oldest"):
+        # Transactions are appended in time order; walk the list from one end and
+        # stop after one row past the page. The cursor is a list position
+        if sort_by == "newest":
+            end = len(transactions) if cursor is None else min(cursor, len(transactions))
+            positions = range(end - 1, -1, -1)
+        else:
+            positions = range(cursor or 0, len(transactions))
+        
+        page = []
+        for i in positions:
+            if not matches(transactions[i]):
+                continue
+            if len(page) == limit:
+                return page, (last + 1 if sort_by == "oldest" else last)
+            page.append(transactions[i])
+            last = i
+        return page, None
+    
+    # Amount order: keyset on (amount, position), keeping only the rows after the
+    # cursor and selecting the next page with a bounded heap
+    sign = -1 if sort_by == "amount_desc" else 1
+    after = tuple(cursor) if cursor is not None else None
+    keys = (
+        (sign * t["amount"], i) for i, t in enumerate(transactions)
+        if matches(t) and (after is None or (sign * t["amount"], i) > after)
+    )
+    selected = heapq.nsmallest(limit + 1, keys)
+    page = [transactions[i] for _, i in selected[:limit]]
+    
+    return page, (list(selected[limit - 1]) if len(selected) > limit else None)
+
+def add_transaction(username, transaction_type, amount, description, recipient=None):
+    """Add a transaction for a user; recipient is the account paid by a transfer."""
     transactions = load_data(TRANSACTIONS_FILE)
     
     if username not in transactions:
@@ -248,28 +306,43 @@ def add_transaction(username, transaction_type, amount, description):
         "description": description,
         "timestamp": datetime.datetime.now().isoformat()
     }
+    if recipient:
+        transaction["counterparty"] = recipient
     
     transactions[username].append(transaction)
     save_data(transactions, TRANSACTIONS_FILE)
     
-    # Update account balance
+    # Keep the admin's columnar snapshot in step
+    append_transactions(username, [transaction])
+    
+    # Update account balance and running totals
     accounts = load_data(ACCOUNTS_FILE)
     
     if transaction_type == "credit":
         accounts[username]["balance"] += amount
     else:
         accounts[username]["balance"] -= amount
+    # The history is only copied for the one-time backfill of an account without a summary
+    update_account_summary(accounts[username], [transaction], history=lambda: transactions[username][:-1])
     
     save_data(accounts, ACCOUNTS_FILE)
+    
+    # Check the new transaction against the suspicious-activity rules
+    monitor_transactions(username, accounts[username].get("account_number", username), [transaction], recipient)
 
-def calculate_emi(principal, rate, time):
-    """Calculate EMI."""
-    rate = rate / (12 * 100)  # Monthly interest rate
-    time = time * 12  # Total number of months
+def get_account_summary(username):
+    """Get the running credit/debit totals of a user's account."""
+    account = get_account_details(username)
     
-    emi = (principal * rate * (1 + rate) ** time) / ((1 + rate) ** time - 1)
+    if not account:
+        return None
     
-    return emi
+    # Accounts created before summaries existed are computed from their history
+    return account.get(SUMMARY_FIELD) or summarize(get_transactions(username))
+
+def calculate_emi(principal, rate, time):
+    """Calculate EMI."""
+    return amortization.calculate_emi(principal, rate, time * 12)  # Tenure in months
 
 # Navigation functions
 def navigate_to(page):
@@ -429,6 +502,24 @@ def dashboard_page():
         st.markdown(f'<p class="account-balance">₹{account["balance"]:,.2f}</p>', unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
+    # This month's money in and out, from the account's running totals
+    summary = account.get(SUMMARY_FIELD)
+    if summary:
+        month = summary["monthly"].get(datetime.datetime.now().strftime("%Y-%m"), {})
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.markdown('<h3>Money In This Month</h3>', unsafe_allow_html=True)
+            st.markdown(f'<p class="transaction-amount-credit">+₹{month.get("credit", 0):,.2f}</p>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        with col2:
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.markdown('<h3>Money Out This Month</h3>', unsafe_allow_html=True)
+            st.markdown(f'<p class="transaction-amount-debit">-₹{month.get("debit", 0):,.2f}</p>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+    
     # Quick Actions
     st.markdown('<h3>Quick Actions</h3>', unsafe_allow_html=True)
     
@@ -461,14 +552,19 @@ def dashboard_page():
     # Recent Transactions
     st.markdown('<h3>Recent Transactions</h3>', unsafe_allow_html=True)
     
-    transactions = get_transactions(st.session_state.username)
-    
-    if not transactions:
+    # Newest 5 transactions; "Load More" pages back with the cursor and the loaded
+    # pages are kept until a new transaction arrives
+    latest, cursor = get_recent_transactions(st.session_state.username)
+    loaded = st.session_state.get("recent_transactions")
+    if st.session_state.get("recent_user") != st.session_state.username or not loaded or not latest or loaded[0] != latest[0]:
+        st.session_state.recent_user = st.session_state.username
+        st.session_state.recent_transactions = latest
+        st.session_state.recent_cursor = cursor
+    recent_transactions = st.session_state.recent_transactions
+    
+    if not recent_transactions:
         st.info("No transactions found")
     else:
-        # Display only the 5 most recent transactions
-        recent_transactions = sorted(transactions, key=lambda x: x["timestamp"], reverse=True)[:5]
-        
         for transaction in recent_transactions:
             col1, col2, col3 = st.columns([3, 1, 1])
             
@@ -490,6 +586,13 @@ def dashboard_page():
                 st.markdown(f'<div class="transaction">', unsafe_allow_html=True)
                 st.markdown(f'<p>{transaction["type"].capitalize()}</p>', unsafe_allow_html=True)
                 st.markdown('</div>', unsafe_allow_html=True)
+        
+        if st.session_state.recent_cursor is not None and st.button("Load More", key="recent_more_btn"):
+            older, st.session_state.recent_cursor = get_recent_transactions(
+                st.session_state.username, cursor=st.session_state.recent_cursor
+            )
+            st.session_state.recent_transactions = recent_transactions + older
+            st.rerun()
 
 def account_details_page():
     st.markdown('<h2 class="sub-header">Account Details</h2>', unsafe_allow_html=True)
@@ -552,14 +655,14 @@ def account_details_page():
 def transactions_page():
     st.markdown('<h2 class="sub-header">Transaction History</h2>', unsafe_allow_html=True)
     
-    transactions = get_transactions(st.session_state.username)
+    summary = get_account_summary(st.session_state.username)
     
-    if not transactions:
+    if not summary or summary["credit_count"] + summary["debit_count"] == 0:
         st.info("No transactions found")
         return
     
     # Filter options
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
         transaction_type = st.selectbox("Filter by Type", ["All", "Credit", "Debit"])
@@ -567,48 +670,60 @@ def transactions_page():
     with col2:
         sort_by = st.selectbox("Sort by", ["Newest First", "Oldest First", "Amount (High to Low)", "Amount (Low to High)"])
     
-    # Apply filters
-    filtered_transactions = transactions.copy()
+    with col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100])
+    
+    # Filtering, sorting and paging happen in query_transactions; only the
+    # visible page is built and rendered
+    filters = {
+        "transaction_type": None if transaction_type == "All" else transaction_type.lower(),
+        "sort_by": {
+            "Newest First": "newest",
+            "Oldest First": "oldest",
+            "Amount (High to Low)": "amount_desc",
+            "Amount (Low to High)": "amount_asc",
+        }[sort_by],
+    }
     
-    if transaction_type != "All":
-        filtered_transactions = [t for t in filtered_transactions if t["type"].lower() == transaction_type.lower()]
+    # Cursors of the pages visited so far; start over when the filters change
+    if st.session_state.get("transaction_filters") != (filters, page_size):
+        st.session_state.transaction_filters = (filters, page_size)
+        st.session_state.transaction_cursors = [None]
+    cursors = st.session_state.transaction_cursors
     
-    # Apply sorting
-    if sort_by == "Newest First":
-        filtered_transactions = sorted(filtered_transactions, key=lambda x: x["timestamp"], reverse=True)
-    elif sort_by == "Oldest First":
-        filtered_transactions = sorted(filtered_transactions, key=lambda x: x["timestamp"])
-    elif sort_by == "Amount (High to Low)":
-        filtered_transactions = sorted(filtered_transactions, key=lambda x: x["amount"], reverse=True)
-    elif sort_by == "Amount (Low to High)":
-        filtered_transactions = sorted(filtered_transactions, key=lambda x: x["amount"])
+    page, next_cursor = query_transactions(st.session_state.username, limit=page_size, cursor=cursors[-1], **filters)
     
-    # Display transactions
-    st.markdown('<div class="card">', unsafe_allow_html=True)
+    # Matching count from the running totals
+    if filters["transaction_type"]:
+        total = summary[f"{filters['transaction_type']}_count"]
+    else:
+        total = summary["credit_count"] + summary["debit_count"]
+    st.caption(f"{total:,} transactions - page {len(cursors)} of {max(1, math.ceil(total / page_size))}")
     
-    for transaction in filtered_transactions:
-        col1, col2, col3 = st.columns([3, 1, 1])
-        
-        with col1:
-            st.markdown(f'<div class="transaction">', unsafe_allow_html=True)
-            st.markdown(f'<p>{transaction["description"]}</p>', unsafe_allow_html=True)
-            st.markdown(f'<p style="font-size: 0.8rem; color: #6b7280;">{transaction["timestamp"]}</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown(f'<div class="transaction">', unsafe_allow_html=True)
-            if transaction["type"] == "credit":
-                st.markdown(f'<p class="transaction-amount-credit">+₹{transaction["amount"]:,.2f}</p>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<p class="transaction-amount-debit">-₹{transaction["amount"]:,.2f}</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown(f'<div class="transaction">', unsafe_allow_html=True)
-            st.markdown(f'<p>{transaction["type"].capitalize()}</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+    # Display the page as one table
+    if not page:
+        st.info("No transactions found")
+    else:
+        df = pd.DataFrame({
+            "Date": [t["timestamp"][:16].replace("T", " ") for t in page],
+            "Description": [t["description"] for t in page],
+            "Type": [t["type"].capitalize() for t in page],
+            "Amount": [f"+₹{t['amount']:,.2f}" if t["type"] == "credit" else f"-₹{t['amount']:,.2f}" for t in page],
+        })
+        st.dataframe(df, hide_index=True, use_container_width=True)
+    
+    # Pagination
+    col1, col2 = st.columns(2)
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    with col1:
+        if st.button("Previous Page", disabled=len(cursors) == 1, key="transactions_prev"):
+            cursors.pop()
+            st.rerun()
+    
+    with col2:
+        if st.button("Next Page", disabled=next_cursor is None, key="transactions_next"):
+            cursors.append(next_cursor)
+            st.rerun()
     
     # Transaction Summary
     st.markdown('<h3>Transaction Summary</h3>', unsafe_allow_html=True)
@@ -616,9 +731,9 @@ def transactions_page():
     col1, col2 = st.columns(2)
     
     with col1:
-        # Calculate total credits and debits
-        total_credits = sum(t["amount"] for t in transactions if t["type"] == "credit")
-        total_debits = sum(t["amount"] for t in transactions if t["type"] == "debit")
+        # Total credits and debits from the account's running totals
+        total_credits = summary["credit_total"]
+        total_debits = summary["debit_total"]
         
         # Create a pie chart
         fig, ax = plt.subplots()
@@ -628,7 +743,7 @@ def transactions_page():
     
     with col2:
         # Create a bar chart of recent transactions
-        recent_transactions = sorted(transactions, key=lambda x: x["timestamp"], reverse=True)[:5]
+        recent_transactions, _ = get_recent_transactions(st.session_state.username)
         
         amounts = []
         labels = []
@@ -681,7 +796,7 @@ def transfer_page():
                 show_notification("Insufficient balance", "error")
             else:
                 # Add debit transaction for sender
-                add_transaction(st.session_state.username, "debit", amount, f"Transfer to {recipient_account}: {description}")
+                add_transaction(st.session_state.username, "debit", amount, f"Transfer to {recipient_account}: {description}", recipient_account)
                 
                 # For demo purposes, we'll just show a success message
                 # In a real app, you would verify the recipient account and add a credit transaction for them
@@ -725,14 +840,13 @@ def emi_calculator_page():
         interest_rate = st.slider("Interest Rate (%)", 1.0, 20.0, 8.5, step=0.1)
         loan_term = st.slider("Loan Term (Years)", 1, 30, 20, step=1)
         
+        # Computed once per set of inputs and cached (see utils/amortization.py)
+        loan = amortization.loan_summary(loan_amount, interest_rate, loan_term * 12)
+        
         if st.button("Calculate EMI"):
-            emi = calculate_emi(loan_amount, interest_rate, loan_term)
-            total_payment = emi * loan_term * 12
-            total_interest = total_payment - loan_amount
-            
-            st.markdown(f'<p class="account-balance">Monthly EMI: ₹{emi:,.2f}</p>', unsafe_allow_html=True)
-            st.markdown(f'<p>Total Payment: ₹{total_payment:,.2f}</p>', unsafe_allow_html=True)
-            st.markdown(f'<p>Total Interest: ₹{total_interest:,.2f}</p>', unsafe_allow_html=True)
+            st.markdown(f'<p class="account-balance">Monthly EMI: ₹{loan["emi"]:,.2f}</p>', unsafe_allow_html=True)
+            st.markdown(f'<p>Total Payment: ₹{loan["total_payment"]:,.2f}</p>', unsafe_allow_html=True)
+            st.markdown(f'<p>Total Interest: ₹{loan["total_interest"]:,.2f}</p>', unsafe_allow_html=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -743,39 +857,14 @@ def emi_calculator_page():
         # Create a pie chart for EMI breakdown
         fig, ax = plt.subplots()
         
-        # Calculate values for the chart
-        emi = calculate_emi(loan_amount, interest_rate, loan_term)
-        total_payment = emi * loan_term * 12
-        total_interest = total_payment - loan_amount
-        
-        ax.pie([loan_amount, total_interest], labels=["Principal", "Interest"], autopct='%1.1f%%', colors=["#1E3A8A", "#6b7280"])
+        ax.pie([loan_amount, loan["total_interest"]], labels=["Principal", "Interest"], autopct='%1.1f%%', colors=["#1E3A8A", "#6b7280"])
         ax.set_title("Loan Breakdown")
         st.pyplot(fig)
         
-        # Create a line chart for amortization
-        principal_remaining = loan_amount
-        interest_paid = 0
-        principal_paid = 0
-        
-        years = list(range(1, loan_term + 1))
-        principal_values = []
-        interest_values = []
-        
-        for year in years:
-            for _ in range(12):  # 12 months in a year
-                interest_for_month = principal_remaining * (interest_rate / (12 * 100))
-                principal_for_month = emi - interest_for_month
-                
-                principal_remaining -= principal_for_month
-                interest_paid += interest_for_month
-                principal_paid += principal_for_month
-            
-            principal_values.append(principal_paid)
-            interest_values.append(interest_paid)
-        
+        # Create a line chart for amortization (cumulative amounts at each year end)
         fig, ax = plt.subplots()
-        ax.plot(years, principal_values, label="Principal Paid")
-        ax.plot(years, interest_values, label="Interest Paid")
+        ax.plot(loan["years"], loan["principal_by_year"], label="Principal Paid")
+        ax.plot(loan["years"], loan["interest_by_year"], label="Interest Paid")
         ax.set_xlabel("Years")
         ax.set_ylabel("Amount (₹)")
         ax.set_title("Amortization Schedule")
@@ -0,0 +1,88 @@
+"""
+Benchmark batch_transfer against a loop of transfer_funds calls
+
+Builds a payroll-style workload: each employer account pays its own staff, so the
+batch splits into one independent group per employer. Each mode runs in its own
+process and data directory and the total balance is checked afterwards.
+
+Run from the repository root:
+    python benchmarks/bench_batch_transfer.py [transfers] [employers]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+USERS = 2000
+START_BALANCE = 1000000
+
+
+def make_items(transfers, employers):
+    rng = random.Random(42)
+    staff = (USERS - employers) // employers
+    items = []
+    for i in range(transfers):
+        sender = i % employers
+        recipient = employers + sender * staff + rng.randrange(staff)
+        items.append({
+            "user_id": f"user{sender}",
+            "from_account_index": 0,
+            "to_account_number": f"NB{recipient:08d}",
+            "amount": rng.randint(1, 100),
+            "description": "bench",
+        })
+    return items
+
+
+def run(args):
+    mode, transfers, employers = args
+    with tempfile.TemporaryDirectory() as data_root:
+        # utils.db resolves its data directory relative to the working directory
+        os.chdir(data_root)
+        from utils import db
+
+        for i in range(USERS):
+            db.save_user_data({
+                "user_id": f"user{i}",
+                "email": f"user{i}@example.com",
+                "accounts": [{"account_number": f"NB{i:08d}", "balance": START_BALANCE}],
+            })
+        items = make_items(transfers, employers)
+
+        start = time.perf_counter()
+        if mode == "batch":
+            results = db.batch_transfer(items)
+        else:
+            results = [
+                db.transfer_funds(item["user_id"], item["from_account_index"], item["to_account_number"],
+                                  item["amount"], item["description"])
+                for item in items
+            ]
+        elapsed = time.perf_counter() - start
+
+        failed = [message for success, message in results if not success]
+        assert not failed, f"{len(failed)} transfers failed, first: {failed[0]}"
+        total = sum(db.load_user_data(f"user{i}")["accounts"][0]["balance"] for i in range(USERS))
+        assert total == USERS * START_BALANCE, f"balance drift: {total - USERS * START_BALANCE}"
+
+        return elapsed
+
+
+def main():
+    transfers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    employers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    print(f"{transfers} transfers over {USERS} users ({employers} employers)")
+    for mode in ("loop", "batch"):
+        with Pool(1) as pool:
+            elapsed = pool.map(run, [(mode, transfers, employers)])[0]
+        print(f"{mode:>6}: {transfers / elapsed:8.0f} transfers/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark portfolio-wide loan analytics on the columnar loan book
+
+Writes a data directory with users * loans_per_user loans, then times reading
+the loans into columns (build_loan_book), the exposure report with and without
+a cached book, and the same outstanding-balance math done loan by loan in Python.
+
+Run from the repository root:
+    python benchmarks/bench_loan_book.py [users] [loans_per_user]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+LOAN_TYPES = ("Home", "Car", "Personal", "Education", "Business")
+STATUSES = ("approved", "approved", "approved", "pending", "rejected")
+
+
+def make_loans(rng, user_id, count):
+    now = datetime.now()
+    loans = []
+    for i in range(count):
+        start = (now - timedelta(days=rng.randrange(3650))).isoformat()
+        loans.append({
+            "loan_id": f"{user_id}-{i}",
+            "type": rng.choice(LOAN_TYPES),
+            "amount": rng.randrange(50000, 5000000, 1000),
+            "interest_rate": rng.choice((7.5, 8.5, 9.0, 10.5, 12.0)),
+            "tenure": rng.choice((12, 36, 60, 120, 240, 360)),
+            "status": rng.choice(STATUSES),
+            "timestamp": start,
+            "updated_at": start,
+        })
+    return loans
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    loans_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as data_root:
+        # utils.db resolves its data directory relative to the working directory
+        os.chdir(data_root)
+        from utils import db, loan_book, amortization
+
+        # Written directly: going through save_user_data would only slow the setup down
+        rng = random.Random(42)
+        for i in range(users):
+            user_id = f"user{i}"
+            with open(os.path.join(db.USERS_DIR, f"{user_id}.json"), 'w') as f:
+                json.dump({"user_id": user_id, "email": f"{user_id}@example.com",
+                           "loans": make_loans(rng, user_id, loans_per_user)}, f)
+
+        start = time.perf_counter()
+        book = loan_book.build_loan_book()
+        build = time.perf_counter() - start
+
+        # First report reads the store into the cached book, the second reuses it
+        loan_book.invalidate_loan_book()
+        start = time.perf_counter()
+        exposure = loan_book.loan_exposure()
+        report = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loan_book.loan_exposure()
+        cached = time.perf_counter() - start
+
+        # Outstanding balance loan by loan, as a Python loop would do it
+        positions = loan_book.loan_positions(book=book)
+        start = time.perf_counter()
+        loop_total = 0.0
+        for amount, rate, tenure, paid, status in zip(book["amount"], book["interest_rate"], book["tenure"],
+                                                      positions["installments_paid"], book["status"]):
+            if status == "approved":
+                loop_total += amortization.outstanding_balance(float(amount), float(rate), float(tenure), float(paid))
+        loop = time.perf_counter() - start
+
+        print(f"{len(book['loan_id']):,} loans")
+        print(f"  build loan book:        {build:7.2f} s")
+        print(f"  exposure report:        {report:7.2f} s (builds the book)")
+        print(f"  exposure report again:  {cached:7.2f} s (book cached)")
+        print(f"  per-loan Python loop:   {loop:7.2f} s (outstanding only)")
+        print(f"  outstanding {exposure['outstanding'].sum():,.0f} (loop {loop_total:,.0f})")
+
+
+if __name__ == "__main__":
+    main()
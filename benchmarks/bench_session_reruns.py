@@ -0,0 +1,89 @@
+"""
+Benchmark the data access of a signed-in rerun with and without the session layer
+
+"reload" is the old main(): load the user document on every rerun.
+"session" uses utils.session_data: check the document version, unpickle a
+fresh copy of the session's document (no file read), queue last_activity and
+write it in batches. Every
+OTHER_WRITE_EVERY reruns another writer saves the user, so the session layer has
+to refetch sometimes. Also reports how many user documents were decoded.
+
+Run from the repository root:
+    python benchmarks/bench_session_reruns.py [reruns]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+OTHER_WRITE_EVERY = 50
+
+
+def make_user(user_id):
+    return {
+        "user_id": user_id,
+        "email": f"{user_id}@example.com",
+        "full_name": "Bench User",
+        "accounts": [{"account_number": f"NB{i:08d}", "balance": 1000.0 * i} for i in range(1, 4)],
+        "loans": [
+            {"loan_id": f"L{i}", "type": "Home", "amount": 500000, "tenure": 240, "status": "approved",
+             "timestamp": datetime.now().isoformat()}
+            for i in range(20)
+        ],
+        "security": {"2fa_enabled": False},
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    reruns = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with tempfile.TemporaryDirectory() as data_root:
+        # utils.db resolves its data directory relative to the working directory
+        os.chdir(data_root)
+        from utils import db, session_data
+
+        db.save_user_data(make_user("bench"))
+        # Write last_activity every few hundred reruns
+        session_data.SESSION_FLUSH_INTERVAL = 0.05
+
+        def other_writer():
+            db.atomic_transaction("bench", lambda user: (True, dict(user, note=time.time()), "ok"))
+
+        def reload_rerun(session):
+            session["user_data"] = db.load_user_data("bench")
+            session["last_activity"] = datetime.now()
+
+        def session_rerun(session):
+            session_data.get_session_user(session, "bench")
+            session_data.set_session_value(session, "last_activity", datetime.now())
+            session_data.flush_session_writes(session, "bench")
+
+        for name, rerun in (("reload", reload_rerun), ("session", session_rerun)):
+            session = {}
+            db.clear_user_cache()
+            timings = []
+            for i in range(reruns):
+                if i % OTHER_WRITE_EVERY == OTHER_WRITE_EVERY - 1:
+                    other_writer()
+                start = time.perf_counter()
+                rerun(session)
+                timings.append(time.perf_counter() - start)
+            stats = db.get_cache_stats()
+            print(f"{name:>8}: p50 {statistics.median(timings) * 1e6:7.1f} us  "
+                  f"p95 {percentile(timings, 95) * 1e6:7.1f} us  "
+                  f"p99 {percentile(timings, 99) * 1e6:7.1f} us  "
+                  f"documents decoded {stats['hits'] + stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
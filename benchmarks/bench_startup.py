@@ -0,0 +1,113 @@
+"""
+Startup import-time benchmark with a regression budget
+
+Imports each entry module in a fresh interpreter with `python -X importtime`
+and reports the cumulative import time (median of several runs) together with
+the heaviest modules it pulled in. Fails if a module exceeds its budget or if
+a library that should be imported lazily (see utils/lazy_imports.py) shows up
+at startup.
+
+main.py is not measured: it imports page modules (pages.dashboard and others)
+that are not in this tree.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py [runs]
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time allowed per entry module (milliseconds)
+STARTUP_BUDGET_MS = {
+    "Home": 1000,
+    "utils.auth": 150,
+    "utils.db": 100,
+}
+
+# Libraries that repo code must only import when a page renders a chart or table
+# (Streamlit itself may still import some of them). -X importtime attributes a
+# module to its first importer only, so this cannot catch an eager numpy or
+# pandas import in Home once streamlit has imported them first: any Streamlit
+# version that does so at import time, and every served session after the first
+# chart or table, since streamlit then imports pandas (and numpy) itself
+LAZY_MODULES = ("pandas", "numpy", "matplotlib", "plotly", "PIL", "pyotp")
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure(module, data_root):
+    """
+    Import module once in a fresh interpreter
+    Returns (cumulative_us, {imported module: cumulative_us}, set of modules imported
+    directly by repo code)
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=data_root, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    imported = {}
+    from_repo = set()
+    # -X importtime prints children before their parent; walk it backwards so
+    # each module comes after the chain of modules that imported it
+    chain = []
+    for line in reversed(result.stderr.splitlines()):
+        match = LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        depth = len(match.group(3)) // 2
+        imported[name] = int(match.group(2))
+        del chain[depth:]
+        if chain and all(parent == module or parent.startswith("utils") for parent in chain):
+            from_repo.add(name)
+        chain.append(name)
+    return imported[module], imported, from_repo
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failures = []
+
+    # Entry scripts create data directories relative to the working directory
+    with tempfile.TemporaryDirectory() as data_root:
+        for module, budget in STARTUP_BUDGET_MS.items():
+            try:
+                samples = [measure(module, data_root) for _ in range(runs)]
+            except RuntimeError as e:
+                failures.append(str(e))
+                continue
+
+            median_ms = statistics.median(total for total, _, _ in samples) / 1000
+            status = "ok" if median_ms <= budget else "OVER BUDGET"
+            print(f"{module:>12}: {median_ms:7.1f} ms (budget {budget} ms) {status}")
+            if median_ms > budget:
+                failures.append(f"{module} took {median_ms:.1f} ms, budget is {budget} ms")
+
+            _, imported, from_repo = samples[-1]
+            heaviest = sorted(
+                ((us, name) for name, us in imported.items() if name != module and "." not in name),
+                reverse=True,
+            )[:5]
+            print("              heaviest: " + ", ".join(f"{name} {us / 1000:.0f} ms" for us, name in heaviest))
+
+            eager = sorted({name.split(".")[0] for name in from_repo} & set(LAZY_MODULES))
+            if eager:
+                failures.append(f"{module} imports {', '.join(eager)} at startup")
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+    print("\nOK: all entry modules within budget")
+
+
+if __name__ == "__main__":
+    main()
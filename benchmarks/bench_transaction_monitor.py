@@ -0,0 +1,88 @@
+"""
+Throughput benchmark for the streaming suspicious-transaction rules
+
+Feeds a stream of transactions over many accounts through
+utils.transaction_monitor: a mix of small, round and large amounts, with most
+transfers going to regular payees. Every check reads and writes the account's
+window state in the shared SQLite store, as the app does. Reports transactions
+per second for evaluation alone and for evaluation plus saving the alerts, and
+fails if either is below the target.
+
+Run from the repository root:
+    python benchmarks/bench_transaction_monitor.py [transactions] [accounts]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Transactions per second the rules must sustain
+TARGET_TPS = 10000
+
+
+def make_stream(rng, count, accounts):
+    start = datetime.now() - timedelta(days=1)
+    step = 60.0 * accounts / count
+    stream = []
+    for i in range(count):
+        account = f"ACC{rng.randrange(accounts):08d}"
+        transaction_type = rng.choice(("credit", "debit", "debit"))
+        # Mostly small odd amounts, some round ones and the occasional large one
+        roll = rng.random()
+        amount = rng.randrange(1, 100000) * 1000 if roll < 0.01 else rng.randrange(1, 50) * 1000 if roll < 0.2 \
+            else round(rng.uniform(10, 5000), 2)
+        # Most transfers go to a few regular payees
+        recipient = None
+        if transaction_type == "debit":
+            recipient = f"{account}-{rng.randrange(5)}" if rng.random() < 0.95 else f"ACC{rng.randrange(accounts * 10):08d}"
+        stream.append((f"user{account}", account, {
+            "transaction_id": str(i),
+            "type": transaction_type,
+            "amount": amount,
+            "timestamp": (start + timedelta(seconds=i * step)).isoformat(),
+        }, recipient))
+    return stream
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    with tempfile.TemporaryDirectory() as data_root:
+        # Alerts and window state are written relative to the working directory
+        os.chdir(data_root)
+        from utils import transaction_monitor
+
+        stream = make_stream(random.Random(42), count, accounts)
+
+        start = time.perf_counter()
+        alerts = 0
+        for user_id, account, transaction, recipient in stream:
+            alerts += len(transaction_monitor.evaluate_transaction(user_id, account, transaction, recipient))
+        evaluate = time.perf_counter() - start
+
+        transaction_monitor.reset_monitor()
+        start = time.perf_counter()
+        for user_id, account, transaction, recipient in stream:
+            transaction_monitor.monitor_transactions(user_id, account, [transaction], recipient)
+        monitor = time.perf_counter() - start
+
+        saved = len(transaction_monitor.read_alerts())
+        ok = True
+        print(f"{count:,} transactions over {accounts:,} accounts, {alerts:,} alerts ({saved:,} saved)")
+        for label, seconds in (("evaluate", evaluate), ("evaluate + save", monitor)):
+            tps = count / seconds
+            status = "ok" if tps >= TARGET_TPS else "BELOW TARGET"
+            ok = ok and tps >= TARGET_TPS
+            print(f"  {label:16s} {tps:10,.0f} tx/s (target {TARGET_TPS:,}) {status}")
+
+        raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
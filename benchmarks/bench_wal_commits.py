@@ -0,0 +1,74 @@
+"""
+Benchmark commits per second with and without the write-ahead log
+
+"direct" is the default path: every commit rewrites the user file and fsyncs the
+ledger append. "wal" appends to data/wal with group commit and writes the user
+files at checkpoints. Each mode runs in its own process and data directory.
+
+Run from the repository root:
+    python benchmarks/bench_wal_commits.py [threads] [commits_per_thread]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+USERS = 64
+
+
+def run(args):
+    mode, threads, commits = args
+    with tempfile.TemporaryDirectory() as data_root:
+        # utils.db resolves its data directory relative to the working directory
+        os.chdir(data_root)
+        from utils import db
+
+        db.WAL_ENABLED = mode == "wal"
+        for i in range(USERS):
+            db.save_user_data({
+                "user_id": f"user{i}",
+                "email": f"user{i}@example.com",
+                "accounts": [{"account_number": f"NB{i:08d}", "balance": 0}],
+            })
+        if db.WAL_ENABLED:
+            db.checkpoint()
+
+        def worker(thread_no):
+            for i in range(commits):
+                user_id = f"user{(thread_no + i * threads) % USERS}"
+                success, message = db.add_transaction(user_id, 0, "credit", 1, "bench")
+                if not success:
+                    raise RuntimeError(message)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+
+        if db.WAL_ENABLED:
+            db.checkpoint()
+        total = sum(db.load_user_data(f"user{i}")["accounts"][0]["balance"] for i in range(USERS))
+        assert total == threads * commits, f"expected {threads * commits}, found {total}"
+
+        return elapsed
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    commits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    total = threads * commits
+
+    print(f"{threads} threads x {commits} commits over {USERS} users")
+    for mode in ("direct", "wal"):
+        with Pool(1) as pool:
+            elapsed = pool.map(run, [(mode, threads, commits)])[0]
+        print(f"{mode:>6}: {total / elapsed:8.0f} commits/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
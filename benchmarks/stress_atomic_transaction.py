@@ -0,0 +1,92 @@
+"""
+Stress test for utils.db.atomic_transaction
+
+Several processes, each with several threads, hammer the same two accounts with
+credits and debits. Without per-user locking some updates are lost and the final
+balances drift from the expected values.
+
+Run from the repository root:
+    python benchmarks/stress_atomic_transaction.py
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+PROCESSES = 4
+THREADS = 4
+OPERATIONS = 50  # per thread
+START_BALANCE = 1000000
+USERS = ("hot", "other")
+
+
+def make_user(user_id, account_number):
+    return {
+        "user_id": user_id,
+        "email": f"{user_id}@example.com",
+        "accounts": [{"account_number": account_number, "balance": START_BALANCE}],
+    }
+
+
+def worker(_):
+    from utils.db import add_transaction
+
+    def run(thread_no):
+        committed = Counter()
+        for i in range(OPERATIONS):
+            # Alternate credit/debit so both directions contend on the same file
+            transaction_type = "credit" if (thread_no + i) % 2 == 0 else "debit"
+            for user_id in USERS:
+                success, _ = add_transaction(user_id, 0, transaction_type, 1, "stress")
+                if success:
+                    committed[user_id] += 1
+        return committed
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return sum(pool.map(run, range(THREADS)), Counter())
+
+
+def main():
+    with tempfile.TemporaryDirectory() as data_root:
+        # utils.db resolves its data directory relative to the working directory
+        os.chdir(data_root)
+        from utils.db import save_user_data, load_user_data
+
+        save_user_data(make_user("hot", "NB00000001"))
+        save_user_data(make_user("other", "NB00000002"))
+
+        start = time.perf_counter()
+        with Pool(PROCESSES) as pool:
+            committed = sum(pool.map(worker, range(PROCESSES)), Counter())
+        elapsed = time.perf_counter() - start
+
+        total_ops = PROCESSES * THREADS * OPERATIONS * len(USERS)
+        failures = total_ops - sum(committed.values())
+        print(f"{total_ops} transactions in {elapsed:.2f}s ({total_ops / elapsed:.0f}/s), {failures} failed")
+
+        drift = False
+        for user_id in USERS:
+            account = load_user_data(user_id, include_transactions=True)["accounts"][0]
+            credits = sum(t["amount"] for t in account["transactions"] if t["type"] == "credit")
+            debits = sum(t["amount"] for t in account["transactions"] if t["type"] == "debit")
+            expected = START_BALANCE + credits - debits
+            recorded = len(account["transactions"])
+            print(f"{user_id}: balance {account['balance']}, expected {expected}, "
+                  f"{recorded} of {committed[user_id]} committed transactions recorded")
+            if account["balance"] != expected or recorded != committed[user_id]:
+                drift = True
+
+        if drift:
+            print("FAIL: balance drift detected")
+            sys.exit(1)
+        print("OK: no balance drift")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,22 +6,18 @@ import base64
 import time
 import uuid
 from datetime import datetime, timedelta
-import pyotp
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
 import re
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import random
 import string
 from streamlit_option_menu import option_menu
+from utils.lazy_imports import lazy_import
 from utils.auth import login_user, register_user, verify_otp, generate_otp, send_otp_email
 from utils.db import save_user_data, load_user_data, get_all_users, atomic_transaction
-from utils.security import hash_password, verify_password, generate_session_id
+from utils.security import hash_password, verify_password
+from utils.activity_log import log_activity
+from utils.assets import get_css, get_logo
+from utils.session_data import get_session_user, set_session_value, flush_session_writes
+from utils.sessions import create_session, validate_session, revoke_session
 from pages.dashboard import show_dashboard
 from pages.transactions import show_transactions, perform_transfer
 from pages.Loans import show_loans, show_emi_calculator
@@ -30,6 +26,14 @@ from pages.Admin import show_admin_panel
 from pages.Help import show_help
 from home import *
 
+# Heavy libraries are imported the first time a page uses them, not on every cold start
+pyotp = lazy_import("pyotp")
+pd = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot")
+px = lazy_import("plotly.express")
+go = lazy_import("plotly.graph_objects")
+Image = lazy_import("PIL.Image")
+
 # Set page configuration
 st.set_page_config(
     page_title="Nuvana Bank",
@@ -38,9 +42,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Load custom CSS
-with open("assets/css/style.css") as f:
-    st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+# Load custom CSS (read once per process, see utils/assets.py)
+st.markdown(get_css(), unsafe_allow_html=True)
 
 # Initialize session state variables
 if 'logged_in' not in st.session_state:
@@ -71,24 +74,38 @@ os.makedirs("data/logs", exist_ok=True)
 
 # Function to check session timeout
 def check_session_timeout():
-    if st.session_state.logged_in and st.session_state.last_activity:
-        current_time = datetime.now()
-        last_activity = st.session_state.last_activity
-        # Session timeout after 30 minutes of inactivity
-        if (current_time - last_activity).total_seconds() > 1800:  # 30 minutes
-            st.session_state.logged_in = False
-            st.session_state.user_id = None
-            st.session_state.user_data = None
-            st.session_state.session_id = None
-            st.session_state.last_activity = None
-            st.warning("Your session has expired. Please log in again.")
-            return True
+    # Sessions live in the server-side store (utils/sessions.py); the ID stays in
+    # st.session_state and is never put in the URL, so a lost connection means logging in again
+    if not st.session_state.logged_in:
+        return False
+    
+    # Expired after 30 minutes of inactivity, or revoked by another worker
+    if not validate_session(st.session_state.session_id):
+        flush_session_writes(st.session_state, st.session_state.user_id, force=True)
+        st.session_state.logged_in = False
+        st.session_state.user_id = None
+        st.session_state.user_data = None
+        st.session_state.session_id = None
+        st.session_state.last_activity = None
+        st.warning("Your session has expired. Please log in again.")
+        return True
     return False
 
+# Function to start a server-side session after login
+def start_session(user_id):
+    st.session_state.session_id = create_session(user_id)
+
 # Function to update last activity
 def update_last_activity():
     if st.session_state.logged_in:
-        st.session_state.last_activity = datetime.now()
+        # Kept in the session; written to the user document in batches
+        set_session_value(st.session_state, "last_activity", datetime.now())
+
+# Function to show the bank logo from the asset cache
+def show_logo(width):
+    logo = get_logo(width)
+    if logo:
+        st.image(logo, width=width)
 
 # Function to show notification
 def show_notification():
@@ -111,32 +128,6 @@ def set_notification(message, type="info"):
     st.session_state.notification = message
     st.session_state.notification_type = type
 
-# Function to log activity
-def log_activity(user_id, activity_type, details=None):
-    timestamp = datetime.now().isoformat()
-    log_entry = {
-        "timestamp": timestamp,
-        "user_id": user_id,
-        "activity_type": activity_type,
-        "details": details
-    }
-    
-    log_file = f"data/logs/activity_log_{datetime.now().strftime('%Y%m%d')}.json"
-    
-    try:
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        
-        logs.append(log_entry)
-        
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=4)
-    except Exception as e:
-        print(f"Error logging activity: {e}")
-
 # Login page
 def show_login_page():
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -145,7 +136,7 @@ def show_login_page():
         st.markdown("<div class='login-container'>", unsafe_allow_html=True)
         
         # Bank logo
-        st.image("assets/images/nuvana_logo.png", width=200)
+        show_logo(200)
         st.markdown("<h1 class='bank-title'>Nuvana Bank</h1>", unsafe_allow_html=True)
         st.markdown("<p class='bank-slogan'>Your Trusted Financial Partner</p>", unsafe_allow_html=True)
         
@@ -183,7 +174,7 @@ def show_login_page():
                             st.session_state.logged_in = True
                             st.session_state.user_id = user_id
                             st.session_state.user_data = user_data
-                            st.session_state.session_id = generate_session_id()
+                            start_session(user_id)
                             st.session_state.last_activity = datetime.now()
                             
                             log_activity(user_id, "login", {"method": "password"})
@@ -205,7 +196,7 @@ def show_otp_verification():
         st.markdown("<div class='login-container'>", unsafe_allow_html=True)
         
         # Bank logo
-        st.image("assets/images/nuvana_logo.png", width=200)
+        show_logo(200)
         st.markdown("<h1 class='bank-title'>Nuvana Bank</h1>", unsafe_allow_html=True)
         
         # OTP form
@@ -229,7 +220,7 @@ def show_otp_verification():
                         st.session_state.logged_in = True
                         st.session_state.user_id = user_id
                         st.session_state.user_data = user_data
-                        st.session_state.session_id = generate_session_id()
+                        start_session(user_id)
                         st.session_state.last_activity = datetime.now()
                         st.session_state.temp_user_data = None
                         st.session_state.otp_secret = None
@@ -262,7 +253,7 @@ def show_registration_page():
         st.markdown("<div class='login-container'>", unsafe_allow_html=True)
         
         # Bank logo
-        st.image("assets/images/nuvana_logo.png", width=200)
+        show_logo(200)
         st.markdown("<h1 class='bank-title'>Nuvana Bank</h1>", unsafe_allow_html=True)
         st.markdown("<p class='bank-slogan'>Your Trusted Financial Partner</p>", unsafe_allow_html=True)
         
@@ -404,18 +395,19 @@ def main():
             show_login_page()
         return
     
-    # Load user data
-    user_data = load_user_data(st.session_state.user_id)
+    # Load user data (reuses the session's copy unless the stored version changed)
+    user_data = get_session_user(st.session_state, st.session_state.user_id)
     if not user_data:
         st.session_state.logged_in = False
         st.error("User data not found. Please log in again.")
         return
     
-    st.session_state.user_data = user_data
+    # Write batched session-only values once SESSION_FLUSH_INTERVAL has passed
+    flush_session_writes(st.session_state, st.session_state.user_id)
     
     # Sidebar navigation
     with st.sidebar:
-        st.image("assets/images/nuvana_logo.png", width=100)
+        show_logo(100)
         st.markdown(f"<h3>Welcome, {user_data['full_name'].split()[0]}</h3>", unsafe_allow_html=True)
         
         # Display account number and balance
@@ -441,15 +433,17 @@ def main():
         # Theme toggle
         theme = st.selectbox("Theme", ["Light", "Dark"], index=0 if st.session_state.theme == "light" else 1)
         if theme == "Light" and st.session_state.theme != "light":
-            st.session_state.theme = "light"
+            set_session_value(st.session_state, "theme", "light")
             st.rerun()
         elif theme == "Dark" and st.session_state.theme != "dark":
-            st.session_state.theme = "dark"
+            set_session_value(st.session_state, "theme", "dark")
             st.rerun()
         
         # Logout button
         if st.button("Logout"):
+            flush_session_writes(st.session_state, st.session_state.user_id, force=True)
             log_activity(st.session_state.user_id, "logout")
+            revoke_session(st.session_state.session_id)
             st.session_state.logged_in = False
             st.session_state.user_id = None
             st.session_state.user_data = None
@@ -460,7 +454,7 @@ def main():
     
     # Main content
     if selected == "Dashboard":
-        show_dashboard(st.session_state.user_data)
+        show_dashboard(user_data)
     elif selected == "Transactions":
         show_transactions(user_data)
     elif selected == "Loans":
@@ -1,11 +1,18 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+import numpy as np
+import math
+from datetime import datetime, timedelta
 import json
 import os
 import json
 from datetime import datetime
-from utils.db import get_all_users
+from utils.db import find_loans, load_user_data, update_loan_status, get_user_id_by_email
+from utils.activity_index import query_activity, count_activity
+from utils.account_summary import SUMMARY_FIELD, SUMMARY_TYPES, daily_covers, summary_by_day
+from utils.loan_book import loan_exposure
+from utils.transaction_snapshot import load_transaction_snapshot, read_descriptions
+from utils.transaction_monitor import read_alerts
 import plotly.express as px
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
@@ -70,7 +77,7 @@ def show_admin_page():
 
 def show_admin_panel_content():
     # Create tabs for different admin functions
-    tab1, tab2, tab3 = st.tabs(["User Management", "Loan Approval", "Transaction Monitoring"])
+    tab1, tab2, tab3, tab4 = st.tabs(["User Management", "Loan Approval", "Transaction Monitoring", "Activity Audit"])
     
     with tab1:
         show_user_management()
@@ -80,6 +87,9 @@ def show_admin_panel_content():
     
     with tab3:
         show_transaction_monitoring()
+    
+    with tab4:
+        show_activity_audit()
 
 def show_user_management():
     st.subheader("User Management")
@@ -212,30 +222,49 @@ def show_user_management():
             else:
                 st.warning(f"Could not find data for user ID: {selected_user_id}")
 
-def show_loan_approval():
-    st.subheader("Loan Approval")
+def show_loan_portfolio():
+    st.subheader("Loan Portfolio")
     
-    # Get all users
-    users = get_all_users()
+    # Computed for all loans at once from the cached columnar loan book
+    exposure = loan_exposure()
     
-    if not users:
-        st.info("No users found")
+    if exposure.empty:
+        st.info("No loans found")
         return
     
-    # Create a list of pending loans
+    st.markdown(
+        f"<p><strong>Loans:</strong> {exposure['loans'].sum():,} &nbsp; "
+        f"<strong>Outstanding:</strong> ₹{exposure['outstanding'].sum():,.2f} &nbsp; "
+        f"<strong>Monthly EMI Due:</strong> ₹{exposure['monthly_emi'].sum():,.2f}</p>",
+        unsafe_allow_html=True
+    )
+    
+    display = exposure.copy()
+    for col in ["principal", "outstanding", "monthly_emi"]:
+        display[col] = display[col].apply(lambda x: f"₹{x:,.2f}")
+    st.dataframe(display, use_container_width=True)
+
+def show_loan_approval():
+    show_loan_portfolio()
+    
+    st.subheader("Loan Approval")
+    
+    # Pending loans come from the loan index; only their applicants are loaded
     pending_loans = []
+    applicants = {}
     
-    for user_id, user_data in users.items():
-        if "loans" in user_data:
-            for loan in user_data["loans"]:
-                if loan.get("status") == "pending":
-                    # Add user information to loan
-                    loan_with_user = loan.copy()
-                    loan_with_user["user_id"] = user_id
-                    loan_with_user["user_name"] = user_data.get("full_name", "")
-                    loan_with_user["user_email"] = user_data.get("email", "")
-                    
-                    pending_loans.append(loan_with_user)
+    for user_id, loan in find_loans(status="pending"):
+        if user_id not in applicants:
+            applicants[user_id] = load_user_data(user_id) or {}
+        user_data = applicants[user_id]
+        
+        # Add user information to loan
+        loan_with_user = loan.copy()
+        loan_with_user["user_id"] = user_id
+        loan_with_user["user_name"] = user_data.get("full_name", "")
+        loan_with_user["user_email"] = user_data.get("email", "")
+        
+        pending_loans.append(loan_with_user)
     
     if not pending_loans:
         st.info("No pending loans found")
@@ -330,190 +359,294 @@ def show_loan_approval():
                     else:
                         st.error(message)
 
+# Function to total the account summaries for the analytics charts
+def summarize_account_activity(start_day, end_day, transaction_type):
+    """
+    Build the chart data from the accounts' running totals instead of the transactions
+    Returns (type_summary, date_summary) DataFrames, or None if an account has no summary yet
+    or the range starts before the daily buckets kept (SUMMARY_DAILY_DAYS)
+    """
+    accounts = load_json_data(ACCOUNTS_FILE)
+    summaries = [account.get(SUMMARY_FIELD) for account in accounts.values()]
+    if any(summary is None for summary in summaries) or not daily_covers(summaries, start_day):
+        return None
+    
+    days = summary_by_day(summaries, start_day, end_day)
+    types = SUMMARY_TYPES if transaction_type == "All" else (transaction_type.lower(),)
+    
+    type_summary = pd.DataFrame(
+        [{"type": t, "amount": sum(bucket[t] for bucket in days.values())} for t in types],
+        columns=["type", "amount"]
+    )
+    date_summary = pd.DataFrame(
+        [{"date_only": day, "type": t, "amount": bucket[t]} for day, bucket in days.items() for t in types],
+        columns=["date_only", "type", "amount"]
+    )
+    return type_summary, date_summary
+
+# Most rows shown in a monitoring table; filters and charts still cover every row
+MONITORING_DISPLAY_ROWS = 1000
+
+# Function to build display rows from the transaction snapshot
+def snapshot_rows_frame(snapshot, rows, user_names, account_numbers):
+    """
+    Build the monitoring table for the given snapshot row numbers
+    Only these rows are formatted and have their descriptions read
+    Returns DataFrame
+    """
+    users = snapshot["user"][rows]
+    types = snapshot["types"][snapshot["type"][rows]]
+    amounts = snapshot["amount"][rows]
+    
+    return pd.DataFrame({
+        "transaction_id": [f"{u}-{seq}" for u, seq in zip(snapshot["users"][users], snapshot["seq"][rows])],
+        "user_name": user_names[users],
+        "account_number": account_numbers[users],
+        "type": types,
+        "amount_formatted": [f"+₹{a:,.2f}" if t == "credit" else f"-₹{a:,.2f}" for a, t in zip(amounts, types)],
+        "description": read_descriptions(snapshot, rows),
+        "date": pd.to_datetime(snapshot["timestamp"][rows]).strftime("%Y-%m-%d %H:%M"),
+    })
+
 def show_transaction_monitoring():
     st.subheader("Transaction Monitoring")
     
-    # Load transaction data directly from JSON file
-    all_transactions_dict = load_json_data(TRANSACTIONS_FILE)
-    users_data = load_json_data(USERS_FILE) # Need user data for names
-
-    if not all_transactions_dict:
-        st.info("No transactions found in transactions.json")
-        return
-
-    processed_transactions = []
-    # Assuming transactions_data structure is {transaction_id: {user_id: ..., account_number: ..., amount: ..., type: ..., timestamp: ..., description: ...}}
-    for tx_id, tx_data in all_transactions_dict.items():
-        tx_copy = {key: value for key, value in enumerate(tx_data)}
-        tx_copy['transaction_id'] = tx_id # Ensure transaction_id is present
-
-        user_id = tx_copy.get('user_id')
-        user_info = users_data.get(user_id, {}) if user_id else {}
-        user_name = user_info.get("full_name", "Unknown User")
-
-        tx_copy['user_name'] = user_name
-        # Ensure essential fields have defaults if missing in JSON
-        tx_copy.setdefault('account_number', 'N/A')
-        tx_copy.setdefault('type', 'N/A')
-        tx_copy.setdefault('amount', 0)
-        tx_copy.setdefault('description', 'N/A')
-        tx_copy.setdefault('timestamp', None) # Handle None timestamp later
-
-        processed_transactions.append(tx_copy)
-
-    if not processed_transactions:
-        st.info("No transactions available to display.")
-        return
-
-    # Create DataFrame for display
-    df = pd.DataFrame(processed_transactions)
-
-    # Post-processing checks for DataFrame (optional but safer)
-    if df.empty:
-        st.info("No processable transactions found.")
-        return
-
-    # Ensure essential columns exist after DataFrame creation, assign defaults if needed
-    for col in ['transaction_id', 'user_name', 'account_number', 'type', 'description']:
-        if col not in df.columns: df[col] = 'N/A'
-    if 'amount' not in df.columns: df['amount'] = 0
-    if 'timestamp' not in df.columns: df['timestamp'] = pd.NaT # Use NaT for missing timestamps
+    # Filter options
+    col1, col2, col3 = st.columns(3)
     
-    # Format the DataFrame
-    if not df.empty:
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df["date"] = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M")
-        df["amount_formatted"] = df.apply(
-            lambda row: f"+₹{row['amount']:,.2f}" if row["type"] == "credit" else f"-₹{row['amount']:,.2f}",
-            axis=1
+    with col1:
+        # Date range filter
+        date_range = st.selectbox(
+            "Date Range",
+            ["All Time", "Today", "Last 7 Days", "Last 30 Days", "Custom"]
         )
         
-        # Sort by timestamp (newest first)
-        df = df.sort_values("timestamp", ascending=False)
-        
-        # Filter options
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            # Date range filter
-            date_range = st.selectbox(
-                "Date Range",
-                ["All Time", "Today", "Last 7 Days", "Last 30 Days", "Custom"]
-            )
-            
-            if date_range == "Custom":
-                start_date = st.date_input("Start Date", datetime.now() - timedelta(days=30))
-                end_date = st.date_input("End Date", datetime.now())
-            else:
-                # Set date range based on selection
-                end_date = datetime.now()
-                if date_range == "Today":
-                    start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                elif date_range == "Last 7 Days":
-                    start_date = end_date - timedelta(days=7)
-                elif date_range == "Last 30 Days":
-                    start_date = end_date - timedelta(days=30)
-                else:  # All Time
-                    start_date = datetime.min
-        
-        with col2:
-            # Transaction type filter
-            transaction_type = st.selectbox(
-                "Transaction Type",
-                ["All", "Credit", "Debit"]
-            )
-        
-        with col3:
-            # Amount filter
-            min_amount = st.number_input("Minimum Amount", min_value=0.0, step=1000.0)
-            max_amount = st.number_input("Maximum Amount", min_value=0.0, step=1000.0)
-        
-        # Apply filters
-        filtered_df = df.copy()
-        
-        # Apply date filter
-        if date_range != "All Time":
-            start_datetime = datetime.combine(start_date, datetime.min.time())
-            end_datetime = datetime.combine(end_date, datetime.max.time())
-            filtered_df = filtered_df[(filtered_df["timestamp"] >= start_datetime) & (filtered_df["timestamp"] <= end_datetime)]
+        if date_range == "Custom":
+            start_date = st.date_input("Start Date", datetime.now() - timedelta(days=30))
+            end_date = st.date_input("End Date", datetime.now())
+        else:
+            # Set date range based on selection
+            end_date = datetime.now()
+            if date_range == "Today":
+                start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            elif date_range == "Last 7 Days":
+                start_date = end_date - timedelta(days=7)
+            elif date_range == "Last 30 Days":
+                start_date = end_date - timedelta(days=30)
+            else:  # All Time
+                start_date = datetime.min
+    
+    with col2:
+        # Transaction type filter
+        transaction_type = st.selectbox(
+            "Transaction Type",
+            ["All", "Credit", "Debit"]
+        )
+    
+    with col3:
+        # Amount filter
+        min_amount = st.number_input("Minimum Amount", min_value=0.0, step=1000.0)
+        max_amount = st.number_input("Maximum Amount", min_value=0.0, step=1000.0)
+    
+    # Typed columns from the maintained snapshot; only the day partitions in the
+    # date range are opened, and a rerun only reads rows appended since the last one
+    if date_range == "All Time":
+        snapshot = load_transaction_snapshot()
+    else:
+        start_datetime = datetime.combine(start_date, datetime.min.time())
+        end_datetime = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        snapshot = load_transaction_snapshot(start_datetime, end_datetime)
+    
+    if snapshot["rows"] == 0:
+        st.info("No transactions found matching the filters")
+        return
+    
+    # Names and account numbers are looked up once per user and applied to all rows by user code
+    users_data = load_json_data(USERS_FILE)
+    accounts_data = load_json_data(ACCOUNTS_FILE)
+    user_names = np.array([users_data.get(u, {}).get("full_name", "Unknown User") for u in snapshot["users"]], dtype=object)
+    account_numbers = np.array([accounts_data.get(u, {}).get("account_number", "N/A") for u in snapshot["users"]], dtype=object)
+    
+    timestamps = snapshot["timestamp"]
+    amounts = snapshot["amount"]
+    
+    # Apply the other filters as one mask over the columns
+    mask = np.ones(snapshot["rows"], dtype=bool)
+    
+    if transaction_type != "All":
+        type_codes = np.flatnonzero(snapshot["types"] == transaction_type.lower())
+        mask &= np.isin(snapshot["type"], type_codes)
+    
+    if min_amount > 0:
+        mask &= amounts >= min_amount
+    
+    if max_amount > 0:
+        mask &= amounts <= max_amount
+    
+    # Matching rows, newest first
+    rows = np.flatnonzero(mask)
+    rows = rows[np.argsort(timestamps[rows], kind="stable")[::-1]]
+    
+    # Display transactions
+    if len(rows) == 0:
+        st.info("No transactions found matching the filters")
+        return
+    
+    # Display transaction count
+    st.markdown(f"<p>Showing {min(len(rows), MONITORING_DISPLAY_ROWS):,} of {len(rows):,} transactions</p>", unsafe_allow_html=True)
+    
+    # Display transactions in a table
+    st.dataframe(snapshot_rows_frame(snapshot, rows[:MONITORING_DISPLAY_ROWS], user_names, account_numbers))
+    
+    # Transaction analytics
+    st.subheader("Transaction Analytics")
+    
+    # Without amount filters the charts come from the accounts' running totals
+    summaries = None
+    if min_amount <= 0 and max_amount <= 0:
+        if date_range == "All Time":
+            start_day = end_day = None
+        else:
+            start_day = start_date.strftime("%Y-%m-%d")
+            end_day = end_date.strftime("%Y-%m-%d")
+        summaries = summarize_account_activity(start_day, end_day, transaction_type)
+    
+    if summaries is not None:
+        type_summary, date_summary = summaries
+    else:
+        # Group the matching rows by date and type
+        filtered_df = pd.DataFrame({
+            "type": snapshot["types"][snapshot["type"][rows]],
+            "date_only": timestamps[rows].astype("datetime64[D]"),
+            "amount": amounts[rows],
+        })
         
-        # Apply transaction type filter
-        if transaction_type != "All":
-            filtered_df = filtered_df[filtered_df["type"].str.lower() == transaction_type.lower()]
+        # Create summary by type
+        type_summary = filtered_df.groupby("type")["amount"].sum().reset_index()
         
-        # Apply amount filter
-        if min_amount > 0:
-            filtered_df = filtered_df[filtered_df["amount"] >= min_amount]
+        # Create summary by date
+        date_summary = filtered_df.groupby(["date_only", "type"])["amount"].sum().reset_index()
+    
+    # Create two columns for charts
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Pie chart for credit vs debit
+        fig = px.pie(
+            type_summary, 
+            values="amount", 
+            names="type",
+            title="Credit vs Debit",
+            color="type",
+            color_discrete_map={"credit": "#4CAF50", "debit": "#F44336"}
+        )
+        fig.update_traces(textposition='inside', textinfo='percent+label')
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        # Line chart for transaction history
+        fig = px.line(
+            date_summary,
+            x="date_only",
+            y="amount",
+            color="type",
+            title="Transaction History",
+            color_discrete_map={"credit": "#4CAF50", "debit": "#F44336"}
+        )
+        fig.update_layout(xaxis_title="Date", yaxis_title="Amount (₹)")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    # Suspicious activity flagged by the streaming rules as transactions were recorded
+    st.subheader("Suspicious Transactions")
+    
+    if date_range == "All Time":
+        alerts = read_alerts()
+    else:
+        alerts = read_alerts(start_datetime, end_datetime)
+    if transaction_type != "All":
+        alerts = [alert for alert in alerts if alert.get("type") == transaction_type.lower()]
+    
+    if not alerts:
+        st.info("No suspicious transactions found")
+    else:
+        st.warning(f"Found {len(alerts)} alerts")
         
-        if max_amount > 0:
-            filtered_df = filtered_df[filtered_df["amount"] <= max_amount]
+        alerts_df = pd.DataFrame(alerts[:MONITORING_DISPLAY_ROWS])
+        alerts_df["user_name"] = [users_data.get(u, {}).get("full_name", u) for u in alerts_df["user_id"]]
+        alerts_df["date"] = pd.to_datetime(alerts_df["timestamp"], format="ISO8601").dt.strftime("%Y-%m-%d %H:%M")
         
-        # Display transactions
-        if filtered_df.empty:
-            st.info("No transactions found matching the filters")
-        else:
-            # Display transaction count
-            st.markdown(f"<p>Showing {len(filtered_df)} transactions</p>", unsafe_allow_html=True)
-            
-            # Display transactions in a table
-            st.dataframe(filtered_df[["transaction_id", "user_name", "account_number", "type", "amount_formatted", "description", "date"]])
-            
-            # Transaction analytics
-            st.subheader("Transaction Analytics")
-            
-            # Create charts for transaction analysis
-            if not filtered_df.empty:
-                # Group by date and type
-                filtered_df["date_only"] = filtered_df["timestamp"].dt.date
-                
-                # Create summary by type
-                type_summary = filtered_df.groupby("type")["amount"].sum().reset_index()
-                
-                # Create summary by date
-                date_summary = filtered_df.groupby(["date_only", "type"])["amount"].sum().reset_index()
-                
-                # Create two columns for charts
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Pie chart for credit vs debit
-                    fig = px.pie(
-                        type_summary, 
-                        values="amount", 
-                        names="type",
-                        title="Credit vs Debit",
-                        color="type",
-                        color_discrete_map={"credit": "#4CAF50", "debit": "#F44336"}
-                    )
-                    fig.update_traces(textposition='inside', textinfo='percent+label')
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                with col2:
-                    # Line chart for transaction history
-                    fig = px.line(
-                        date_summary,
-                        x="date_only",
-                        y="amount",
-                        color="type",
-                        title="Transaction History",
-                        color_discrete_map={"credit": "#4CAF50", "debit": "#F44336"}
-                    )
-                    fig.update_layout(xaxis_title="Date", yaxis_title="Amount (₹)")
-                    st.plotly_chart(fig, use_container_width=True)
-            
-            # Flag suspicious transactions
-            st.subheader("Suspicious Transactions")
-            
-            # Find large transactions (over ₹50,000)
-            large_transactions = filtered_df[filtered_df["amount"] > 50000]
-            
-            if large_transactions.empty:
-                st.info("No suspicious transactions found")
-            else:
-                st.warning(f"Found {len(large_transactions)} potentially suspicious transactions (over ₹50,000)")
-                
-                # Display suspicious transactions
-                st.dataframe(large_transactions[["transaction_id", "user_name", "account_number", "type", "amount_formatted", "description", "date"]])
+        # Alert counts per rule, then the newest alerts
+        st.dataframe(pd.Series([alert["rule"] for alert in alerts]).value_counts().rename_axis("rule").reset_index(name="alerts"))
+        st.dataframe(alerts_df[["date", "rule", "user_name", "account_number", "type", "amount", "detail"]])
+
+def show_activity_audit():
+    st.subheader("Activity Audit")
+    
+    # Filters
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        user_filter = st.text_input("User ID or Email", key="audit_user").strip()
+    
+    with col2:
+        activity_type = st.selectbox("Activity Type", ["All", "login", "logout", "registration"], key="audit_type")
+    
+    with col3:
+        today = datetime.now().date()
+        date_range = st.date_input("Date Range", (today - timedelta(days=90), today), key="audit_dates")
+    
+    page_size = st.selectbox("Rows per page", [25, 50, 100], index=1, key="audit_page_size")
+    
+    # Wait until both ends of the range are picked
+    if not isinstance(date_range, (list, tuple)) or len(date_range) != 2:
+        st.info("Select a start and end date")
+        return
+    
+    user_id = user_filter or None
+    if user_filter and "@" in user_filter:
+        user_id = get_user_id_by_email(user_filter)
+        if not user_id:
+            st.warning(f"No user found with email {user_filter}")
+            return
+    
+    filters = {
+        "user_id": user_id,
+        "activity_type": None if activity_type == "All" else activity_type,
+        "start": date_range[0].isoformat(),
+        "end": f"{date_range[1].isoformat()}T23:59:59.999999",
+    }
+    
+    # Cursors of the pages visited so far; start over when the filters change
+    if st.session_state.get("audit_filters") != (filters, page_size):
+        st.session_state.audit_filters = (filters, page_size)
+        st.session_state.audit_cursors = [None]
+    cursors = st.session_state.audit_cursors
+    
+    entries, next_cursor = query_activity(limit=page_size, cursor=cursors[-1], **filters)
+    total = count_activity(**filters)
+    
+    st.caption(f"{total:,} matching events - page {len(cursors)} of {max(1, math.ceil(total / page_size))}")
+    
+    if not entries:
+        st.info("No activity found")
+    else:
+        df = pd.DataFrame(entries)
+        df["timestamp"] = pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+        df["details"] = df["details"].apply(lambda x: json.dumps(x) if x else "")
+        st.dataframe(df[["timestamp", "user_id", "activity_type", "details"]], use_container_width=True)
+    
+    # Pagination
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Previous Page", disabled=len(cursors) == 1, key="audit_prev"):
+            cursors.pop()
+            st.rerun()
+    
+    with col2:
+        if st.button("Next Page", disabled=next_cursor is None, key="audit_next"):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # Call the main function to display the page based on login status
 show_admin_page()
@@ -0,0 +1,174 @@
+"""
+Running totals per account
+
+Each account keeps a "summary" next to its balance: credit and debit totals and
+counts, plus the same per day (YYYY-MM-DD) and per month (YYYY-MM). The write
+paths update it with every transaction they record, so pages read totals and
+chart buckets without going through the history. Daily buckets are only kept
+for the last SUMMARY_DAILY_DAYS days (older days are still in the monthly
+buckets and the totals); "daily_from" records the first day still covered. If a summary ever drifts from
+the history (e.g. a file edited by hand) it can be rebuilt:
+
+    python -m utils.account_summary
+
+rebuilds the accounts of the user store (data/users) and of the flat store used
+by Home.py (data/accounts.json and data/transactions.json).
+"""
+import os
+import json
+import argparse
+from datetime import date, timedelta
+
+# Key of the summary in an account record
+SUMMARY_FIELD = "summary"
+
+# Transaction types that are totalled
+SUMMARY_TYPES = ("credit", "debit")
+
+# Days of daily buckets kept in a summary (the monthly buckets keep everything)
+SUMMARY_DAILY_DAYS = 90
+
+# Flat store used by Home.py and the admin page
+DATA_DIR = "data"
+ACCOUNTS_FILE = os.path.join(DATA_DIR, "accounts.json")
+TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transactions.json")
+
+# Function to create an empty summary
+def new_summary():
+    summary = {"daily": {}, "monthly": {}}
+    for transaction_type in SUMMARY_TYPES:
+        summary[f"{transaction_type}_total"] = 0
+        summary[f"{transaction_type}_count"] = 0
+    return summary
+
+# Function to add transactions to a summary
+def apply_transactions(summary, transactions):
+    """
+    Add transaction records to a summary in place
+    Records of other types are ignored
+    Returns the summary
+    """
+    new_day = False
+    for transaction in transactions:
+        transaction_type = transaction.get("type")
+        if transaction_type not in SUMMARY_TYPES:
+            continue
+
+        amount = transaction.get("amount", 0)
+        summary[f"{transaction_type}_total"] += amount
+        summary[f"{transaction_type}_count"] += 1
+
+        timestamp = transaction.get("timestamp") or ""
+        for buckets, key in ((summary["daily"], timestamp[:10]), (summary["monthly"], timestamp[:7])):
+            if not key:
+                continue
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {"credit": 0, "debit": 0, "count": 0}
+                new_day = new_day or buckets is summary["daily"]
+            bucket[transaction_type] += amount
+            bucket["count"] += 1
+
+    if new_day:
+        prune_daily(summary)
+    return summary
+
+# Function to drop daily buckets older than the retention
+def prune_daily(summary, today=None):
+    """
+    Remove daily buckets older than SUMMARY_DAILY_DAYS and record the first day kept
+    """
+    cutoff = ((today or date.today()) - timedelta(days=SUMMARY_DAILY_DAYS - 1)).isoformat()
+    daily = summary["daily"]
+    old_days = [day for day in daily if day < cutoff]
+    for day in old_days:
+        del daily[day]
+    if old_days:
+        summary["daily_from"] = max(summary.get("daily_from", ""), cutoff)
+
+# Function to build a summary from a transaction history
+def summarize(transactions):
+    return apply_transactions(new_summary(), transactions)
+
+# Function to update an account's summary
+def update_account_summary(account, transactions, history=None):
+    """
+    Add new transactions to an account's summary
+    An account without a summary first gets one built from history (a list, or a
+    function returning it, of the transactions recorded before these)
+    """
+    summary = account.get(SUMMARY_FIELD)
+    if summary is None:
+        if callable(history):
+            history = history()
+        summary = account[SUMMARY_FIELD] = summarize(history or [])
+    apply_transactions(summary, transactions)
+
+# Function to check whether daily buckets cover a date range
+def daily_covers(summaries, start_day=None):
+    """
+    Check that no summary has dropped daily buckets on or after start_day (None is the first day)
+    Returns True if summary_by_day is complete from start_day on
+    """
+    for summary in summaries:
+        daily_from = (summary or {}).get("daily_from")
+        if daily_from and (start_day is None or start_day < daily_from):
+            return False
+    return True
+
+# Function to total summary buckets over a date range
+def summary_by_day(summaries, start_day=None, end_day=None):
+    """
+    Merge the daily buckets of several summaries between two YYYY-MM-DD days (inclusive)
+    Returns dictionary of day -> {"credit", "debit", "count"}, sorted by day
+    """
+    days = {}
+    for summary in summaries:
+        for day, bucket in (summary or {}).get("daily", {}).items():
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            total = days.get(day)
+            if total is None:
+                total = days[day] = {"credit": 0, "debit": 0, "count": 0}
+            for key in total:
+                total[key] += bucket.get(key, 0)
+    return dict(sorted(days.items()))
+
+# Function to rebuild the summaries of the flat store
+def rebuild_flat_summaries(accounts_file=ACCOUNTS_FILE, transactions_file=TRANSACTIONS_FILE):
+    """
+    Recompute the summary of every account in accounts.json from transactions.json
+    Returns (success, message) tuple
+    """
+    try:
+        with open(accounts_file, 'r') as f:
+            accounts = json.load(f)
+        with open(transactions_file, 'r') as f:
+            transactions = json.load(f)
+    except FileNotFoundError:
+        return True, "No flat store to rebuild"
+    except json.JSONDecodeError as e:
+        return False, f"Error reading flat store: {e}"
+
+    for username, account in accounts.items():
+        account[SUMMARY_FIELD] = summarize(transactions.get(username, []))
+
+    with open(accounts_file, 'w') as f:
+        json.dump(accounts, f, indent=4)
+    return True, f"Rebuilt summaries of {len(accounts)} accounts in {accounts_file}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the per-account running totals from the transaction history")
+    parser.parse_args()
+
+    # Imported here: utils.db uses this module for its incremental updates
+    from utils.db import rebuild_account_summaries
+
+    ok = True
+    for success, message in (rebuild_account_summaries(), rebuild_flat_summaries()):
+        print(message)
+        ok = ok and success
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
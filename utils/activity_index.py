@@ -0,0 +1,256 @@
+"""
+Queryable index over the activity logs in data/logs
+
+Every entry written by utils.activity_log is also added to a SQLite database,
+ordered by (user_id, activity_type, timestamp), so "all logins for user X in the
+last 90 days" is an index range scan instead of a pass over every daily file.
+A per-day count table (time buckets, with a user_id of "" holding the totals
+across all users) answers totals for pagination without counting individual
+events.
+
+The log files remain the source of truth: if the database is missing it is
+rebuilt from them on first use, and rebuild_activity_index() does the same on
+demand (run it while nothing is logging).
+"""
+import os
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+from utils import activity_log
+
+# Index location
+ACTIVITY_INDEX_PATH = os.path.join(activity_log.LOG_DIR, "activity_index.db")
+
+# How long a writer waits for the database lock (seconds)
+ACTIVITY_INDEX_BUSY_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    user_id TEXT,
+    activity_type TEXT,
+    timestamp TEXT NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id, activity_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_type ON events(activity_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events(timestamp);
+
+CREATE TABLE IF NOT EXISTS buckets (
+    user_id TEXT NOT NULL,
+    activity_type TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, activity_type, day)
+) WITHOUT ROWID;
+"""
+
+# One connection per thread
+_local = threading.local()
+
+# Function to get the connection for the current thread
+def _connect():
+    """
+    Open the index, building it from the log files if it does not exist yet
+    Returns (connection, created) where created is True if it was just built
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == ACTIVITY_INDEX_PATH:
+        return conn, False
+
+    created = not os.path.exists(ACTIVITY_INDEX_PATH)
+    conn = sqlite3.connect(ACTIVITY_INDEX_PATH, timeout=ACTIVITY_INDEX_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+
+    _local.conn = conn
+    _local.path = ACTIVITY_INDEX_PATH
+
+    if created:
+        _load_files(conn)
+    return conn, created
+
+# Function to insert entries into the index
+def _insert(conn, entries):
+    rows = []
+    counts = {}
+    for entry in entries:
+        timestamp = entry.get("timestamp")
+        if not timestamp:
+            continue
+        user_id = entry.get("user_id")
+        activity_type = entry.get("activity_type")
+        details = entry.get("details")
+        rows.append((user_id, activity_type, timestamp, json.dumps(details) if details is not None else None))
+
+        for key in ((str(user_id), str(activity_type), timestamp[:10]), ("", str(activity_type), timestamp[:10])):
+            counts[key] = counts.get(key, 0) + 1
+
+    conn.executemany(
+        "INSERT INTO events (user_id, activity_type, timestamp, details) VALUES (?, ?, ?, ?)", rows
+    )
+    conn.executemany(
+        "INSERT INTO buckets (user_id, activity_type, day, count) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, activity_type, day) DO UPDATE SET count = count + excluded.count",
+        [key + (count,) for key, count in counts.items()],
+    )
+
+# Function to index every log file
+def _load_files(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM events")
+        conn.execute("DELETE FROM buckets")
+        batch = []
+        for entry in activity_log.read_log_files():
+            batch.append(entry)
+            if len(batch) >= 10000:
+                _insert(conn, batch)
+                batch = []
+        _insert(conn, batch)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+# Function to add newly logged entries
+def add_entries(entries):
+    """
+    Add entries that were just appended to the log files
+    Called by the activity log flusher after each write
+    """
+    conn, created = _connect()
+    if created:
+        # The build read the log files, which already contain these entries
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _insert(conn, entries)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+# Function to rebuild the index
+def rebuild_activity_index():
+    """
+    Rebuild the activity index from the log files
+    Returns (success, message) tuple
+    """
+    try:
+        conn, created = _connect()
+        if not created:
+            _load_files(conn)
+        count = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        return True, f"Indexed {count} activity entries"
+    except Exception as e:
+        print(f"Error rebuilding activity index: {e}")
+        return False, f"Error rebuilding activity index: {str(e)}"
+
+# Function to turn a date bound into an ISO timestamp string
+def _bound(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+# Function to build the WHERE clause shared by the queries
+def _filters(user_id, activity_type, start, end):
+    conditions = []
+    params = []
+    for column, operator, value in (("user_id", "=", user_id), ("activity_type", "=", activity_type),
+                                    ("timestamp", ">=", start), ("timestamp", "<=", end)):
+        if value is not None:
+            conditions.append(f"{column} {operator} ?")
+            params.append(value)
+    return conditions, params
+
+# Function to query the activity index
+def query_activity(user_id=None, activity_type=None, start=None, end=None, limit=50, cursor=None):
+    """
+    Get one page of activity entries, newest first
+    start and end (datetime or ISO string, inclusive) bound the timestamp
+    cursor is the value returned with the previous page
+    Returns (entries, next_cursor) tuple; next_cursor is None on the last page
+    """
+    start, end = _bound(start), _bound(end)
+    conditions, params = _filters(user_id, activity_type, start, end)
+    if cursor is not None:
+        conditions.append("(timestamp < ? OR (timestamp = ? AND rowid < ?))")
+        params.extend([cursor[0], cursor[0], cursor[1]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn, _ = _connect()
+    rows = conn.execute(
+        f"SELECT rowid, user_id, activity_type, timestamp, details FROM events {where} "
+        f"ORDER BY timestamp DESC, rowid DESC LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+
+    entries = [
+        {
+            "timestamp": timestamp,
+            "user_id": row_user_id,
+            "activity_type": row_type,
+            "details": json.loads(details) if details is not None else None,
+        }
+        for _, row_user_id, row_type, timestamp, details in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = [last[3], last[0]]
+    return entries, next_cursor
+
+# Function to shift an ISO date by some days
+def _shift_day(day, days):
+    return (date.fromisoformat(day) + timedelta(days=days)).isoformat()
+
+# Function to count events one by one
+def _count_events(conn, user_id, activity_type, low, high, high_inclusive):
+    conditions, params = _filters(user_id, activity_type, low, None)
+    conditions.append("timestamp <= ?" if high_inclusive else "timestamp < ?")
+    params.append(high)
+    return conn.execute(f"SELECT COUNT(*) FROM events WHERE {' AND '.join(conditions)}", params).fetchone()[0]
+
+# Function to count activity entries
+def count_activity(user_id=None, activity_type=None, start=None, end=None):
+    """
+    Count activity entries matching the filters
+    Whole days inside the range are summed from the per-day buckets; only the
+    partial days at either end are counted event by event
+    """
+    start, end = _bound(start), _bound(end)
+    conn, _ = _connect()
+
+    # Days fully covered by [start, end]
+    first_day = None
+    if start is not None:
+        first_day = start[:10] if start[10:] in ("", "T00:00:00", "T00:00:00.000000") else _shift_day(start[:10], 1)
+    last_day = None
+    if end is not None:
+        last_day = end[:10] if end[10:] >= "T23:59:59.999999" else _shift_day(end[:10], -1)
+
+    if first_day and last_day and first_day > last_day:
+        return _count_events(conn, user_id, activity_type, start, end, True)
+
+    # Bucket rows with user_id "" hold the totals across all users
+    conditions, params = _filters(user_id if user_id is not None else "", activity_type, None, None)
+    if first_day:
+        conditions.append("day >= ?")
+        params.append(first_day)
+    if last_day:
+        conditions.append("day <= ?")
+        params.append(last_day)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    total = conn.execute(f"SELECT COALESCE(SUM(count), 0) FROM buckets {where}", params).fetchone()[0]
+
+    # Partial days at either end
+    if start is not None and start < first_day:
+        total += _count_events(conn, user_id, activity_type, start, first_day, False)
+    if end is not None and end >= _shift_day(last_day, 1):
+        total += _count_events(conn, user_id, activity_type, _shift_day(last_day, 1), end, True)
+
+    return total
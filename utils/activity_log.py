@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import glob
+import gzip
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+# Base directory for activity logs
+DATA_DIR = "data"
+LOG_DIR = os.path.join(DATA_DIR, "logs")
+
+# Entries waiting for the flusher; log_activity waits up to ACTIVITY_QUEUE_TIMEOUT
+# seconds for room and then drops the entry
+ACTIVITY_QUEUE_SIZE = 10000
+ACTIVITY_QUEUE_TIMEOUT = 1.0
+
+# How often the flusher writes queued entries (seconds)
+ACTIVITY_FLUSH_INTERVAL = 1.0
+
+# Start a new file once the current one reaches this size (bytes); files also
+# roll over every day because the date is part of the name
+ACTIVITY_MAX_BYTES = 16 * 1024 * 1024
+
+# Gzip files once they have been rotated out
+ACTIVITY_COMPRESS = True
+
+# Add written entries to the query index in utils/activity_index.py
+ACTIVITY_INDEX_ENABLED = True
+
+# Ensure directories exist
+os.makedirs(LOG_DIR, exist_ok=True)
+
+# Day file: activity-YYYYMMDD.jsonl; rotated parts: activity-YYYYMMDD-<time>.jsonl[.gz]
+_FILE_PATTERN = re.compile(r"^activity-(\d{8})(-[0-9a-f-]+)?\.jsonl(\.gz)?$")
+# Files written by the old logger: one JSON array per day
+_LEGACY_PATTERN = re.compile(r"^activity_log_(\d{8})\.json$")
+
+_queue = queue.Queue(maxsize=ACTIVITY_QUEUE_SIZE)
+_write_lock = threading.Lock()
+_flusher_lock = threading.Lock()
+_flusher = None
+_stats = {"written": 0, "dropped": 0}
+
+# Function to get the file a day's entries are appended to
+def _day_path(day):
+    return os.path.join(LOG_DIR, f"activity-{day}.jsonl")
+
+# Function to start the background flusher once per process
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="activity-log-flusher", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+# Function to log activity
+def log_activity(user_id, activity_type, details=None):
+    """
+    Queue an activity entry; the background flusher appends it to the day's log
+    Returns True if the entry was queued, False if the queue stayed full
+    """
+    log_entry = {
+        "timestamp": datetime.now().isoformat(),
+        "user_id": user_id,
+        "activity_type": activity_type,
+        "details": details
+    }
+
+    _ensure_flusher()
+    try:
+        _queue.put(log_entry, timeout=ACTIVITY_QUEUE_TIMEOUT)
+        return True
+    except queue.Full:
+        _stats["dropped"] += 1
+        print(f"Error logging activity: queue full, dropped {activity_type} for {user_id}")
+        return False
+
+# Function to take everything currently queued
+def _drain(first=None):
+    entries = [] if first is None else [first]
+    while True:
+        try:
+            entries.append(_queue.get_nowait())
+        except queue.Empty:
+            return entries
+
+# Function to append entries to the log files
+def _write_entries(entries):
+    """
+    Append entries to their day files, one write per file, rotating full files
+    """
+    by_day = {}
+    for entry in entries:
+        day = entry["timestamp"][:10].replace("-", "")
+        by_day.setdefault(day, []).append(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    rotated = []
+    with _write_lock:
+        for day, lines in by_day.items():
+            path = _day_path(day)
+            data = "".join(lines).encode()
+
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            _stats["written"] += len(lines)
+
+            if size >= ACTIVITY_MAX_BYTES:
+                rotated_path = os.path.join(LOG_DIR, f"activity-{day}-{datetime.now().strftime('%H%M%S%f')}-{os.getpid():x}.jsonl")
+                try:
+                    os.rename(path, rotated_path)
+                    rotated.append(rotated_path)
+                except FileNotFoundError:
+                    # Another process rotated it first
+                    pass
+
+    if ACTIVITY_COMPRESS:
+        for path in rotated:
+            _compress(path)
+
+    if ACTIVITY_INDEX_ENABLED:
+        # Imported here because activity_index reads the logs through this module
+        from utils import activity_index
+        try:
+            activity_index.add_entries(entries)
+        except Exception as e:
+            print(f"Error indexing activity entries: {e}")
+
+# Function to gzip a rotated log file
+def _compress(path):
+    try:
+        with open(path, 'rb') as src, gzip.open(path + ".gz.tmp", 'wb') as dst:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        os.replace(path + ".gz.tmp", path + ".gz")
+        os.unlink(path)
+    except Exception as e:
+        print(f"Error compressing activity log {path}: {e}")
+
+# Background flusher
+def _flush_loop():
+    while True:
+        try:
+            first = _queue.get(timeout=ACTIVITY_FLUSH_INTERVAL)
+        except queue.Empty:
+            continue
+        try:
+            _write_entries(_drain(first))
+        except Exception as e:
+            print(f"Error writing activity log: {e}")
+
+# Function to write out everything queued so far
+def flush():
+    """
+    Write queued entries now instead of waiting for the flusher
+    """
+    entries = _drain()
+    if entries:
+        try:
+            _write_entries(entries)
+        except Exception as e:
+            print(f"Error writing activity log: {e}")
+
+# Function to get logger counters
+def get_activity_stats():
+    """
+    Get counters for the activity logger
+    Returns dictionary with written, dropped and queued entry counts
+    """
+    return dict(_stats, queued=_queue.qsize())
+
+# Function to turn a date bound into an ISO timestamp string
+def _bound(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+# Function to list the log files covering a date range
+def _log_files(start, end):
+    start_day = start[:10].replace("-", "") if start else None
+    end_day = end[:10].replace("-", "") if end else None
+
+    files = []
+    for path in glob.glob(os.path.join(LOG_DIR, "activity*")):
+        name = os.path.basename(path)
+        match = _FILE_PATTERN.match(name) or _LEGACY_PATTERN.match(name)
+        if not match:
+            continue
+        day = match.group(1)
+        if (start_day and day < start_day) or (end_day and day > end_day):
+            continue
+        # Legacy file first, then rotated parts in time order, then the live day file
+        order = 0 if name.startswith("activity_log_") else 1 if match.group(2) else 2
+        files.append((day, order, name, path))
+
+    return [path for _, _, _, path in sorted(files)]
+
+# Function to read the entries of one log file
+def _read_file(path):
+    if path.endswith(".json"):
+        try:
+            with open(path, 'r') as f:
+                yield from json.load(f)
+        except Exception as e:
+            print(f"Error reading activity log {path}: {e}")
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, 'rt') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Error reading activity log {path}: {e}")
+    except FileNotFoundError:
+        # Rotated or compressed while we were listing
+        return
+
+# Function to read activity entries
+def read_activity(start=None, end=None, user_id=None, activity_type=None):
+    """
+    Stream activity entries, oldest first within each day
+    start and end (datetime or ISO string, inclusive) bound the timestamp;
+    only the files for days in that range are opened
+    """
+    flush()
+    return read_log_files(start, end, user_id, activity_type)
+
+# Function to read activity entries already written to disk
+def read_log_files(start=None, end=None, user_id=None, activity_type=None):
+    """
+    Same as read_activity, but entries still queued for the flusher are not included
+    """
+    start, end = _bound(start), _bound(end)
+
+    for path in _log_files(start, end):
+        for entry in _read_file(path):
+            timestamp = entry.get("timestamp", "")
+            if start and timestamp < start:
+                continue
+            if end and timestamp > end:
+                continue
+            if user_id is not None and entry.get("user_id") != user_id:
+                continue
+            if activity_type is not None and entry.get("activity_type") != activity_type:
+                continue
+            yield entry
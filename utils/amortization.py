@@ -0,0 +1,218 @@
+"""
+Loan amortization math (EMI, schedules, scenarios) on NumPy arrays
+
+Rates are annual percentages and tenures are in months, like the loan records
+(interest_rate, tenure). The functions accept scalars or arrays, so the same
+code serves the EMI calculator and the portfolio-wide loan analytics.
+
+Within a stretch of months with a constant rate and EMI the balance has a
+closed form, B_k = B (1 + r)^k - EMI ((1 + r)^k - 1) / r, so schedules and
+cumulative principal/interest are computed as whole arrays without a monthly
+loop. loan_summary and amortization_schedule keep their results in an LRU
+cache keyed on the inputs; the arrays they return are read-only.
+"""
+import functools
+
+from utils.lazy_imports import lazy_import
+
+# NumPy is imported the first time a loan is computed
+np = lazy_import("numpy")
+
+# Number of loan summaries and schedules kept in memory
+AMORTIZATION_CACHE_SIZE = 4096
+
+# Function to get the monthly interest rate
+def monthly_rate(annual_rate):
+    """
+    Convert an annual rate in percent to a monthly rate
+    """
+    return np.asarray(annual_rate, dtype=float) / (12 * 100)
+
+# Function to calculate EMI
+def calculate_emi(principal, annual_rate, months):
+    """
+    Calculate the monthly installment of a loan (arrays are broadcast)
+    A zero rate spreads the principal evenly
+    Returns a float for scalar inputs, otherwise an array
+    """
+    principal = np.asarray(principal, dtype=float)
+    months = np.asarray(months, dtype=float)
+    rate = monthly_rate(annual_rate)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (1 + rate) ** months
+        emi = np.where(rate > 0, principal * rate * growth / (growth - 1), principal / months)
+    return emi.item() if emi.ndim == 0 else emi
+
+# Function to get the balance after some payments
+def outstanding_balance(principal, annual_rate, months, paid):
+    """
+    Principal still owed after paid installments (closed form, arrays are broadcast)
+    Returns a float for scalar inputs, otherwise an array
+    """
+    principal = np.asarray(principal, dtype=float)
+    paid = np.clip(np.asarray(paid, dtype=float), 0, months)
+    rate = monthly_rate(annual_rate)
+    emi = np.asarray(calculate_emi(principal, annual_rate, months))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (1 + rate) ** paid
+        balance = np.where(rate > 0, principal * growth - emi * (growth - 1) / rate, principal - emi * paid)
+    balance = np.maximum(balance, 0)
+    return balance.item() if balance.ndim == 0 else balance
+
+# Function to get cumulative principal and interest
+def cumulative_paid(principal, annual_rate, months, paid):
+    """
+    Principal and interest repaid in the first paid installments
+    Returns (principal_paid, interest_paid), floats or arrays like the inputs
+    """
+    principal = np.asarray(principal, dtype=float)
+    paid = np.clip(np.asarray(paid, dtype=float), 0, months)
+    emi = np.asarray(calculate_emi(principal, annual_rate, months))
+
+    principal_paid = principal - np.asarray(outstanding_balance(principal, annual_rate, months, paid))
+    interest_paid = emi * paid - principal_paid
+    if principal_paid.ndim == 0:
+        return principal_paid.item(), interest_paid.item()
+    return principal_paid, interest_paid
+
+# Function to evaluate loans over a grid of inputs
+def emi_grid(amounts, annual_rates, months):
+    """
+    EMI, total payment and total interest for every (amount, rate, tenure) combination
+    Returns dictionary of arrays shaped (len(amounts), len(annual_rates), len(months))
+    """
+    amount, rate, tenure = np.meshgrid(
+        np.asarray(amounts, dtype=float), np.asarray(annual_rates, dtype=float),
+        np.asarray(months, dtype=float), indexing="ij"
+    )
+    emi = np.asarray(calculate_emi(amount, rate, tenure))
+    total_payment = emi * tenure
+    return {"emi": emi, "total_payment": total_payment, "total_interest": total_payment - amount}
+
+# Function to compute one constant-rate stretch of a schedule
+def _segment(balance, rate, emi, count):
+    """
+    Interest, principal and closing balance of count months starting from balance
+    The stretch stops early at the month that clears the loan
+    """
+    k = np.arange(1, count + 1, dtype=float)
+    if rate > 0:
+        growth = (1 + rate) ** k
+        closing = balance * growth - emi * (growth - 1) / rate
+    else:
+        closing = balance - emi * k
+
+    # The month that clears the balance pays only what is left
+    cleared = np.flatnonzero(closing <= 1e-9)
+    if cleared.size:
+        closing = closing[:cleared[0] + 1]
+        closing[-1] = 0.0
+
+    opening = np.concatenate(([balance], closing[:-1]))
+    interest = opening * rate
+    principal = opening - closing
+    return interest, principal, closing
+
+# Function to build an amortization schedule (cached)
+@functools.lru_cache(maxsize=AMORTIZATION_CACHE_SIZE)
+def _schedule(principal, annual_rate, months, prepayments, rate_changes, reduce):
+    # Events before the first or after the last installment have no effect
+    events = sorted(month for month in {m for m, _ in prepayments} | {m for m, _ in rate_changes} if 0 < month < months)
+    prepay = dict(prepayments)
+    new_rates = dict(rate_changes)
+
+    rate = float(monthly_rate(annual_rate))
+    emi = calculate_emi(principal, annual_rate, months)
+    balance = float(principal)
+    month = 0
+    parts = []
+
+    for stop in events + [months]:
+        stop = min(stop, months)
+        if stop > month and balance > 0:
+            interest, principal_part, closing = _segment(balance, rate, emi, stop - month)
+            parts.append((interest, principal_part, closing))
+            month += len(closing)
+            balance = float(closing[-1])
+        if balance <= 0 or month >= months or month != stop:
+            # Paid off (possibly early)
+            break
+
+        # Events take effect after this month's installment
+        if month in prepay:
+            paid = min(prepay[month], balance)
+            balance -= paid
+            parts[-1][1][-1] += paid
+            parts[-1][2][-1] = balance
+        if month in new_rates:
+            annual_rate = new_rates[month]
+            rate = float(monthly_rate(annual_rate))
+        if balance > 0 and (month in new_rates or (month in prepay and reduce == "emi")):
+            # Same remaining tenure, new installment
+            emi = calculate_emi(balance, annual_rate, months - month)
+
+    if parts:
+        interest, principal_part, balances = (np.concatenate(arrays) for arrays in zip(*parts))
+    else:
+        interest = principal_part = balances = np.zeros(0)
+
+    schedule = {
+        "month": np.arange(1, len(balances) + 1),
+        "payment": interest + principal_part,
+        "interest": interest,
+        "principal": principal_part,
+        "balance": balances,
+        "cumulative_interest": np.cumsum(interest),
+        "cumulative_principal": np.cumsum(principal_part),
+    }
+    for values in schedule.values():
+        values.setflags(write=False)
+    return schedule
+
+# Function to get an amortization schedule
+def amortization_schedule(principal, annual_rate, months, prepayments=None, rate_changes=None, reduce="tenure"):
+    """
+    Month-by-month schedule of a loan as arrays: month, payment, interest, principal,
+    balance, cumulative_interest and cumulative_principal
+    prepayments maps month -> extra amount paid after that month's installment;
+    reduce="tenure" keeps the EMI and ends the loan earlier, reduce="emi" keeps
+    the tenure and lowers the EMI. rate_changes maps month -> new annual rate from
+    the next month on, with the EMI recomputed over the remaining tenure
+    Returns dictionary of read-only arrays (cached; do not modify)
+    """
+    return _schedule(
+        float(principal), float(annual_rate), int(months),
+        tuple(sorted((prepayments or {}).items())), tuple(sorted((rate_changes or {}).items())),
+        reduce
+    )
+
+# Function to summarize a loan for the EMI calculator
+@functools.lru_cache(maxsize=AMORTIZATION_CACHE_SIZE)
+def loan_summary(principal, annual_rate, months):
+    """
+    EMI, totals and year-end cumulative principal/interest of a loan (cached)
+    Returns dictionary with emi, total_payment, total_interest, years,
+    principal_by_year and interest_by_year (read-only arrays)
+    """
+    emi = calculate_emi(principal, annual_rate, months)
+    years = np.arange(1, -(-int(months) // 12) + 1)
+    principal_by_year, interest_by_year = cumulative_paid(principal, annual_rate, months, np.minimum(years * 12, months))
+    for values in (years, principal_by_year, interest_by_year):
+        values.setflags(write=False)
+
+    total_payment = emi * months
+    return {
+        "emi": emi,
+        "total_payment": total_payment,
+        "total_interest": total_payment - principal,
+        "years": years,
+        "principal_by_year": principal_by_year,
+        "interest_by_year": interest_by_year,
+    }
+
+# Function to clear the amortization caches
+def clear_amortization_cache():
+    _schedule.cache_clear()
+    loan_summary.cache_clear()
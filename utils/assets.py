@@ -0,0 +1,124 @@
+import io
+import os
+import time
+import hashlib
+import threading
+
+from utils.lazy_imports import lazy_import
+
+# Pillow is only needed the first time an image variant is built
+Image = lazy_import("PIL.Image")
+
+# Static asset locations
+ASSETS_DIR = "assets"
+CSS_PATH = os.path.join(ASSETS_DIR, "css", "style.css")
+LOGO_PATH = os.path.join(ASSETS_DIR, "images", "nuvana_logo.png")
+
+# Logo widths used by the pages; all of them are built when the logo is first loaded
+LOGO_WIDTHS = (200, 100)
+
+# How often a cached asset is checked against the file on disk (seconds)
+ASSET_CHECK_INTERVAL = 2.0
+
+_assets_lock = threading.Lock()
+_assets = {}   # path -> {"stamp", "checked", "digest", "data", "variants"}
+
+# Function to load a file into the asset cache
+def _load(path):
+    """
+    Get the cache entry for a file, re-reading it only when its stat changed
+    Derived variants are kept as long as the content hash is the same
+    Returns the entry or None if the file does not exist
+    """
+    now = time.monotonic()
+    entry = _assets.get(path)
+    if entry is not None and now - entry["checked"] < ASSET_CHECK_INTERVAL:
+        return entry
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _assets.pop(path, None)
+        return None
+
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if entry is not None and entry["stamp"] == stamp:
+        entry["checked"] = now
+        return entry
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    if entry is not None and entry["digest"] == digest:
+        # Touched but not changed
+        entry.update(stamp=stamp, checked=now)
+        return entry
+
+    entry = {"stamp": stamp, "checked": now, "digest": digest, "data": data, "variants": {}}
+    _assets[path] = entry
+    return entry
+
+# Function to get page CSS
+def get_css(path=CSS_PATH):
+    """
+    Get a stylesheet wrapped in a <style> tag, read once per process
+    Returns the markup, or an empty string if the file is missing
+    """
+    with _assets_lock:
+        entry = _load(path)
+        if entry is None:
+            return ""
+        if "style" not in entry["variants"]:
+            entry["variants"]["style"] = f"<style>{entry['data'].decode()}</style>"
+        return entry["variants"]["style"]
+
+# Function to resize an image to a width
+def _resize(data, width):
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+# Function to get an image resized to a width
+def get_image(path, width):
+    """
+    Get PNG bytes of an image scaled down to width, encoded once per process
+    Returns the bytes, or None if the file is missing or unreadable
+    """
+    with _assets_lock:
+        entry = _load(path)
+        if entry is None:
+            return None
+
+        variants = entry["variants"]
+        if width not in variants:
+            widths = [width] + [w for w in LOGO_WIDTHS if w not in variants] if path == LOGO_PATH else [width]
+            for w in widths:
+                try:
+                    variants[w] = _resize(entry["data"], w)
+                except Exception as e:
+                    print(f"Error loading image {path}: {e}")
+                    variants[w] = None
+        return variants[width]
+
+# Function to get the logo
+def get_logo(width):
+    """
+    Get the Nuvana logo at one of the page widths
+    Returns PNG bytes or None if the logo is missing
+    """
+    return get_image(LOGO_PATH, width)
+
+# Function to get a cache key for an asset
+def asset_digest(path):
+    """
+    Content hash of an asset (useful as a cache-busting key)
+    Returns the hex digest or None if the file is missing
+    """
+    with _assets_lock:
+        entry = _load(path)
+        return entry["digest"] if entry else None
@@ -8,9 +8,13 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-import pyotp
+from utils.lazy_imports import lazy_import
 from utils.security import hash_password, verify_password
-from utils.db import load_user_data, save_user_data, get_all_users
+from utils.db import load_user_data, save_user_data, get_user_by_email
+from utils.sessions import revoke_user_sessions
+
+# Only needed when an OTP is actually generated
+pyotp = lazy_import("pyotp")
 
 # Function to login user
 def login_user(email, password):
@@ -18,21 +22,13 @@ def login_user(email, password):
     Authenticate a user with email and password
     Returns (success, user_id, message)
     """
-    # Get all users
-    users = get_all_users()
-    
     # Find user by email
-    user_id = None
-    for uid, user_data in users.items():
-        if user_data.get("email") == email:
-            user_id = uid
-            break
+    user_data = get_user_by_email(email)
     
-    if not user_id:
+    if not user_data:
         return False, None, "Invalid email or password"
     
-    # Load user data
-    user_data = load_user_data(user_id)
+    user_id = user_data["user_id"]
     
     # Check if account is locked
     if user_data.get("security", {}).get("login_attempts", 0) >= 5:
@@ -75,10 +71,8 @@ def register_user(user_data):
         return False, "Invalid email format"
     
     # Check if email already exists
-    users = get_all_users()
-    for uid, data in users.items():
-        if data.get("email") == user_data.get("email"):
-            return False, "Email already registered"
+    if get_user_by_email(user_data.get("email")):
+        return False, "Email already registered"
     
     # Generate user ID if not provided
     if "user_id" not in user_data:
@@ -158,22 +152,15 @@ def reset_password(email):
     Returns (success, message)
     """
     # Find user by email
-    users = get_all_users()
-    user_id = None
+    user_data = get_user_by_email(email)
     
-    for uid, user_data in users.items():
-        if user_data.get("email") == email:
-            user_id = uid
-            break
-    
-    if not user_id:
+    if not user_data:
         return False, "Email not found"
     
     # Generate temporary password
     temp_password = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
     
     # Update user data
-    user_data = load_user_data(user_id)
     user_data["password"] = hash_password(temp_password)
     user_data["security"]["password_reset"] = True
     user_data["security"]["last_password_change"] = datetime.now().isoformat()
@@ -182,6 +169,9 @@ def reset_password(email):
     success, message = save_user_data(user_data)
     
     if success:
+        # Sign the user out everywhere
+        revoke_user_sessions(user_data["user_id"])
+        
         # Send email with temporary password
         # In a real application, you would send an email here
         print(f"Temporary password for {email}: {temp_password}")
@@ -2,21 +2,851 @@ import os
 import json
 import glob
 import uuid
+import pickle
 import shutil
 import tempfile
+import time
+import atexit
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to in-process locks only
+    fcntl = None
+
+from utils import wal
+from utils import sqlite_db
+from utils.ledger import (
+    ledger_file_name, append_entries, write_entries, read_entries, read_entries_reverse,
+    sync_entries, repair_entries, PARTITION_DIR, partition_name, append_partitioned,
+    sync_partitions, read_partitioned
+)
+from utils.account_summary import SUMMARY_FIELD, summarize, update_account_summary
+from utils.transaction_monitor import monitor_transactions
+
+# Storage engine: "json" (files under data/users) or "sqlite" (utils/sqlite_db.py)
+STORAGE_BACKEND = os.environ.get("NUVANA_STORAGE_BACKEND", "json")
+
+# Functions every storage engine implements. The business operations
+# (add_transaction, add_loan, update_loan_status, transfer_funds) are built on
+# atomic_transaction and work unchanged on either engine
+ENGINE_FUNCTIONS = (
+    "load_user_data",
+    "save_user_data",
+    "get_all_users",
+    "get_user_version",
+    "iter_users",
+    "atomic_transaction",
+    "atomic_multi_transaction",
+    "get_account_transactions",
+    "get_recent_transactions",
+    "get_user_id_by_email",
+    "get_user_by_email",
+    "resolve_accounts",
+    "find_loans",
+    "find_transactions",
+)
+
 # Base directory for data
 DATA_DIR = "data"
 USERS_DIR = os.path.join(DATA_DIR, "users")
+INDEX_DIR = os.path.join(DATA_DIR, "indexes")
+LOCKS_DIR = os.path.join(DATA_DIR, "locks")
+BATCH_DIR = os.path.join(DATA_DIR, "batches")
+
+# Secondary index files (index name -> path)
+INDEX_FILES = {
+    "email": os.path.join(INDEX_DIR, "email_index.json"),
+    "account": os.path.join(INDEX_DIR, "account_index.json"),
+    "loan": os.path.join(INDEX_DIR, "loan_index.json"),
+}
+
+# Lock file serializing index updates across processes
+INDEX_LOCK_FILE = os.path.join(LOCKS_DIR, "indexes.lock")
+
+# Minimum seconds between index rebuilds triggered by a lookup that found nothing
+INDEX_MISS_REBUILD_INTERVAL = 30
+
+# Maximum number of user documents kept in the in-process cache
+USER_CACHE_SIZE = 1024
+
+# Number of users iter_users reads per page
+USER_PAGE_SIZE = 500
+
+# How long to wait for a user lock (seconds) and how often to retry
+LOCK_TIMEOUT = 10
+LOCK_RETRY_DELAY = 0.005
+
+# Write-ahead log: commit saves to data/wal with group-commit fsync and write the
+# user files at periodic checkpoints. Only enable this when a single process
+# writes the data directory; other processes read the user files, which lag the log
+WAL_ENABLED = False
+WAL_CHECKPOINT_INTERVAL = 5.0   # seconds between background checkpoints
+WAL_CHECKPOINT_RECORDS = 1000   # checkpoint early once this many records are in the log
+
+# batch_transfer: worker threads for independent groups of transfers, and the
+# most transfers committed together in one batch
+BATCH_TRANSFER_WORKERS = 8
+BATCH_TRANSFER_CHUNK = 100
 
 # Ensure directories exist
 os.makedirs(USERS_DIR, exist_ok=True)
+os.makedirs(INDEX_DIR, exist_ok=True)
+os.makedirs(LOCKS_DIR, exist_ok=True)
+os.makedirs(BATCH_DIR, exist_ok=True)
+
+# In-memory copies of the secondary indexes, loaded lazily
+_index_lock = threading.RLock()
+_indexes = {}        # index name -> {key: value}
+_index_owners = {}   # index name -> {user_id: set of keys}
+_index_stamps = {}   # index name -> stat stamp of the file we last read or wrote
+_loan_statuses = {}  # loan status -> set of loan IDs, derived from the loan index
+_index_file_lock_state = {"depth": 0, "file": None, "miss_rebuild": 0.0}
+
+# LRU cache of user documents: user_id -> (stamp, generation, pickled user data, version)
+# Documents are stored pickled so every caller gets its own copy to mutate
+_cache_lock = threading.Lock()
+_user_cache = OrderedDict()
+_user_generations = {}  # user_id -> write generation, bumped by save_user_data
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Function to write JSON atomically
+def _write_json_atomic(file_path, data, indent=None, fsync=False):
+    """
+    Write data to a JSON file via a temporary file in the same directory
+    """
+    directory = os.path.dirname(file_path) or "."
+    with tempfile.NamedTemporaryFile(mode='w', dir=directory, delete=False) as temp_file:
+        # json.dumps uses the C encoder when indent is None; json.dump never does
+        temp_file.write(json.dumps(data, indent=indent))
+        if fsync:
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+    try:
+        os.replace(temp_file.name, file_path)
+    except Exception:
+        os.unlink(temp_file.name)
+        raise
+
+# Function to turn a stat result into a change-detection stamp
+def _stat_stamp(stat):
+    # Every save replaces the file, so the inode changes even when mtime granularity is coarse
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+# Function to get the stat stamp of a file
+def _file_stamp(file_path):
+    try:
+        return _stat_stamp(os.stat(file_path))
+    except OSError:
+        return None
+
+# Function to route an engine function to the selected storage engine
+def _engine_function(func):
+    """
+    Decorator for the JSON implementations of ENGINE_FUNCTIONS
+    Calls the SQLite engine's function of the same name when it is selected
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if STORAGE_BACKEND == "sqlite":
+            return getattr(sqlite_db, func.__name__)(*args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+# Per-user locks: a thread lock for this process plus an flock on data/locks/<user_id>.lock
+# for other processes. _held_locks tracks the users the current thread holds, so the
+# locks are reentrant (e.g. a transfer holding both users calling atomic_transaction)
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+_held_locks = threading.local()
+
+# Function to acquire the lock for one user
+def _acquire_user_lock(user_id, deadline):
+    """
+    Acquire the thread lock and file lock for a user, retrying until the deadline
+    Returns the open lock file (or None without fcntl); raises TimeoutError
+    """
+    with _user_locks_guard:
+        thread_lock = _user_locks.setdefault(user_id, threading.Lock())
+
+    if not thread_lock.acquire(timeout=max(0, deadline - time.monotonic())):
+        raise TimeoutError(f"Timed out waiting for lock on user {user_id}")
+
+    if fcntl is None:
+        return None
+
+    try:
+        lock_file = open(os.path.join(LOCKS_DIR, f"{user_id}.lock"), 'a')
+    except Exception:
+        thread_lock.release()
+        raise
+
+    while True:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                lock_file.close()
+                thread_lock.release()
+                raise TimeoutError(f"Timed out waiting for lock on user {user_id}")
+            time.sleep(LOCK_RETRY_DELAY)
+
+# Function to release the lock for one user
+def _release_user_lock(user_id, lock_file):
+    if lock_file is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        lock_file.close()
+    _user_locks[user_id].release()
+
+# Function to lock the secondary indexes
+@contextmanager
+def _index_file_lock():
+    """
+    Hold _index_lock and an exclusive flock on INDEX_LOCK_FILE, so a reload, modify
+    and write of the index files is not interleaved with another process's
+    Reentrant within the thread holding it
+    """
+    with _index_lock:
+        state = _index_file_lock_state
+        if state["depth"] == 0 and fcntl is not None:
+            lock_file = open(INDEX_LOCK_FILE, 'a')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            except Exception:
+                lock_file.close()
+                raise
+            state["file"] = lock_file
+        state["depth"] += 1
+        try:
+            yield
+        finally:
+            state["depth"] -= 1
+            if state["depth"] == 0 and state["file"] is not None:
+                fcntl.flock(state["file"].fileno(), fcntl.LOCK_UN)
+                state["file"].close()
+                state["file"] = None
+
+# Function to rebuild the indexes after a lookup miss
+def _rebuild_indexes_on_miss():
+    """
+    Rebuild the indexes when a lookup found nothing, in case an entry was lost
+    (e.g. a crash between writing a user file and updating the index)
+    Rebuilds at most once per INDEX_MISS_REBUILD_INTERVAL
+    Returns True if the indexes were rebuilt
+    """
+    with _index_lock:
+        now = time.monotonic()
+        if now - _index_file_lock_state["miss_rebuild"] < INDEX_MISS_REBUILD_INTERVAL:
+            return False
+        _index_file_lock_state["miss_rebuild"] = now
+    success, _ = rebuild_indexes()
+    return success
+
+# Function to lock one or more users
+@contextmanager
+def lock_users(*user_ids, timeout=None):
+    """
+    Hold exclusive locks on one or more users for the duration of a with block
+    Locks are taken in sorted order, so callers locking the same users cannot deadlock
+    Raises TimeoutError if a lock cannot be acquired within timeout seconds
+    """
+    if not hasattr(_held_locks, "depth"):
+        _held_locks.depth = {}
+        _held_locks.files = {}
+
+    depth = _held_locks.depth
+    deadline = time.monotonic() + (LOCK_TIMEOUT if timeout is None else timeout)
+    entered = []
+
+    try:
+        for user_id in sorted(set(user_ids)):
+            if depth.get(user_id, 0) == 0:
+                _held_locks.files[user_id] = _acquire_user_lock(user_id, deadline)
+            depth[user_id] = depth.get(user_id, 0) + 1
+            entered.append(user_id)
+        yield
+    finally:
+        for user_id in reversed(entered):
+            depth[user_id] -= 1
+            if depth[user_id] == 0:
+                del depth[user_id]
+                _release_user_lock(user_id, _held_locks.files.pop(user_id))
+
+# Write-ahead log state: committed documents not yet checkpointed into the user files
+# (user_id -> (seq, pickled user data)). _wal_pending holds the ledger appends queued
+# by the current thread's transaction; they are written by the commit that saves it
+_dirty_lock = threading.Lock()
+_dirty_users = {}
+_wal_pending = threading.local()
+_checkpoint_lock = threading.RLock()
+_checkpoint_event = threading.Event()
+_wal_started = threading.Event()
+_batches_recovered = threading.Event()
+
+# Function to take the ledger appends queued by the current thread
+def _take_pending_ledger():
+    pending = getattr(_wal_pending, "ledger", None) or []
+    _wal_pending.ledger = []
+    return pending
+
+# Function to commit user documents through the write-ahead log
+def _wal_commit(docs, ledger):
+    """
+    Append the documents and their ledger records to the log as one record, wait
+    for the group-commit fsync, then apply the ledger records and publish the documents
+    """
+    _ensure_wal_started()
+    
+    with lock_users(*[user_data["user_id"] for user_data in docs]):
+        seq = wal.append({"docs": docs, "ledger": ledger})
+        
+        # The log has the records, so the ledger files can be synced at checkpoint time
+        for entry in ledger:
+            append_entries(entry["file"], entry["records"], fsync=False)
+        _append_partitions(ledger, fsync=False)
+        
+        for user_data in docs:
+            user_id = user_data["user_id"]
+            payload = pickle.dumps(user_data, pickle.HIGHEST_PROTOCOL)
+            with _dirty_lock:
+                current = _dirty_users.get(user_id)
+                if current is None or current[0] < seq:
+                    _dirty_users[user_id] = (seq, payload)
+            with _cache_lock:
+                _user_generations[user_id] = _user_generations.get(user_id, 0) + 1
+    
+    if wal.records_since_rotate() >= WAL_CHECKPOINT_RECORDS:
+        _checkpoint_event.set()
+
+# Function to commit several user documents as one batch without the write-ahead log
+def _journal_commit(docs, ledger):
+    """
+    Write the batch to a journal file and fsync it, apply it to the ledgers and
+    user files, then delete the journal. A journal left by a crash is replayed
+    by _recover_batches, so the batch is applied completely or not at all
+    The user files are written in docs order (credits first, see _credits_first)
+    """
+    journal = os.path.join(BATCH_DIR, f"batch-{uuid.uuid4().hex}.json")
+    _write_json_atomic(journal, {"docs": docs, "ledger": ledger}, fsync=True)
+    _fsync_directory(BATCH_DIR)
+    
+    try:
+        for entry in ledger:
+            append_entries(entry["file"], entry["records"])
+        _append_partitions(ledger)
+        for user_data in docs:
+            _write_user_file(user_data["user_id"], user_data)
+    except Exception as e:
+        # The journal is durable, so finish the batch from it; leaving ledger rows
+        # without their user files would let a retry record them twice
+        print(f"Error applying batch, replaying its journal: {e}")
+        try:
+            _apply_records([{"docs": docs, "ledger": ledger}])
+        except Exception:
+            # Replay the journal before the next read instead
+            _batches_recovered.clear()
+            raise
+    
+    os.unlink(journal)
+
+# Function to apply logged records to the user files and ledgers
+def _apply_records(records):
+    """
+    Apply batch records left by a previous process (WAL segments or journals)
+    Ledger records are only appended if the ledger is shorter than the count
+    the document expects, so replaying twice is harmless
+    Returns list of the applied user documents
+    """
+    latest = {}
+    ledger_counts = {}
+    for record in records:
+        for user_data in record["docs"]:
+            latest[user_data["user_id"]] = user_data
+        for entry in record["ledger"]:
+            file_name = entry["file"]
+            if file_name not in ledger_counts:
+                ledger_counts[file_name] = repair_entries(file_name)
+            missing = entry["count"] - ledger_counts[file_name]
+            if missing > 0:
+                append_entries(file_name, entry["records"][-missing:])
+                ledger_counts[file_name] += min(missing, len(entry["records"]))
+        # The crash may also have come before the partition append; reads skip duplicates
+        _write_partitions(record["ledger"])
+    
+    applied = _credits_first(list(latest.values()), [entry for record in records for entry in record["ledger"]])
+    for user_data in applied:
+        _write_user_file(user_data["user_id"], user_data, fsync=True)
+    _fsync_directory(USERS_DIR)
+    
+    return applied
+
+# Function to replay batch journals after a restart
+def _recover_batches():
+    """
+    Apply batch journals left by a crash in the middle of _journal_commit
+    Returns list of recovered user documents
+    """
+    journals = sorted(glob.glob(os.path.join(BATCH_DIR, "batch-*.json")), key=os.path.getmtime)
+    records = []
+    for journal in journals:
+        try:
+            with open(journal, 'r') as f:
+                records.append(json.load(f))
+        except Exception as e:
+            # An unreadable journal was never fully written, so its batch was not applied
+            print(f"Error reading batch journal {journal}: {e}")
+    
+    recovered = _apply_records(records) if records else []
+    for journal in journals:
+        os.unlink(journal)
+    if recovered:
+        print(f"Recovered {len(recovered)} users from batch journals")
+    return recovered
+
+# Function to replay leftover batch journals once per process
+def _ensure_recovered():
+    if _batches_recovered.is_set():
+        return
+    
+    with _checkpoint_lock:
+        if _batches_recovered.is_set():
+            return
+        recovered = _recover_batches()
+        _batches_recovered.set()
+    
+    for user_data in recovered:
+        _update_indexes(user_data)
+
+# Function to get a committed document that is not checkpointed yet
+def _get_dirty_user(user_id):
+    with _dirty_lock:
+        entry = _dirty_users.get(user_id)
+    return pickle.loads(entry[1]) if entry is not None else None
+
+# Function to checkpoint the write-ahead log
+def checkpoint():
+    """
+    Write committed log records into the per-user files and remove the old log segments
+    Returns (success, message) tuple
+    """
+    with _checkpoint_lock:
+        segments, last_seq = wal.rotate()
+        if not segments:
+            return True, "Nothing to checkpoint"
+        
+        latest = {}
+        ledgers = {}
+        days = set()
+        for record in wal.read_records(segments):
+            for user_data in record["docs"]:
+                latest[user_data["user_id"]] = user_data
+            for entry in record["ledger"]:
+                ledgers.setdefault(entry["user_id"], set()).add(entry["file"])
+                days.update(partition_name(transaction.get("timestamp")) for transaction in entry["records"])
+        
+        try:
+            for user_id, user_data in latest.items():
+                # Holding the user's lock means every commit for this user in the
+                # closed segments has finished its ledger appends
+                with lock_users(user_id):
+                    for file_name in ledgers.get(user_id, ()):
+                        sync_entries(file_name)
+                    _write_user_file(user_id, user_data, fsync=True)
+            _fsync_directory(USERS_DIR)
+            sync_partitions(days)
+        except Exception as e:
+            print(f"Error checkpointing WAL: {e}")
+            return False, f"Error checkpointing WAL: {str(e)}"
+        
+        wal.remove_segments(segments)
+        
+        # Documents up to last_seq are now in the user files
+        with _dirty_lock:
+            for user_id in [uid for uid, entry in _dirty_users.items() if entry[0] <= last_seq]:
+                del _dirty_users[user_id]
+        
+        return True, f"Checkpointed {len(latest)} users"
+
+# Function to replay the write-ahead log after a restart
+def _recover_wal():
+    """
+    Apply log segments left by a previous process to the user files and ledgers
+    Returns list of recovered user documents
+    """
+    segments = wal.list_segments()
+    if not segments:
+        return []
+    
+    recovered = _apply_records(wal.read_records(segments))
+    wal.remove_segments(segments)
+    print(f"Recovered {len(recovered)} users from the write-ahead log")
+    return recovered
+
+# Function to run background checkpoints
+def _checkpoint_loop():
+    while True:
+        _checkpoint_event.wait(WAL_CHECKPOINT_INTERVAL)
+        _checkpoint_event.clear()
+        try:
+            checkpoint()
+        except Exception as e:
+            print(f"Error in WAL checkpoint thread: {e}")
+
+# Function to start the write-ahead log
+def _ensure_wal_started():
+    """
+    Replay any log left by a previous process and start the checkpoint thread
+    Runs once per process, before the first read or write in WAL mode
+    """
+    if _wal_started.is_set():
+        return
+    
+    with _checkpoint_lock:
+        if _wal_started.is_set():
+            return
+        recovered = _recover_wal()
+        threading.Thread(target=_checkpoint_loop, name="wal-checkpoint", daemon=True).start()
+        atexit.register(checkpoint)
+        _wal_started.set()
+    
+    # Index updates read user files, so they have to wait until the log is started
+    for user_data in recovered:
+        _update_indexes(user_data)
+
+# Function to fsync a directory so renames in it are durable
+def _fsync_directory(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# Function to get a user document from the cache
+def _cache_get(user_id, stamp):
+    """
+    Return a copy of the cached document if it still matches the file stamp
+    and the user's write generation, otherwise None
+    """
+    with _cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is not None and entry[0] == stamp and entry[1] == _user_generations.get(user_id, 0):
+            _user_cache.move_to_end(user_id)
+            _cache_stats["hits"] += 1
+            payload = entry[2]
+        else:
+            _cache_stats["misses"] += 1
+            return None
+    return pickle.loads(payload)
+
+# Function to put a user document in the cache
+def _cache_put(user_id, stamp, user_data, evict=True):
+    """
+    Store a user document in the cache
+    With evict=False the document is only stored if there is free capacity,
+    so bulk scans do not push out the hot entries
+    """
+    payload = pickle.dumps(user_data, pickle.HIGHEST_PROTOCOL)
+    with _cache_lock:
+        if user_id not in _user_cache and len(_user_cache) >= USER_CACHE_SIZE:
+            if not evict:
+                return
+            while len(_user_cache) >= USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+                _cache_stats["evictions"] += 1
+        _user_cache[user_id] = (stamp, _user_generations.get(user_id, 0), payload, user_data.get("version", 0))
+        _user_cache.move_to_end(user_id)
+
+# Function to drop a user document from the cache
+def _cache_discard(user_id):
+    with _cache_lock:
+        _user_cache.pop(user_id, None)
+
+# Function to get cache statistics
+def get_cache_stats():
+    """
+    Get user cache counters
+    Returns dictionary with hits, misses, evictions, size and capacity
+    """
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["size"] = len(_user_cache)
+        stats["capacity"] = USER_CACHE_SIZE
+    return stats
+
+# Function to clear the user cache
+def clear_user_cache():
+    """
+    Drop all cached user documents and reset the counters
+    """
+    with _cache_lock:
+        _user_cache.clear()
+        for key in _cache_stats:
+            _cache_stats[key] = 0
+
+# Function to read a user file through the cache
+def _read_user_file(user_id, file_path, evict=True):
+    """
+    Read a user file, serving it from the cache when the file is unchanged
+    Returns user data dictionary or None if the file does not exist
+    """
+    _ensure_recovered()
+    if WAL_ENABLED:
+        _ensure_wal_started()
+        user_data = _get_dirty_user(user_id)
+        if user_data is not None:
+            return user_data
+    
+    stamp = _file_stamp(file_path)
+    if stamp is None:
+        _cache_discard(user_id)
+        return None
+
+    user_data = _cache_get(user_id, stamp)
+    if user_data is not None:
+        return user_data
+
+    with open(file_path, 'r') as f:
+        # Stamp the descriptor we actually read in case the file was replaced meanwhile
+        stamp = _stat_stamp(os.fstat(f.fileno()))
+        user_data = json.load(f)
+
+    _cache_put(user_id, stamp, user_data, evict=evict)
+    return user_data
+
+# Function to get the version of a user document
+@_engine_function
+def get_user_version(user_id):
+    """
+    Get the version number of a user document, bumped by every save
+    Served from the cache without decoding the document when the file is unchanged
+    Returns the version or None if the user does not exist
+    """
+    if not user_id:
+        return None
+    
+    file_path = os.path.join(USERS_DIR, f"{user_id}.json")
+    if not WAL_ENABLED:
+        stamp = _file_stamp(file_path)
+        if stamp is None:
+            return None
+        with _cache_lock:
+            entry = _user_cache.get(user_id)
+            if entry is not None and entry[0] == stamp and entry[1] == _user_generations.get(user_id, 0):
+                return entry[3]
+    
+    try:
+        user_data = _read_user_file(user_id, file_path)
+    except Exception as e:
+        print(f"Error loading user data: {e}")
+        return None
+    return user_data.get("version", 0) if user_data else None
+
+# Function to get the owning user of an index value
+def _index_owner(value):
+    return value[0] if isinstance(value, list) else value
+
+# Function to regroup the loan index by status
+def _bucket_loans(index):
+    _loan_statuses.clear()
+    for loan_id, value in index.items():
+        _loan_statuses.setdefault(value[1], set()).add(loan_id)
+
+# Function to move one loan between status groups
+def _rebucket_loan(loan_id, old_value, new_value):
+    if old_value is not None:
+        _loan_statuses.get(old_value[1], set()).discard(loan_id)
+    if new_value is not None:
+        _loan_statuses.setdefault(new_value[1], set()).add(loan_id)
+
+# Function to compute index entries for a user
+def _index_entries(user_data):
+    """
+    Compute the secondary index entries contributed by one user document
+    Returns dictionary of index name -> {key: value}
+    """
+    user_id = user_data["user_id"]
+    entries = {name: {} for name in INDEX_FILES}
+
+    email = user_data.get("email")
+    if email:
+        entries["email"][email] = user_id
+
+    for i, account in enumerate(user_data.get("accounts", [])):
+        account_number = account.get("account_number")
+        if account_number:
+            entries["account"][account_number] = [user_id, i]
+
+    for loan in user_data.get("loans", []):
+        loan_id = loan.get("loan_id")
+        if loan_id:
+            entries["loan"][loan_id] = [user_id, loan.get("status"), loan.get("type"), loan.get("timestamp")]
+
+    return entries
+
+# Function to rebuild the secondary indexes from disk
+def rebuild_indexes():
+    """
+    Rebuild all secondary indexes by scanning every user file
+    Returns (success, message) tuple
+    """
+    indexes = {name: {} for name in INDEX_FILES}
+    owners = {name: {} for name in INDEX_FILES}
+
+    # Scan under the lock too: an entry another process adds during the scan
+    # would otherwise be lost when the rebuilt files replace its write
+    with _index_file_lock():
+        for user_id, user_data in get_all_users().items():
+            for name, entries in _index_entries(user_data).items():
+                indexes[name].update(entries)
+                owners[name][user_id] = set(entries)
+
+        try:
+            for name, file_path in INDEX_FILES.items():
+                _write_json_atomic(file_path, indexes[name])
+                _index_stamps[name] = _file_stamp(file_path)
+        except Exception as e:
+            print(f"Error rebuilding indexes: {e}")
+            return False, f"Error rebuilding indexes: {str(e)}"
+        finally:
+            _indexes.update(indexes)
+            _index_owners.update(owners)
+            _bucket_loans(indexes["loan"])
+
+    return True, "Indexes rebuilt successfully"
+
+# Function to make sure the in-memory indexes match the files on disk
+def _ensure_indexes():
+    """
+    Load index files that changed on disk since we last read them
+    Rebuilds from the user files if an index is missing or unreadable
+    """
+    with _index_lock:
+        for name, file_path in INDEX_FILES.items():
+            stamp = _file_stamp(file_path)
+            if stamp is None:
+                rebuild_indexes()
+                return
+            if name in _indexes and _index_stamps.get(name) == stamp:
+                continue
+
+            try:
+                with open(file_path, 'r') as f:
+                    index = json.load(f)
+            except Exception as e:
+                print(f"Error loading index {file_path}: {e}")
+                rebuild_indexes()
+                return
+
+            owners = {}
+            for key, value in index.items():
+                owners.setdefault(_index_owner(value), set()).add(key)
+
+            _indexes[name] = index
+            _index_owners[name] = owners
+            _index_stamps[name] = stamp
+            if name == "loan":
+                _bucket_loans(index)
+
+# Function to update the secondary indexes for one user
+def _update_indexes(user_data):
+    """
+    Apply the index entries of a saved user document
+    Index files are only rewritten when an entry actually changed
+    """
+    user_id = user_data["user_id"]
+
+    # The file lock spans the reload, so entries written by other processes are kept
+    with _index_file_lock():
+        _ensure_indexes()
+
+        for name, entries in _index_entries(user_data).items():
+            index = _indexes[name]
+            owners = _index_owners[name]
+            old_keys = owners.get(user_id, set())
+
+            changed = False
+            for key in old_keys - set(entries):
+                if key in index and _index_owner(index[key]) == user_id:
+                    if name == "loan":
+                        _rebucket_loan(key, index[key], None)
+                    del index[key]
+                    changed = True
+            for key, value in entries.items():
+                if index.get(key) != value:
+                    if name == "loan":
+                        _rebucket_loan(key, index.get(key), value)
+                    index[key] = value
+                    changed = True
+
+            owners[user_id] = set(entries)
+
+            if changed:
+                try:
+                    _write_json_atomic(INDEX_FILES[name], index)
+                    _index_stamps[name] = _file_stamp(INDEX_FILES[name])
+                except Exception as e:
+                    print(f"Error saving index {name}: {e}")
+
+# Function to look up a user ID by email
+@_engine_function
+def get_user_id_by_email(email):
+    """
+    Look up a user ID by email using the email index
+    Returns user_id or None if not found
+    """
+    if not email:
+        return None
+
+    with _index_lock:
+        _ensure_indexes()
+        user_id = _indexes["email"].get(email)
+
+    if user_id is None and _rebuild_indexes_on_miss():
+        with _index_lock:
+            user_id = _indexes["email"].get(email)
+    return user_id
+
+# Function to load a user by email
+@_engine_function
+def get_user_by_email(email):
+    """
+    Load user data for an email using the email index
+    Returns user data dictionary or None if not found
+    """
+    user_id = get_user_id_by_email(email)
+    if not user_id:
+        return None
+
+    user_data = load_user_data(user_id)
+    if user_data and user_data.get("email") == email:
+        return user_data
+
+    # The index entry is stale (file edited or removed outside the app)
+    rebuild_indexes()
+    user_id = get_user_id_by_email(email)
+    user_data = load_user_data(user_id) if user_id else None
+    if user_data and user_data.get("email") == email:
+        return user_data
+    return None
 
 # Function to load user data
-def load_user_data(user_id):
+@_engine_function
+def load_user_data(user_id, include_transactions=False):
     """
     Load user data from JSON file
+    Transaction history lives in the account ledgers and is only read
+    into each account's "transactions" list when include_transactions is True
     Returns user data dictionary or None if not found
     """
     if not user_id:
@@ -25,15 +855,382 @@ def load_user_data(user_id):
     file_path = os.path.join(USERS_DIR, f"{user_id}.json")
     
     try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        return None
+        user_data = _read_user_file(user_id, file_path)
+        if user_data and include_transactions:
+            for account in user_data.get("accounts", []):
+                if "ledger" in account:
+                    account["transactions"] = list(read_entries(account["ledger"]["file"]))
+        return user_data
     except Exception as e:
         print(f"Error loading user data: {e}")
         return None
 
+# Function to get the transactions of an account
+@_engine_function
+def get_account_transactions(user_id, account_index):
+    """
+    Get the transaction history of one account, oldest first
+    Returns list of transactions (empty if the account is not found)
+    """
+    user_data = load_user_data(user_id)
+    if not user_data or account_index >= len(user_data.get("accounts", [])):
+        return []
+    
+    account = user_data["accounts"][account_index]
+    if "ledger" not in account:
+        return account.get("transactions", [])
+    return list(read_entries(account["ledger"]["file"]))
+
+# Function to get the newest transactions of an account
+@_engine_function
+def get_recent_transactions(user_id, account_index, limit=5, cursor=None):
+    """
+    Get the newest transactions of an account without reading its whole history
+    The ledger is read backwards from the end; pass the returned cursor to get
+    the next older page ("load more")
+    Returns (transactions newest first, cursor or None when there are no older ones)
+    """
+    user_data = load_user_data(user_id)
+    if not user_data or account_index >= len(user_data.get("accounts", [])):
+        return [], None
+    
+    account = user_data["accounts"][account_index]
+    if "ledger" in account:
+        return read_entries_reverse(account["ledger"]["file"], limit, cursor)
+    
+    # Older documents embed the history; the cursor is a list position
+    transactions = account.get("transactions", [])
+    end = len(transactions) if cursor is None else min(int(cursor), len(transactions))
+    start = max(0, end - limit)
+    return transactions[start:end][::-1], (start if start > 0 else None)
+
+# Function to move an account's history into its ledger
+def _externalize_account(account):
+    """
+    Make sure an account keeps its history in a ledger file
+    An embedded transaction list from an older document is written out to a new ledger;
+    a list on an account that already has a ledger is a loaded copy and is dropped
+    """
+    transactions = account.pop("transactions", None)
+    if "ledger" not in account:
+        file_name = ledger_file_name(account["account_number"])
+        write_entries(file_name, transactions or [])
+        account["ledger"] = {"file": file_name, "count": len(transactions or [])}
+
+# Function to read the recorded history of an account
+def _account_history(account):
+    """
+    Get the transactions already recorded for an account, oldest first
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_db.read_account_transactions(account["account_number"])
+    if "ledger" in account:
+        return list(read_entries(account["ledger"]["file"]))
+    return account.get("transactions", [])
+
+# Function to append transactions to an account's ledger
+def _append_account_transactions(account, records):
+    """
+    Append transaction records to an account's ledger
+    and add them to the account's running totals
+    """
+    update_account_summary(account, records, history=lambda: _account_history(account))
+    
+    if STORAGE_BACKEND == "sqlite":
+        # Inserted into the transactions table by the save that ends this transaction
+        sqlite_db.queue_transactions(account["account_number"], records)
+        return
+    
+    _externalize_account(account)
+    account["ledger"]["count"] += len(records)
+    
+    # Written by the commit that saves this account's document (see _save_users)
+    if not hasattr(_wal_pending, "ledger"):
+        _wal_pending.ledger = []
+    _wal_pending.ledger.append({
+        "file": account["ledger"]["file"],
+        "count": account["ledger"]["count"],
+        "records": records
+    })
+
+# Function to get the running totals of an account
+def get_account_summary(user_id, account_index):
+    """
+    Get an account's credit/debit totals and counts with daily and monthly buckets
+    Read from the user document; accounts without a summary yet are computed from their history
+    Returns summary dictionary or None if the account is not found
+    """
+    user_data = load_user_data(user_id)
+    if not user_data or account_index >= len(user_data.get("accounts", [])):
+        return None
+    
+    account = user_data["accounts"][account_index]
+    summary = account.get(SUMMARY_FIELD)
+    if summary is None:
+        summary = summarize(_account_history(account))
+    return summary
+
+# Function to rebuild the running totals of all accounts
+def rebuild_account_summaries():
+    """
+    Recompute every account's summary from its transaction history
+    Use after a summary has drifted, e.g. when a ledger was repaired by hand
+    Returns (success, message) tuple
+    """
+    def transaction_func(user_data):
+        for account in user_data.get("accounts", []):
+            account[SUMMARY_FIELD] = summarize(_account_history(account))
+        return True, user_data, "Summaries rebuilt"
+    
+    rebuilt = 0
+    for user_id, _ in iter_users(fields=()):
+        success, message = atomic_transaction(user_id, transaction_func)
+        if not success:
+            return False, f"Error rebuilding summaries of user {user_id}: {message}"
+        rebuilt += 1
+    
+    return True, f"Rebuilt account summaries of {rebuilt} users"
+
+# Function to migrate embedded transaction lists into ledgers
+def migrate_ledgers():
+    """
+    Move the transaction lists still embedded in user files into account ledgers
+    Returns (success, message) tuple
+    """
+    migrated = 0
+    for user_id, user_data in get_all_users().items():
+        if not any("transactions" in account for account in user_data.get("accounts", [])):
+            continue
+        success, message = atomic_transaction(user_id, lambda data: (True, data, "Migrated"))
+        if not success:
+            return False, f"Error migrating user {user_id}: {message}"
+        migrated += 1
+    
+    return True, f"Migrated {migrated} users to account ledgers"
+
+# Day partitions of the ledger records (see utils/ledger.py): built from the
+# ledgers the first time they are needed, then appended to by every commit
+_partition_lock = threading.Lock()
+_partitions_ready = threading.Event()
+
+# Function to turn ledger appends into partition rows
+def _partition_rows(ledger):
+    return [
+        {"user_id": entry.get("user_id"), "account_number": os.path.splitext(entry["file"])[0], "transaction": record}
+        for entry in ledger
+        for record in entry["records"]
+    ]
+
+# Function to write ledger appends to the day partitions
+def _write_partitions(ledger, fsync=None):
+    """
+    Append ledger records to the day partitions if they exist
+    The partitions are derived from the ledgers, so a failure is reported and
+    the commit goes on; rebuild_transaction_partitions restores them
+    """
+    if not ledger or not os.path.isdir(PARTITION_DIR):
+        return
+    try:
+        append_partitioned(_partition_rows(ledger), fsync=fsync)
+    except Exception as e:
+        print(f"Error updating transaction partitions: {e}")
+
+# Function to append committed ledger records to the day partitions
+def _append_partitions(ledger, fsync=None):
+    if ledger:
+        _ensure_partitions()
+        _write_partitions(ledger, fsync)
+
+# Function to build the day partitions once per process
+def _ensure_partitions():
+    if _partitions_ready.is_set():
+        return
+    with _partition_lock:
+        if not _partitions_ready.is_set():
+            if not os.path.isdir(PARTITION_DIR):
+                _build_partitions()
+            _partitions_ready.set()
+
+# Function to write the day partitions from the ledgers
+def _build_partitions():
+    """
+    Write every account's history into a new partition directory and swap it in
+    Returns number of transactions written
+    """
+    temp_dir = f"{PARTITION_DIR}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(temp_dir)
+    written = 0
+    try:
+        for user_id, user_data in iter_users(fields=("accounts",)):
+            for account in user_data.get("accounts", []):
+                rows = [
+                    {"user_id": user_id, "account_number": account.get("account_number"), "transaction": record}
+                    for record in _account_history(account)
+                ]
+                append_partitioned(rows, fsync=False, partition_dir=temp_dir)
+                written += len(rows)
+
+        old_dir = None
+        if os.path.exists(PARTITION_DIR):
+            old_dir = f"{PARTITION_DIR}.{uuid.uuid4().hex}.old"
+            os.rename(PARTITION_DIR, old_dir)
+        os.rename(temp_dir, PARTITION_DIR)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return written
+
+# Function to rebuild the day partitions
+def rebuild_transaction_partitions():
+    """
+    Rebuild the day partitions from the account ledgers
+    Use after the partitions have drifted (e.g. a crash between a ledger append and
+    its partition append); commits made while this runs may be missed, so run it
+    while the app is idle
+    Returns (success, message) tuple
+    """
+    try:
+        with _partition_lock:
+            written = _build_partitions()
+            _partitions_ready.set()
+        return True, f"Rebuilt transaction partitions with {written} transactions"
+    except Exception as e:
+        print(f"Error rebuilding transaction partitions: {e}")
+        return False, f"Error rebuilding transaction partitions: {str(e)}"
+
+# Function to resolve account numbers
+@_engine_function
+def resolve_accounts(account_numbers):
+    """
+    Resolve account numbers to their owners using the account index
+    Index hits are checked against the user files; stale entries trigger one rebuild,
+    and so do misses (at most every INDEX_MISS_REBUILD_INTERVAL seconds)
+    Returns dictionary of account_number -> (user_id, account_index) or None if not found
+    """
+    account_numbers = list(dict.fromkeys(account_numbers))
+
+    def lookup():
+        with _index_lock:
+            _ensure_indexes()
+            index = _indexes["account"]
+            return {number: index.get(number) for number in account_numbers}
+
+    def verify(candidates):
+        resolved = {}
+        stale = False
+        by_user = {}
+        for number, entry in candidates.items():
+            if entry is None:
+                resolved[number] = None
+            else:
+                by_user.setdefault(entry[0], []).append((number, entry[1]))
+
+        for user_id, items in by_user.items():
+            user_data = load_user_data(user_id)
+            accounts = user_data.get("accounts", []) if user_data else []
+            for number, account_index in items:
+                if account_index < len(accounts) and accounts[account_index].get("account_number") == number:
+                    resolved[number] = (user_id, account_index)
+                else:
+                    resolved[number] = None
+                    stale = True
+
+        return {number: resolved[number] for number in account_numbers}, stale
+
+    resolved, stale = verify(lookup())
+
+    if stale:
+        # The index disagrees with a user file (edited or removed outside the app)
+        rebuild_indexes()
+        resolved, _ = verify(lookup())
+    elif None in resolved.values() and _rebuild_indexes_on_miss():
+        # An entry may have been lost before its user file was indexed
+        resolved, _ = verify(lookup())
+
+    return resolved
+
+# Function to find an account by account number
+def find_account(account_number):
+    """
+    Find the owner of an account number
+    Returns (user_id, account_index) tuple or (None, None) if not found
+    """
+    if not account_number:
+        return None, None
+
+    return resolve_accounts([account_number]).get(account_number) or (None, None)
+
+# Function to find loans
+@_engine_function
+def find_loans(status=None, loan_type=None, start=None, end=None):
+    """
+    Find loans using the loan index, without scanning every user
+    start and end are ISO timestamps bounding the application date (inclusive)
+    Only the users owning matching loans are loaded
+    Returns list of (user_id, loan) tuples, oldest application first
+    """
+    def lookup():
+        with _index_lock:
+            _ensure_indexes()
+            index = _indexes["loan"]
+            loan_ids = _loan_statuses.get(status, ()) if status is not None else index
+            matches = []
+            for loan_id in loan_ids:
+                user_id, _, type_, timestamp = index[loan_id]
+                if loan_type is not None and type_ != loan_type:
+                    continue
+                if start is not None and (timestamp or "") < start:
+                    continue
+                if end is not None and (timestamp or "") > end:
+                    continue
+                matches.append((timestamp or "", loan_id, user_id))
+        matches.sort()
+        return matches
+
+    def verify(matches):
+        loans = []
+        users = {}
+        stale = False
+        for _, loan_id, user_id in matches:
+            if user_id not in users:
+                users[user_id] = load_user_data(user_id)
+            user_data = users[user_id] or {}
+            loan = next((loan for loan in user_data.get("loans", []) if loan.get("loan_id") == loan_id), None)
+            if loan is None or (status is not None and loan.get("status") != status):
+                stale = True
+                continue
+            loans.append((user_id, loan))
+        return loans, stale
+
+    loans, stale = verify(lookup())
+
+    if stale:
+        # The index disagrees with a user file (edited or removed outside the app)
+        rebuild_indexes()
+        loans, _ = verify(lookup())
+
+    return loans
+
+# Function to find transactions in a time range
+@_engine_function
+def find_transactions(start=None, end=None):
+    """
+    Find the transactions of all accounts with start <= timestamp < end
+    start and end are ISO timestamps (None leaves that side open); only the day
+    partitions the range overlaps are read, so a day costs that day's volume
+    Returns list of (user_id, account_number, transaction) tuples, oldest first
+    """
+    _ensure_partitions()
+    return [
+        (row.get("user_id"), row.get("account_number"), row["transaction"])
+        for row in read_partitioned(start, end)
+    ]
+
 # Function to save user data
+@_engine_function
 def save_user_data(user_data):
     """
     Save user data to JSON file
@@ -42,32 +1239,118 @@ def save_user_data(user_data):
     if not user_data or "user_id" not in user_data:
         return False, "Invalid user data"
     
-    user_id = user_data["user_id"]
+    return _save_users([user_data])
+
+# Function to save several user documents in one commit
+def _save_users(docs):
+    """
+    Save user documents together with the ledger appends queued by this thread
+    A single document with no ledger appends is written directly; anything else
+    is committed as one batch (one WAL record, or a journal when the WAL is off)
+    Returns (success, message) tuple
+    """
+    ledger = _take_pending_ledger()
+    try:
+        # Reentrant, so this is free inside atomic_transaction
+        with lock_users(*[user_data["user_id"] for user_data in docs]):
+            _commit_users(docs, ledger)
+        return True, "User data saved successfully"
+    except TimeoutError as e:
+        print(f"Error saving user data: {e}")
+        return False, "Account is busy, please try again"
+    except Exception as e:
+        print(f"Error saving user data: {e}")
+        return False, f"Error saving user data: {str(e)}"
+
+# Function to order documents so credits are written before debits
+def _credits_first(docs, ledger):
+    """
+    Sort documents by the net amount their ledger records add, largest first
+    Lockless readers may then see a transfer's credit before its debit (money
+    briefly in both accounts) but never the debit without the credit
+    Returns sorted list of user documents
+    """
+    net = {}
+    for entry in ledger:
+        for record in entry["records"]:
+            amount = record.get("amount") or 0
+            user_id = entry.get("user_id")
+            net[user_id] = net.get(user_id, 0) + (amount if record.get("type") == "credit" else -amount)
+    return sorted(docs, key=lambda user_data: net.get(user_data["user_id"], 0), reverse=True)
+
+# Function to commit user documents (caller holds their locks)
+def _commit_users(docs, ledger):
+    # Keep transaction history in the account ledgers, not in the user file
+    saved = []
+    for user_data in docs:
+        user_data = dict(user_data)
+        if user_data.get("accounts"):
+            user_data["accounts"] = [dict(account) for account in user_data["accounts"]]
+            for account in user_data["accounts"]:
+                _externalize_account(account)
+        # Versions only go up, even if the caller saves a stale copy
+        current = get_user_version(user_data["user_id"]) or 0
+        user_data["version"] = max(current, user_data.get("version", 0)) + 1
+        saved.append(user_data)
+    
+    owners = {
+        account["ledger"]["file"]: user_data["user_id"]
+        for user_data in saved
+        for account in user_data.get("accounts", [])
+        if "ledger" in account
+    }
+    for entry in ledger:
+        entry["user_id"] = owners.get(entry["file"])
+    saved = _credits_first(saved, ledger)
+    
+    if WAL_ENABLED:
+        # Durable once it is in the log; the user files are written at the next checkpoint
+        _wal_commit(saved, ledger)
+    elif len(saved) > 1 or ledger:
+        # Ledger rows and the user files that count them go through a journal
+        _journal_commit(saved, ledger)
+    else:
+        # Use atomic write to prevent data corruption
+        _write_user_file(saved[0]["user_id"], saved[0])
+    
+    # Keep the secondary indexes in step with the user files
+    for user_data in saved:
+        _update_indexes(user_data)
+
+# Function to write a user file
+def _write_user_file(user_id, user_data, fsync=False):
+    """
+    Atomically replace a user file and refresh the cached copy
+    """
     file_path = os.path.join(USERS_DIR, f"{user_id}.json")
     
-    # Use atomic write to prevent data corruption
+    # Write to a temporary file in the same directory so the rename is atomic
+    temp_file = tempfile.NamedTemporaryFile(mode='w', dir=USERS_DIR, suffix=".tmp", delete=False)
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
-            # Write data to temporary file
+        with temp_file:
             json.dump(user_data, temp_file, indent=4)
+            if fsync:
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
         
         # Replace the original file with the temporary file
-        shutil.move(temp_file.name, file_path)
-        
-        return True, "User data saved successfully"
-    except Exception as e:
-        # Clean up temporary file if it exists
-        if 'temp_file' in locals():
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
-        
-        print(f"Error saving user data: {e}")
-        return False, f"Error saving user data: {str(e)}"
+        os.replace(temp_file.name, file_path)
+    except Exception:
+        try:
+            os.unlink(temp_file.name)
+        except OSError:
+            pass
+        raise
+    
+    # Bump the write generation and refresh the cached copy
+    with _cache_lock:
+        _user_generations[user_id] = _user_generations.get(user_id, 0) + 1
+    stamp = _file_stamp(file_path)
+    if stamp is not None:
+        _cache_put(user_id, stamp, user_data)
 
 # Function to get all users
+@_engine_function
 def get_all_users():
     """
     Get all users
@@ -78,18 +1361,81 @@ def get_all_users():
     try:
         for file_path in glob.glob(os.path.join(USERS_DIR, "*.json")):
             try:
-                with open(file_path, 'r') as f:
-                    user_data = json.load(f)
-                    if "user_id" in user_data:
-                        users[user_data["user_id"]] = user_data
+                file_id = os.path.splitext(os.path.basename(file_path))[0]
+                user_data = _read_user_file(file_id, file_path, evict=False)
+                if user_data and "user_id" in user_data:
+                    users[user_data["user_id"]] = user_data
             except Exception as e:
                 print(f"Error loading user file {file_path}: {e}")
     except Exception as e:
         print(f"Error listing user files: {e}")
     
+    # Users committed to the write-ahead log but not checkpointed into a file yet
+    if WAL_ENABLED:
+        with _dirty_lock:
+            missing = [user_id for user_id in _dirty_users if user_id not in users]
+        for user_id in missing:
+            user_data = _get_dirty_user(user_id)
+            if user_data:
+                users[user_id] = user_data
+    
     return users
 
+# Function to keep only some fields of a user document
+def _project_user(user_data, fields):
+    if fields is None:
+        return user_data
+    projected = {field: user_data[field] for field in fields if field in user_data}
+    projected["user_id"] = user_data["user_id"]
+    return projected
+
+# Function to iterate over users
+@_engine_function
+def iter_users(fields=None, predicate=None, page_size=USER_PAGE_SIZE, start_after=None):
+    """
+    Iterate over users one page at a time instead of loading them all
+    fields limits each yielded document to those keys (plus user_id)
+    predicate is called with the full document; users it rejects are skipped
+    start_after resumes after the given user ID (users are yielded in ID order)
+    Yields (user_id, user_data) tuples
+    """
+    try:
+        with os.scandir(USERS_DIR) as entries:
+            file_ids = [
+                entry.name[:-len(".json")] for entry in entries
+                if entry.name.endswith(".json") and entry.is_file()
+            ]
+    except Exception as e:
+        print(f"Error listing user files: {e}")
+        file_ids = []
+    
+    # Users committed to the write-ahead log but not checkpointed into a file yet
+    if WAL_ENABLED:
+        with _dirty_lock:
+            file_ids = list(set(file_ids).union(_dirty_users))
+    
+    file_ids.sort()
+    if start_after is not None:
+        file_ids = [file_id for file_id in file_ids if file_id > start_after]
+    
+    for start in range(0, len(file_ids), page_size):
+        for file_id in file_ids[start:start + page_size]:
+            try:
+                # Don't let a full scan push the working set out of the cache
+                user_data = _read_user_file(file_id, os.path.join(USERS_DIR, f"{file_id}.json"), evict=False)
+            except Exception as e:
+                print(f"Error loading user file {file_id}: {e}")
+                continue
+            
+            if not user_data or "user_id" not in user_data:
+                continue
+            if predicate is not None and not predicate(user_data):
+                continue
+            
+            yield user_data["user_id"], _project_user(user_data, fields)
+
 # Function to perform atomic transaction
+@_engine_function
 def atomic_transaction(user_id, transaction_func, *args, **kwargs):
     """
     Perform an atomic transaction on user data
@@ -101,25 +1447,87 @@ def atomic_transaction(user_id, transaction_func, *args, **kwargs):
     if not user_id:
         return False, "Invalid user ID"
     
-    # Load user data
-    user_data = load_user_data(user_id)
-    
-    if not user_data:
-        return False, "User not found"
-    
-    # Perform transaction
-    success, modified_user_data, message = transaction_func(user_data, *args, **kwargs)
-    
-    if not success:
-        return False, message
-    
-    # Save modified user data
-    save_success, save_message = save_user_data(modified_user_data)
+    # Hold the user's lock across load -> mutate -> save so concurrent
+    # sessions cannot overwrite each other's changes
+    try:
+        with lock_users(user_id):
+            # Load user data
+            user_data = load_user_data(user_id)
+            
+            if not user_data:
+                return False, "User not found"
+            
+            # Perform transaction
+            success, modified_user_data, message = transaction_func(user_data, *args, **kwargs)
+            
+            if not success:
+                return False, message
+            
+            # Save modified user data
+            save_success, save_message = save_user_data(modified_user_data)
+            
+            if not save_success:
+                return False, save_message
+            
+            return True, message
+    except TimeoutError as e:
+        print(f"Error locking user data: {e}")
+        return False, "Account is busy, please try again"
+    finally:
+        # Ledger appends queued for the write-ahead log only belong to this transaction
+        _take_pending_ledger()
+
+# Function to perform an atomic transaction on several users
+@_engine_function
+def atomic_multi_transaction(user_ids, transaction_func, *args, **kwargs):
+    """
+    Perform an atomic transaction on several users at once
+    The users are locked in a deterministic order and every change is committed as one batch
+    transaction_func should be a function that takes a dictionary of user_id -> user_data
+    as first argument and returns (success, modified_users, message)
     
-    if not save_success:
-        return False, save_message
+    Returns (success, message) tuple
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids or not all(user_ids):
+        return False, "Invalid user ID"
     
-    return True, message
+    try:
+        with lock_users(*user_ids):
+            # Load user data
+            users = {}
+            for user_id in user_ids:
+                users[user_id] = load_user_data(user_id)
+                if not users[user_id]:
+                    return False, "User not found"
+            
+            # Perform transaction
+            success, modified_users, message = transaction_func(users, *args, **kwargs)
+            
+            if not success:
+                return False, message
+            
+            # Save all modified users in one commit
+            save_success, save_message = _save_users(list(modified_users.values()))
+            
+            if not save_success:
+                return False, save_message
+            
+            return True, message
+    except TimeoutError as e:
+        print(f"Error locking user data: {e}")
+        return False, "Account is busy, please try again"
+    finally:
+        _take_pending_ledger()
+
+# Function to check committed transactions for suspicious activity
+def _monitor_recorded(recorded):
+    """
+    Run committed (user_id, account_number, transaction, recipient) rows through
+    the streaming rules in utils/transaction_monitor.py
+    """
+    for user_id, account_number, transaction, recipient in recorded:
+        monitor_transactions(user_id, account_number, [transaction], recipient)
 
 # Function to add transaction
 def add_transaction(user_id, account_index, transaction_type, amount, description):
@@ -127,7 +1535,10 @@ def add_transaction(user_id, account_index, transaction_type, amount, descriptio
     Add a transaction to user account
     Returns (success, message) tuple
     """
+    recorded = []
+    
     def transaction_func(user_data):
+        recorded.clear()
         if "accounts" not in user_data or account_index >= len(user_data["accounts"]):
             return False, user_data, "Account not found"
         
@@ -153,15 +1564,31 @@ def add_transaction(user_id, account_index, transaction_type, amount, descriptio
             "balance_after": account["balance"]
         }
         
-        # Add transaction to account
-        if "transactions" not in account:
-            account["transactions"] = []
-        
-        account["transactions"].append(transaction)
+        # Append transaction to the account ledger
+        _append_account_transactions(account, [transaction])
+        recorded.append((user_id, account["account_number"], transaction, None))
         
         return True, user_data, "Transaction added successfully"
     
-    return atomic_transaction(user_id, transaction_func)
+    success, message = atomic_transaction(user_id, transaction_func)
+    if success:
+        _monitor_recorded(recorded)
+    return success, message
+
+# Loan generation: bumped whenever this process adds a loan or changes its status,
+# so caches derived from the loans (utils/loan_book.py) know to rebuild
+_loan_generation = 0
+_loan_generation_lock = threading.Lock()
+
+# Function to get the loan generation
+def get_loan_generation():
+    return _loan_generation
+
+# Function to record a loan change
+def _bump_loan_generation():
+    global _loan_generation
+    with _loan_generation_lock:
+        _loan_generation += 1
 
 # Function to add loan
 def add_loan(user_id, loan_data):
@@ -203,15 +1630,15 @@ def add_loan(user_id, loan_data):
                     "reference": loan_data.get("loan_id")
                 }
                 
-                # Add transaction to account
-                if "transactions" not in account:
-                    account["transactions"] = []
-                
-                account["transactions"].append(transaction)
+                # Append transaction to the account ledger
+                _append_account_transactions(account, [transaction])
         
         return True, user_data, "Loan added successfully"
     
-    return atomic_transaction(user_id, transaction_func)
+    success, message = atomic_transaction(user_id, transaction_func)
+    if success:
+        _bump_loan_generation()
+    return success, message
 
 # Function to update loan status
 def update_loan_status(user_id, loan_id, status):
@@ -257,78 +1684,218 @@ def update_loan_status(user_id, loan_id, status):
                     "reference": loan_id
                 }
                 
-                # Add transaction to account
-                if "transactions" not in account:
-                    account["transactions"] = []
-                
-                account["transactions"].append(transaction)
+                # Append transaction to the account ledger
+                _append_account_transactions(account, [transaction])
         
         return True, user_data, "Loan status updated successfully"
     
-    return atomic_transaction(user_id, transaction_func)
+    success, message = atomic_transaction(user_id, transaction_func)
+    if success:
+        _bump_loan_generation()
+    return success, message
+
+# Function to move money between two accounts of loaded users
+def _apply_transfer(users, user_id, from_account_index, recipient_id, recipient_account_index,
+                    to_account_number, amount, description, recorded=None):
+    """
+    Debit the sender and credit the recipient in the given user documents, recording
+    a matching pair of ledger rows (double entry) that share a transfer_id
+    The rows are also added to recorded, if given, for _monitor_recorded
+    Returns (success, message) tuple; the documents are untouched on failure
+    """
+    if amount <= 0:
+        return False, "Invalid amount"
+    
+    sender = users[user_id]
+    recipient = users[recipient_id]
+    
+    if from_account_index >= len(sender.get("accounts", [])):
+        return False, "Account not found"
+    
+    # The recipient was resolved before locking, so check it is still the same account
+    recipient_accounts = recipient.get("accounts", [])
+    if (recipient_account_index >= len(recipient_accounts)
+            or recipient_accounts[recipient_account_index].get("account_number") != to_account_number):
+        return False, "Recipient account not found"
+    
+    from_account = sender["accounts"][from_account_index]
+    to_account = recipient_accounts[recipient_account_index]
+    
+    if from_account is to_account:
+        return False, "Cannot transfer to the same account"
+    
+    if from_account["balance"] < amount:
+        return False, "Insufficient balance"
+    
+    from_account["balance"] -= amount
+    to_account["balance"] += amount
+    
+    transfer_id = str(uuid.uuid4())
+    timestamp = datetime.now().isoformat()
+    
+    debit = {
+        "transaction_id": str(uuid.uuid4()),
+        "type": "debit",
+        "amount": amount,
+        "description": f"Transfer to {to_account_number}: {description}",
+        "timestamp": timestamp,
+        "balance_after": from_account["balance"],
+        "transfer_id": transfer_id,
+        "counterparty": to_account_number
+    }
+    credit = {
+        "transaction_id": str(uuid.uuid4()),
+        "type": "credit",
+        "amount": amount,
+        "description": f"Transfer from {from_account['account_number']}: {description}",
+        "timestamp": timestamp,
+        "balance_after": to_account["balance"],
+        "transfer_id": transfer_id,
+        "counterparty": from_account["account_number"]
+    }
+    _append_account_transactions(from_account, [debit])
+    _append_account_transactions(to_account, [credit])
+    
+    if recorded is not None:
+        recorded.append((user_id, from_account["account_number"], debit, to_account_number))
+        recorded.append((recipient_id, to_account_number, credit, None))
+    
+    return True, "Transfer completed successfully"
 
 # Function to transfer funds
 def transfer_funds(user_id, from_account_index, to_account_number, amount, description):
     """
     Transfer funds between accounts
+    Both users are locked in a fixed order and the debit and credit are committed
+    together, so no intermediate state where the money is missing is ever visible
     Returns (success, message) tuple
     """
-    # First, debit from sender's account
-    debit_success, debit_message = add_transaction(
-        user_id, 
-        from_account_index, 
-        "debit", 
-        amount, 
-        f"Transfer to {to_account_number}: {description}"
-    )
-    
-    if not debit_success:
-        return False, debit_message
-    
-    # Find recipient by account number
-    recipient_id = None
-    recipient_account_index = None
-    
-    users = get_all_users()
-    for uid, user_data in users.items():
-        if "accounts" in user_data:
-            for i, account in enumerate(user_data["accounts"]):
-                if account.get("account_number") == to_account_number:
-                    recipient_id = uid
-                    recipient_account_index = i
-                    break
-            if recipient_id:
-                break
+    # Find recipient by account number before locking anything
+    recipient_id, recipient_account_index = find_account(to_account_number)
     
     if not recipient_id:
-        # Rollback the debit transaction
-        add_transaction(
-            user_id,
-            from_account_index,
-            "credit",
-            amount,
-            f"Reversal of failed transfer to {to_account_number}: Recipient not found"
-        )
         return False, "Recipient account not found"
     
-    # Credit to recipient's account
-    credit_success, credit_message = add_transaction(
-        recipient_id,
-        recipient_account_index,
-        "credit",
-        amount,
-        f"Transfer from {load_user_data(user_id)['accounts'][from_account_index]['account_number']}: {description}"
-    )
-    
-    if not credit_success:
-        # Rollback the debit transaction
-        add_transaction(
-            user_id,
-            from_account_index,
-            "credit",
-            amount,
-            f"Reversal of failed transfer to {to_account_number}: {credit_message}"
+    recorded = []
+    
+    def transaction_func(users):
+        recorded.clear()
+        success, message = _apply_transfer(
+            users, user_id, from_account_index, recipient_id, recipient_account_index,
+            to_account_number, amount, description, recorded
         )
-        return False, f"Error crediting recipient account: {credit_message}"
+        return success, users, message
     
-    return True, "Transfer completed successfully"
+    success, message = atomic_multi_transaction([user_id, recipient_id], transaction_func)
+    if success:
+        _monitor_recorded(recorded)
+    return success, message
+
+# Function to run one group of transfers that touch the same users
+def _run_transfer_group(items, results):
+    """
+    Commit the transfers of one group in chunks of BATCH_TRANSFER_CHUNK, in order
+    Each chunk is a single atomic_multi_transaction; a transfer that fails
+    validation is skipped without affecting the rest of its chunk
+    """
+    for start in range(0, len(items), BATCH_TRANSFER_CHUNK):
+        chunk = items[start:start + BATCH_TRANSFER_CHUNK]
+        user_ids = []
+        for _, item, recipient_id, _ in chunk:
+            user_ids.extend((item["user_id"], recipient_id))
+        
+        recorded = []
+        
+        def transaction_func(users):
+            recorded.clear()
+            touched = {}
+            for position, item, recipient_id, recipient_account_index in chunk:
+                success, message = _apply_transfer(
+                    users, item["user_id"], item["from_account_index"], recipient_id,
+                    recipient_account_index, item["to_account_number"], item["amount"],
+                    item.get("description", ""), recorded
+                )
+                results[position] = (success, message)
+                if success:
+                    touched[item["user_id"]] = users[item["user_id"]]
+                    touched[recipient_id] = users[recipient_id]
+            if not touched:
+                return False, users, "No transfers to commit"
+            return True, touched, "Transfers completed"
+        
+        success, message = atomic_multi_transaction(user_ids, transaction_func)
+        if success:
+            _monitor_recorded(recorded)
+        else:
+            # Nothing in this chunk was committed
+            for position, _, _, _ in chunk:
+                if results[position] is None or results[position][0]:
+                    results[position] = (False, message)
+
+# Function to transfer funds in bulk
+def batch_transfer(items):
+    """
+    Perform many transfers, e.g. a payroll run
+    items is a list of dictionaries with the transfer_funds arguments: user_id,
+    from_account_index, to_account_number, amount and optional description
+    Recipients are resolved in one pass, transfers touching the same users run in
+    input order, and independent groups run in parallel on a thread pool
+    Returns list of (success, message) tuples, one per item
+    """
+    results = [None] * len(items)
+    
+    valid = []
+    for position, item in enumerate(items):
+        try:
+            if not item["user_id"] or item["amount"] <= 0 or item["from_account_index"] < 0:
+                raise ValueError
+            valid.append((position, item))
+        except (KeyError, TypeError, ValueError):
+            results[position] = (False, "Invalid transfer")
+    
+    # Resolve every recipient with one index lookup
+    recipients = resolve_accounts([item["to_account_number"] for _, item in valid])
+    
+    # Group transfers that share a user (union-find over user IDs) so each group
+    # can run on its own thread without waiting for another group's locks
+    parent = {}
+    
+    def find(user_id):
+        parent.setdefault(user_id, user_id)
+        while parent[user_id] != user_id:
+            parent[user_id] = parent[parent[user_id]]
+            user_id = parent[user_id]
+        return user_id
+    
+    # A missing sender would fail the whole chunk it lands in, so drop it up front
+    senders = {item["user_id"] for _, item in valid}
+    missing = {user_id for user_id in senders if load_user_data(user_id) is None}
+    
+    resolved = []
+    for position, item in valid:
+        recipient = recipients.get(item["to_account_number"])
+        if item["user_id"] in missing:
+            results[position] = (False, "User not found")
+            continue
+        if not recipient:
+            results[position] = (False, "Recipient account not found")
+            continue
+        recipient_id, recipient_account_index = recipient
+        parent[find(item["user_id"])] = find(recipient_id)
+        resolved.append((position, item, recipient_id, recipient_account_index))
+    
+    groups = {}
+    for entry in resolved:
+        groups.setdefault(find(entry[1]["user_id"]), []).append(entry)
+    
+    # Largest groups first so a long payroll run does not start last
+    ordered = sorted(groups.values(), key=len, reverse=True)
+    if len(ordered) <= 1 or BATCH_TRANSFER_WORKERS <= 1:
+        for group in ordered:
+            _run_transfer_group(group, results)
+    else:
+        with ThreadPoolExecutor(max_workers=min(BATCH_TRANSFER_WORKERS, len(ordered))) as pool:
+            for future in [pool.submit(_run_transfer_group, group, results) for group in ordered]:
+                future.result()
+    
+    return results
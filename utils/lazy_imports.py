@@ -0,0 +1,45 @@
+import importlib
+import threading
+
+# Module proxy that imports the real module on first attribute access
+class LazyModule:
+    """
+    Stand-in for a module that is only imported when first used
+    Lets scripts keep "plt.subplots()" style calls while paying the import cost
+    only on the pages that actually draw a chart
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+# Function to import a module lazily
+def lazy_import(name):
+    """
+    Get a proxy for a module that is imported the first time one of its attributes is used
+    e.g. plt = lazy_import("matplotlib.pyplot")
+    """
+    return LazyModule(name)
@@ -0,0 +1,278 @@
+import os
+import json
+import tempfile
+
+# Base directory for account ledgers
+DATA_DIR = "data"
+LEDGER_DIR = os.path.join(DATA_DIR, "ledgers")
+
+# Day partitions: every ledger record is also appended to the file of its day
+# (YYYY-MM-DD.jsonl) so time-range queries only read the days they cover.
+# Records without a readable timestamp go to undated.jsonl
+PARTITION_DIR = os.path.join(DATA_DIR, "ledgers_by_day")
+UNDATED_PARTITION = "undated"
+
+# When to fsync ledger appends: "always" (every append) or "never" (leave it to the OS)
+LEDGER_FSYNC = "always"
+
+# Ensure directories exist
+os.makedirs(LEDGER_DIR, exist_ok=True)
+
+# Function to get the ledger file name for an account
+def ledger_file_name(account_number):
+    """
+    Get the ledger file name for an account number
+    """
+    return f"{os.path.basename(str(account_number))}.jsonl"
+
+# Function to get the ledger path for a ledger file name
+def ledger_path(file_name):
+    return os.path.join(LEDGER_DIR, os.path.basename(file_name))
+
+# Function to encode ledger records
+def _encode(records):
+    return "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+
+# Function to append records to a ledger
+def append_entries(file_name, records, fsync=None):
+    """
+    Append records to a ledger with a single O_APPEND write
+    fsync overrides LEDGER_FSYNC (the write-ahead log passes False and syncs at checkpoint)
+    Raises OSError if the write fails or is short
+    """
+    _append_file(ledger_path(file_name), _encode(records), fsync)
+
+# Function to append encoded records to a file
+def _append_file(path, data, fsync=None):
+    if not data:
+        return
+    if fsync is None:
+        fsync = LEDGER_FSYNC == "always"
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        written = os.write(fd, data)
+        if written != len(data):
+            raise OSError(f"Short write to {path}: {written} of {len(data)} bytes")
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Function to flush a ledger to disk
+def sync_entries(file_name):
+    """
+    fsync a ledger that was appended to without syncing
+    """
+    _sync_file(ledger_path(file_name))
+
+# Function to fsync a file if it exists
+def _sync_file(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Function to drop a torn last line from a ledger
+def repair_entries(file_name):
+    """
+    Truncate a ledger after its last complete line (a crash can leave half a record)
+    Returns the number of complete records in the ledger
+    """
+    path = ledger_path(file_name)
+    try:
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                f.truncate(end)
+            return data.count(b"\n")
+    except FileNotFoundError:
+        return 0
+
+# Function to replace the contents of a ledger
+def write_entries(file_name, records):
+    """
+    Atomically replace a ledger with the given records
+    Used when moving embedded transaction lists out of a user document
+    """
+    with tempfile.NamedTemporaryFile(mode='wb', dir=LEDGER_DIR, delete=False) as temp_file:
+        temp_file.write(_encode(records))
+        temp_file.flush()
+        if LEDGER_FSYNC == "always":
+            os.fsync(temp_file.fileno())
+    try:
+        os.replace(temp_file.name, ledger_path(file_name))
+    except Exception:
+        os.unlink(temp_file.name)
+        raise
+
+# Function to read a ledger
+def read_entries(file_name):
+    """
+    Iterate over the records of a ledger, oldest first
+    A torn last line (crash during append) is skipped
+    """
+    try:
+        with open(ledger_path(file_name), 'r') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Error reading ledger {file_name}: {e}")
+    except FileNotFoundError:
+        return
+
+# Size of the blocks read_entries_reverse reads from the end of a ledger
+REVERSE_READ_BLOCK = 64 * 1024
+
+# Function to read the newest records of a ledger
+def read_entries_reverse(file_name, limit, before=None):
+    """
+    Read up to limit records from the end of a ledger, newest first
+    The file is read backwards in blocks, so the cost depends on limit, not on
+    the ledger's length. before is the cursor returned by a previous call
+    (a byte offset) to continue with older records
+    Returns (records, cursor); cursor is None once the oldest record was returned
+    """
+    try:
+        f = open(ledger_path(file_name), 'rb')
+    except FileNotFoundError:
+        return [], None
+
+    records = []
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        buffer_start = size if before is None else max(0, min(int(before), size))
+        buffer = b""
+        # A cursor is always on a line boundary; the end of the file may be a torn line
+        trimmed = before is not None
+
+        while len(records) < limit:
+            newline = buffer.rfind(b"\n", 0, len(buffer) - 1) if trimmed else buffer.rfind(b"\n")
+            if newline == -1 and buffer_start > 0:
+                start = max(0, buffer_start - REVERSE_READ_BLOCK)
+                f.seek(start)
+                buffer = f.read(buffer_start - start) + buffer
+                buffer_start = start
+                continue
+
+            if not trimmed:
+                # Drop a torn last line (crash during append)
+                buffer = buffer[:newline + 1]
+                trimmed = True
+                continue
+            if not buffer:
+                break
+
+            line = buffer[newline + 1:-1]
+            buffer = buffer[:newline + 1]
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    print(f"Error reading ledger {file_name}: {e}")
+
+    end = buffer_start + len(buffer)
+    return records, (end if end > 0 else None)
+
+# Function to get the day partition of a timestamp
+def partition_name(timestamp):
+    """
+    Get the partition a record with this ISO timestamp belongs to (YYYY-MM-DD or "undated")
+    """
+    day = str(timestamp or "")[:10]
+    if len(day) == 10 and day[4] == "-" and day[7] == "-":
+        return day
+    return UNDATED_PARTITION
+
+# Function to append rows to the day partitions
+def append_partitioned(rows, fsync=None, partition_dir=None):
+    """
+    Append rows (dictionaries with a "transaction" record) to the partitions of
+    their transactions' days, one O_APPEND write per day
+    The partition directory must exist (it is created by a rebuild)
+    Returns set of the partition names written
+    """
+    days = {}
+    for row in rows:
+        days.setdefault(partition_name(row["transaction"].get("timestamp")), []).append(row)
+
+    for day, day_rows in days.items():
+        _append_file(os.path.join(partition_dir or PARTITION_DIR, f"{day}.jsonl"), _encode(day_rows), fsync)
+    return set(days)
+
+# Function to flush day partitions to disk
+def sync_partitions(names):
+    for name in names:
+        _sync_file(os.path.join(PARTITION_DIR, f"{name}.jsonl"))
+
+# Function to list the partitions overlapping a time range
+def partitions_in_range(start=None, end=None):
+    """
+    Names of the day partitions that can hold records with start <= timestamp < end
+    (ISO strings; None leaves that side open), oldest first
+    The undated partition is only part of an unbounded query
+    """
+    try:
+        names = sorted(name[:-len(".jsonl")] for name in os.listdir(PARTITION_DIR) if name.endswith(".jsonl"))
+    except FileNotFoundError:
+        return []
+
+    partitions = []
+    for name in names:
+        if name == UNDATED_PARTITION:
+            if start is None and end is None:
+                partitions.append(name)
+            continue
+        if start is not None and name < start[:10]:
+            continue
+        # A range ending exactly at midnight does not touch that day
+        if end is not None and f"{name}T00:00:00" >= end:
+            continue
+        partitions.append(name)
+    return partitions
+
+# Function to read the records of a time range from the day partitions
+def read_partitioned(start=None, end=None):
+    """
+    Iterate over the partitioned rows with start <= transaction timestamp < end
+    (ISO strings; None leaves that side open), oldest first
+    Only the partitions the range overlaps are read. A record appended twice
+    (replayed after a crash) is returned once
+    """
+    for name in partitions_in_range(start, end):
+        rows = []
+        seen = set()
+        try:
+            with open(os.path.join(PARTITION_DIR, f"{name}.jsonl"), 'r') as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        print(f"Error reading partition {name}: {e}")
+                        continue
+
+                    timestamp = row["transaction"].get("timestamp") or ""
+                    if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                        continue
+                    key = (row.get("account_number"), row["transaction"].get("transaction_id"))
+                    if key[1] is not None:
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                    rows.append(row)
+        except FileNotFoundError:
+            continue
+
+        # Concurrent commits can land slightly out of order within a day
+        rows.sort(key=lambda row: row["transaction"].get("timestamp") or "")
+        yield from rows
@@ -0,0 +1,163 @@
+"""
+Columnar loan book for portfolio-wide loan analytics
+
+build_loan_book reads every loan in the user store once into NumPy columns
+(one array per field). Outstanding principal, installments paid and next due
+dates are then computed for all loans at once with utils.amortization instead
+of looping over users in Python.
+
+The extracted book is cached per process. add_loan and update_loan_status bump
+the loan generation in utils.db, which invalidates it; changes made by other
+processes are picked up after LOAN_BOOK_MAX_AGE seconds.
+"""
+import time
+import threading
+from datetime import datetime
+
+from utils.lazy_imports import lazy_import
+from utils.db import iter_users, get_loan_generation
+from utils import amortization
+
+# NumPy and pandas are imported the first time the book is built
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# How long a cached book is used before it is rebuilt to pick up other processes' changes (seconds)
+LOAN_BOOK_MAX_AGE = 300
+
+# Loan statuses that are being repaid
+ACTIVE_LOAN_STATUSES = ("approved",)
+
+_book_lock = threading.Lock()
+_book = None   # (generation, built_at, columns)
+
+# Function to read all loans into columns
+def build_loan_book():
+    """
+    Read every loan in the store into one array per field
+    Returns dictionary of arrays: user_id, loan_id, type and status (categorical),
+    amount, interest_rate, tenure, emi and start (repayment start as datetime64[s])
+    """
+    user_ids, loan_ids, types, statuses = [], [], [], []
+    amounts, rates, tenures, emis, starts = [], [], [], [], []
+
+    for user_id, user_data in iter_users(fields=("loans",)):
+        for loan in user_data.get("loans") or []:
+            user_ids.append(user_id)
+            loan_ids.append(loan.get("loan_id"))
+            types.append(loan.get("type"))
+            statuses.append(loan.get("status"))
+            amounts.append(loan.get("amount") or 0)
+            rates.append(loan.get("interest_rate") or 0)
+            tenures.append(loan.get("tenure") or 0)
+            emis.append(loan.get("emi") or 0)
+            # Repayment starts when the loan is approved (updated_at), else at application
+            starts.append((loan.get("updated_at") or loan.get("timestamp") or "")[:19] or "NaT")
+
+    return {
+        "user_id": np.array(user_ids, dtype=object),
+        "loan_id": np.array(loan_ids, dtype=object),
+        "type": pd.Categorical(types),
+        "status": pd.Categorical(statuses),
+        "amount": np.array(amounts, dtype=float),
+        "interest_rate": np.array(rates, dtype=float),
+        "tenure": np.array(tenures, dtype=float),
+        "emi": np.array(emis, dtype=float),
+        "start": np.array(starts, dtype="datetime64[s]"),
+    }
+
+# Function to get the cached loan book
+def get_loan_book():
+    """
+    Get the loan book, rebuilding it after a loan changed in this process or
+    after LOAN_BOOK_MAX_AGE seconds
+    Returns dictionary of arrays (see build_loan_book; do not modify)
+    """
+    global _book
+    generation = get_loan_generation()
+    with _book_lock:
+        if _book is not None and _book[0] == generation and time.monotonic() - _book[1] < LOAN_BOOK_MAX_AGE:
+            return _book[2]
+
+        columns = build_loan_book()
+        _book = (generation, time.monotonic(), columns)
+        return columns
+
+# Function to clear the cached loan book
+def invalidate_loan_book():
+    global _book
+    with _book_lock:
+        _book = None
+
+# Function to compute repayment columns for every loan
+def _positions(book, as_of):
+    as_of = np.datetime64(as_of or datetime.now(), "s")
+
+    status = book["status"]
+    active_codes = [status.categories.get_loc(s) for s in ACTIVE_LOAN_STATUSES if s in status.categories]
+    active = np.isin(status.codes, active_codes) & (book["tenure"] > 0)
+
+    # Whole months since repayment started (the first installment is due one month in)
+    start_months = book["start"].astype("datetime64[M]")
+    elapsed = (as_of.astype("datetime64[M]") - start_months).astype(float)
+    elapsed -= (as_of - as_of.astype("datetime64[M]")) < (book["start"] - start_months)
+    paid = np.where(active, np.clip(np.nan_to_num(elapsed), 0, book["tenure"]), 0)
+
+    tenure = np.maximum(book["tenure"], 1)
+    outstanding = np.where(
+        active, amortization.outstanding_balance(book["amount"], book["interest_rate"], tenure, paid), 0.0
+    )
+    emi = np.where(book["emi"] > 0, book["emi"], amortization.calculate_emi(book["amount"], book["interest_rate"], tenure))
+
+    remaining = np.where(active, book["tenure"] - paid, 0)
+    next_due = np.where(
+        remaining > 0,
+        (start_months + (paid + 1).astype(int).astype("timedelta64[M]")).astype("datetime64[D]")
+        + (book["start"].astype("datetime64[D]") - start_months.astype("datetime64[D]")),
+        np.datetime64("NaT", "D")
+    )
+
+    return {
+        "emi": emi,
+        "installments_paid": paid,
+        "remaining_installments": remaining,
+        "outstanding": outstanding,
+        "next_due": next_due,
+    }
+
+# Function to compute repayment state for every loan
+def loan_positions(as_of=None, book=None):
+    """
+    Installments paid, outstanding principal and next due date of every loan as of a date
+    Loans that are not active have nothing outstanding
+    Returns pandas DataFrame with one row per loan
+    """
+    book = get_loan_book() if book is None else book
+    columns = {name: book[name] for name in ("user_id", "loan_id", "type", "status", "amount", "interest_rate", "tenure")}
+    columns.update(_positions(book, as_of))
+    return pd.DataFrame(columns)
+
+# Function to report exposure across the loan book
+def loan_exposure(as_of=None, group_by="type", book=None):
+    """
+    Totals across the loan book grouped by a column (type or status)
+    Returns pandas DataFrame with loans, principal, outstanding and monthly_emi per group
+    """
+    book = get_loan_book() if book is None else book
+    positions = _positions(book, as_of)
+
+    # Only the grouping and numeric columns are needed, not the string IDs
+    df = pd.DataFrame({
+        group_by: book[group_by],
+        "amount": book["amount"],
+        "outstanding": positions["outstanding"],
+        "monthly_emi": np.where(positions["remaining_installments"] > 0, positions["emi"], 0.0),
+    })
+
+    return (
+        df.groupby(group_by, observed=True, dropna=False)
+        .agg(loans=("amount", "size"), principal=("amount", "sum"),
+             outstanding=("outstanding", "sum"), monthly_emi=("monthly_emi", "sum"))
+        .reset_index()
+        .sort_values("outstanding", ascending=False)
+    )
@@ -0,0 +1,57 @@
+"""
+Copy the JSON data directory into the SQLite engine
+
+Reads every user file in data/users together with its account ledgers (or the
+transaction lists still embedded in older files) and writes them to the SQLite
+database. Users that already exist in the database are overwritten; transaction
+rows are only inserted for accounts that have none yet, so the tool can be
+re-run safely.
+
+Run from the repository root:
+    python -m utils.migrate_storage [--sqlite-path data/nuvana.db]
+
+Then select the engine with NUVANA_STORAGE_BACKEND=sqlite.
+"""
+import argparse
+
+from utils import db
+from utils import sqlite_db
+
+# Function to migrate the JSON store into SQLite
+def migrate_json_to_sqlite():
+    """
+    Copy all users and their transactions from the JSON engine to the SQLite engine
+    Returns (success, message) tuple
+    """
+    # Read through the JSON engine regardless of the configured backend
+    backend = db.STORAGE_BACKEND
+    db.STORAGE_BACKEND = "json"
+    try:
+        user_ids = [user_id for user_id, _ in db.iter_users(fields=())]
+        migrated = 0
+        for user_id in user_ids:
+            user_data = db.load_user_data(user_id, include_transactions=True)
+            if not user_data:
+                continue
+
+            success, message = sqlite_db.save_user_data(user_data)
+            if not success:
+                return False, f"Error migrating user {user_id}: {message}"
+            migrated += 1
+    finally:
+        db.STORAGE_BACKEND = backend
+
+    return True, f"Migrated {migrated} users to {sqlite_db.SQLITE_PATH}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the JSON data directory into the SQLite engine")
+    parser.add_argument("--sqlite-path", default=sqlite_db.SQLITE_PATH, help="SQLite database to write")
+    args = parser.parse_args()
+
+    sqlite_db.SQLITE_PATH = args.sqlite_path
+    success, message = migrate_json_to_sqlite()
+    print(message)
+    raise SystemExit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
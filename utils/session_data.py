@@ -0,0 +1,85 @@
+"""
+Session-scoped data layer for the Streamlit pages
+
+Streamlit re-runs the whole script on every interaction. Instead of reloading
+the user document each time, the session keeps a pickled copy together with the
+document's version number and only refetches when get_user_version reports a
+newer one; each rerun gets its own unpickled copy, so a page that edits it does
+not change what later reruns see. Session-only values (last_activity, theme) are kept in the session
+and written to the user document in batches, at most every
+SESSION_FLUSH_INTERVAL seconds and at logout.
+
+The functions take the session state as an argument (st.session_state in the
+app) so they work with any dictionary-like object.
+"""
+import pickle
+import time
+from datetime import datetime
+
+from utils.db import load_user_data, get_user_version, atomic_transaction
+
+# How often pending session-only values are written to the user document (seconds)
+SESSION_FLUSH_INTERVAL = 60
+
+# Function to get the signed-in user's data for this rerun
+def get_session_user(session_state, user_id):
+    """
+    Get the user document for the session, refetching only when the version on disk changed
+    Returns a copy of the user data dictionary (changes are not seen by later reruns)
+    or None if the user does not exist
+    """
+    version = get_user_version(user_id)
+    if version is None:
+        session_state["user_data"] = None
+        session_state["user_payload"] = None
+        session_state["user_version"] = None
+        return None
+
+    cached = session_state.get("user_data")
+    cached_payload = session_state.get("user_payload")
+    if cached is not None and cached_payload is not None and cached.get("user_id") == user_id \
+            and session_state.get("user_version") == version:
+        return pickle.loads(cached_payload)
+
+    user_data = load_user_data(user_id)
+    payload = pickle.dumps(user_data, pickle.HIGHEST_PROTOCOL) if user_data else None
+    session_state["user_data"] = user_data
+    session_state["user_payload"] = payload
+    session_state["user_version"] = user_data.get("version", 0) if user_data else None
+    return pickle.loads(payload) if payload else None
+
+# Function to set a session-only value
+def set_session_value(session_state, key, value):
+    """
+    Set a value in the session and queue it for the next batched write
+    """
+    session_state[key] = value
+    pending = session_state.get("pending_writes") or {}
+    pending[key] = value
+    session_state["pending_writes"] = pending
+
+# Function to write pending session-only values
+def flush_session_writes(session_state, user_id, force=False):
+    """
+    Write queued session-only values into the user document's "session" field
+    Does nothing until SESSION_FLUSH_INTERVAL has passed since the last write, unless force is True
+    Returns (success, message) tuple
+    """
+    pending = session_state.get("pending_writes")
+    if not pending or not user_id:
+        return True, "Nothing to write"
+
+    if not force and time.monotonic() - session_state.get("session_flushed_at", 0) < SESSION_FLUSH_INTERVAL:
+        return True, "Write deferred"
+
+    def transaction_func(user_data):
+        session = user_data.setdefault("session", {})
+        for key, value in pending.items():
+            session[key] = value.isoformat() if isinstance(value, datetime) else value
+        return True, user_data, "Session data saved"
+
+    success, message = atomic_transaction(user_id, transaction_func)
+    if success:
+        session_state["pending_writes"] = {}
+        session_state["session_flushed_at"] = time.monotonic()
+    return success, message
@@ -0,0 +1,264 @@
+"""
+Server-side login sessions shared by all Streamlit workers
+
+Each session is a small JSON file in data/sessions named by its session ID
+(utils.security.generate_session_id). The file's modification time is the
+session's expiry time, so checking whether a session is still valid is one
+os.stat, and extending it is one os.utime; the file is only read when this
+worker has not seen it yet. A marker file in data/sessions/by_user/<user_id>/
+lets all sessions of a user be revoked without scanning every session.
+
+Workers keep recently validated sessions in memory (hot tier). The entry is
+only trusted while the file still exists with the same inode, so a revoke
+from any worker takes effect on the next request. A background thread deletes
+expired session files every SESSION_SWEEP_INTERVAL seconds.
+
+The browser only holds the session ID in st.session_state, so a session does
+not survive a reconnect or a worker restart: the user logs in again. Resuming
+would need an HttpOnly cookie, which Streamlit cannot set (it has no API for
+response headers), and a URL or JavaScript-readable cookie would expose the ID.
+What the store provides is expiry and revocation that every worker sees.
+"""
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from utils.security import generate_session_id
+
+# Base directory for sessions
+DATA_DIR = "data"
+SESSIONS_DIR = os.path.join(DATA_DIR, "sessions")
+SESSIONS_BY_USER_DIR = os.path.join(SESSIONS_DIR, "by_user")
+
+# Idle time after which a session expires (seconds)
+SESSION_TIMEOUT = 1800
+
+# A session's expiry is only pushed back once this much of it has been used
+# (seconds), so most requests do not touch the disk
+SESSION_TOUCH_INTERVAL = 60
+
+# How often the sweeper deletes expired session files (seconds)
+SESSION_SWEEP_INTERVAL = 300
+
+# Number of sessions kept in memory per worker
+SESSION_CACHE_SIZE = 10000
+
+# Ensure directories exist
+os.makedirs(SESSIONS_BY_USER_DIR, exist_ok=True)
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+_hot_lock = threading.Lock()
+_hot = OrderedDict()   # session_id -> (inode, session record)
+_sweeper_lock = threading.Lock()
+_sweeper = None
+
+# Function to get the file of a session
+def _session_path(session_id):
+    return os.path.join(SESSIONS_DIR, f"{session_id}.json")
+
+# Function to get the marker file of a user's session
+def _marker_path(user_id, session_id):
+    return os.path.join(SESSIONS_BY_USER_DIR, os.path.basename(str(user_id)), session_id)
+
+# Function to start the background sweeper once per process
+def _ensure_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        return
+
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_loop, name="session-sweeper", daemon=True)
+            _sweeper.start()
+
+# Background sweeper
+def _sweep_loop():
+    while True:
+        time.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            sweep_expired_sessions()
+        except Exception as e:
+            print(f"Error sweeping sessions: {e}")
+
+# Function to put a session in the hot tier
+def _hot_put(session_id, inode, session):
+    with _hot_lock:
+        _hot[session_id] = (inode, session)
+        _hot.move_to_end(session_id)
+        while len(_hot) > SESSION_CACHE_SIZE:
+            _hot.popitem(last=False)
+
+# Function to drop a session from the hot tier
+def _hot_discard(session_id):
+    with _hot_lock:
+        _hot.pop(session_id, None)
+
+# Function to create a session
+def create_session(user_id, data=None):
+    """
+    Create a session for a signed-in user
+    Returns the new session ID
+    """
+    _ensure_sweeper()
+    session_id = generate_session_id()
+    session = {
+        "session_id": session_id,
+        "user_id": user_id,
+        "created_at": datetime.now().isoformat(),
+        "data": data or {},
+    }
+
+    marker = _marker_path(user_id, session_id)
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, 'w'):
+        pass
+
+    path = _session_path(session_id)
+    with tempfile.NamedTemporaryFile(mode='w', dir=SESSIONS_DIR, suffix=".tmp", delete=False) as temp_file:
+        json.dump(session, temp_file)
+    now = time.time()
+    os.utime(temp_file.name, (now, now + SESSION_TIMEOUT))
+    os.replace(temp_file.name, path)
+
+    _hot_put(session_id, os.stat(path).st_ino, session)
+    return session_id
+
+# Function to validate a session
+def validate_session(session_id):
+    """
+    Check a session on each request and extend its expiry
+    One stat of the session file; the file is only read on this worker's first sight of it
+    Returns the session record or None if it is unknown, revoked or expired
+    """
+    if not session_id or not _SESSION_ID.match(session_id):
+        return None
+    _ensure_sweeper()
+
+    path = _session_path(session_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _hot_discard(session_id)
+        return None
+
+    now = time.time()
+    if stat.st_mtime <= now:
+        _remove_session(session_id)
+        return None
+
+    with _hot_lock:
+        entry = _hot.get(session_id)
+        if entry is not None and entry[0] == stat.st_ino:
+            _hot.move_to_end(session_id)
+            session = entry[1]
+        else:
+            session = None
+
+    if session is None:
+        try:
+            with open(path, 'r') as f:
+                session = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        _hot_put(session_id, stat.st_ino, session)
+
+    # Sliding expiry, written at most once per SESSION_TOUCH_INTERVAL
+    if stat.st_mtime - now < SESSION_TIMEOUT - SESSION_TOUCH_INTERVAL:
+        try:
+            os.utime(path, (now, now + SESSION_TIMEOUT))
+        except FileNotFoundError:
+            return None
+
+    return session
+
+# Function to delete a session's files
+def _remove_session(session_id, user_id=None):
+    path = _session_path(session_id)
+    if user_id is None:
+        try:
+            with open(path, 'r') as f:
+                user_id = json.load(f).get("user_id")
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    removed = False
+    try:
+        os.unlink(path)
+        removed = True
+    except FileNotFoundError:
+        pass
+    if user_id is not None:
+        marker = _marker_path(user_id, session_id)
+        try:
+            os.unlink(marker)
+            # Drop the user's directory once their last session is gone
+            os.rmdir(os.path.dirname(marker))
+        except OSError:
+            pass
+    _hot_discard(session_id)
+    return removed
+
+# Function to revoke a session
+def revoke_session(session_id):
+    """
+    Revoke one session (logout)
+    Returns True if the session existed
+    """
+    if not session_id or not _SESSION_ID.match(session_id):
+        return False
+    return _remove_session(session_id)
+
+# Function to revoke many sessions
+def revoke_sessions(session_ids):
+    """
+    Revoke several sessions at once
+    Returns the number of sessions revoked
+    """
+    return sum(1 for session_id in session_ids if revoke_session(session_id))
+
+# Function to revoke all sessions of a user
+def revoke_user_sessions(user_id):
+    """
+    Revoke every session of a user, e.g. after a password reset
+    Only the user's own marker directory is listed
+    Returns the number of sessions revoked
+    """
+    marker_dir = os.path.join(SESSIONS_BY_USER_DIR, os.path.basename(str(user_id)))
+    try:
+        session_ids = os.listdir(marker_dir)
+    except FileNotFoundError:
+        return 0
+
+    revoked = sum(1 for session_id in session_ids if _remove_session(session_id, user_id))
+    try:
+        os.rmdir(marker_dir)
+    except OSError:
+        # New sessions were created meanwhile
+        pass
+    return revoked
+
+# Function to delete expired sessions
+def sweep_expired_sessions():
+    """
+    Delete the files of expired sessions (only their modification times are checked)
+    Returns the number of sessions removed
+    """
+    now = time.time()
+    removed = 0
+    with os.scandir(SESSIONS_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                expired = entry.stat().st_mtime <= now
+            except FileNotFoundError:
+                continue
+            if expired and _remove_session(entry.name[:-len(".json")]):
+                removed += 1
+    return removed
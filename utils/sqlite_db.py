@@ -0,0 +1,530 @@
+"""
+SQLite storage engine for utils.db
+
+Selected with STORAGE_BACKEND = "sqlite" in utils/db.py (or the
+NUVANA_STORAGE_BACKEND environment variable). Implements the engine functions
+listed in utils.db.ENGINE_FUNCTIONS; the business operations (add_transaction,
+add_loan, update_loan_status, transfer_funds) are shared by both engines and
+run through atomic_transaction, which here is a single SQLite transaction.
+
+User documents are stored as JSON in the users table. Account numbers, loans
+and transactions are kept in their own indexed tables.
+"""
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Database location
+DATA_DIR = "data"
+SQLITE_PATH = os.path.join(DATA_DIR, "nuvana.db")
+
+# How long a writer waits for the database lock (seconds)
+SQLITE_BUSY_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    email TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+
+CREATE TABLE IF NOT EXISTS accounts (
+    account_number TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    account_index INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_user ON accounts(user_id);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_number TEXT NOT NULL,
+    transaction_id TEXT,
+    type TEXT,
+    amount REAL,
+    timestamp TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions(account_number, seq);
+CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions(timestamp);
+
+CREATE TABLE IF NOT EXISTS loans (
+    loan_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status TEXT,
+    type TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_loans_status ON loans(status, timestamp);
+CREATE INDEX IF NOT EXISTS idx_loans_user ON loans(user_id);
+"""
+
+# Raised inside atomic_transaction to roll back after a failed save
+class _SaveFailed(Exception):
+    pass
+
+# One connection per thread; transactions nest through a depth counter
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+# Function to get the connection for the current thread
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == SQLITE_PATH:
+        return conn
+
+    os.makedirs(os.path.dirname(SQLITE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    with _schema_lock:
+        if SQLITE_PATH not in _schema_ready:
+            conn.executescript(SCHEMA)
+            _schema_ready.add(SQLITE_PATH)
+
+    _local.conn = conn
+    _local.path = SQLITE_PATH
+    _local.depth = 0
+    return conn
+
+# Function to run statements in one transaction
+@contextmanager
+def transaction():
+    """
+    Run the body in a single write transaction (BEGIN IMMEDIATE)
+    Nested uses join the outermost transaction
+    """
+    conn = _connect()
+    if _local.depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+    _local.depth += 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.execute("ROLLBACK")
+            _local.pending = []
+        raise
+    else:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.execute("COMMIT")
+
+# Function to queue transaction rows for the next save
+def queue_transactions(account_number, records):
+    """
+    Queue transaction records to be inserted by the next save_user_data on this thread
+    """
+    if not hasattr(_local, "pending"):
+        _local.pending = []
+    _local.pending.extend((account_number, record) for record in records)
+
+# Function to take the queued transaction rows
+def _take_pending():
+    pending = getattr(_local, "pending", None) or []
+    _local.pending = []
+    return pending
+
+# Function to insert transaction rows
+def _insert_transactions(conn, rows):
+    conn.executemany(
+        "INSERT INTO transactions (account_number, transaction_id, type, amount, timestamp, doc) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                account_number,
+                record.get("transaction_id"),
+                record.get("type"),
+                record.get("amount"),
+                record.get("timestamp"),
+                json.dumps(record),
+            )
+            for account_number, record in rows
+        ],
+    )
+
+# Function to read the transactions of an account
+def _read_transactions(conn, account_number):
+    rows = conn.execute(
+        "SELECT doc FROM transactions WHERE account_number = ? ORDER BY seq", (account_number,)
+    )
+    return [json.loads(doc) for (doc,) in rows]
+
+# Function to read the transactions of an account by account number
+def read_account_transactions(account_number):
+    """
+    Get the stored transactions of an account, oldest first
+    Rows queued for the current save are not included
+    """
+    return _read_transactions(_connect(), account_number)
+
+# Function to load user data
+def load_user_data(user_id, include_transactions=False):
+    """
+    Load user data from the users table
+    Returns user data dictionary or None if not found
+    """
+    if not user_id:
+        return None
+
+    try:
+        conn = _connect()
+        row = conn.execute("SELECT doc FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+
+        user_data = json.loads(row[0])
+        if include_transactions:
+            for account in user_data.get("accounts", []):
+                account["transactions"] = _read_transactions(conn, account.get("account_number"))
+        return user_data
+    except Exception as e:
+        print(f"Error loading user data: {e}")
+        return None
+
+# Function to get the transactions of an account
+def get_account_transactions(user_id, account_index):
+    """
+    Get the transaction history of one account, oldest first
+    Returns list of transactions (empty if the account is not found)
+    """
+    conn = _connect()
+    row = conn.execute(
+        "SELECT account_number FROM accounts WHERE user_id = ? AND account_index = ?", (user_id, account_index)
+    ).fetchone()
+    return _read_transactions(conn, row[0]) if row else []
+
+# Function to get the newest transactions of an account
+def get_recent_transactions(user_id, account_index, limit=5, cursor=None):
+    """
+    Get the newest transactions of an account, walking the (account_number, seq)
+    index backwards; the cursor is the seq of the last row returned
+    Returns (transactions newest first, cursor or None when there are no older ones)
+    """
+    conn = _connect()
+    row = conn.execute(
+        "SELECT account_number FROM accounts WHERE user_id = ? AND account_index = ?", (user_id, account_index)
+    ).fetchone()
+    if row is None:
+        return [], None
+
+    # One extra row tells whether an older page exists
+    rows = conn.execute(
+        "SELECT seq, doc FROM transactions WHERE account_number = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+        (row[0], cursor if cursor is not None else 2 ** 63 - 1, limit + 1),
+    ).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [json.loads(doc) for _, doc in rows], (rows[-1][0] if more else None)
+
+# Function to save user data
+def save_user_data(user_data):
+    """
+    Save user data and refresh its account and loan rows
+    Transactions queued by queue_transactions are inserted in the same transaction
+    Returns (success, message) tuple
+    """
+    if not user_data or "user_id" not in user_data:
+        return False, "Invalid user data"
+
+    user_id = user_data["user_id"]
+
+    try:
+        with transaction() as conn:
+            rows = _take_pending()
+
+            # Transactions embedded in the document (new registrations, migrated
+            # files) are moved into the table unless the account already has rows
+            user_data = dict(user_data)
+            accounts = []
+            for account in user_data.get("accounts", []):
+                account = dict(account)
+                account.pop("ledger", None)
+                embedded = account.pop("transactions", None)
+                if embedded:
+                    exists = conn.execute(
+                        "SELECT 1 FROM transactions WHERE account_number = ? LIMIT 1", (account.get("account_number"),)
+                    ).fetchone()
+                    if not exists:
+                        rows = [(account.get("account_number"), record) for record in embedded] + rows
+                accounts.append(account)
+            if "accounts" in user_data:
+                user_data["accounts"] = accounts
+
+            # Versions only go up, even if the caller saves a stale copy
+            row = conn.execute("SELECT json_extract(doc, '$.version') FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            current = row[0] if row and row[0] is not None else 0
+            user_data["version"] = max(current, user_data.get("version", 0)) + 1
+
+            conn.execute(
+                "INSERT OR REPLACE INTO users (user_id, email, doc) VALUES (?, ?, ?)",
+                (user_id, user_data.get("email"), json.dumps(user_data)),
+            )
+
+            conn.execute("DELETE FROM accounts WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO accounts (account_number, user_id, account_index) VALUES (?, ?, ?)",
+                [
+                    (account["account_number"], user_id, i)
+                    for i, account in enumerate(accounts)
+                    if account.get("account_number")
+                ],
+            )
+
+            conn.execute("DELETE FROM loans WHERE user_id = ?", (user_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO loans (loan_id, user_id, status, type, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (loan["loan_id"], user_id, loan.get("status"), loan.get("type"), loan.get("timestamp"))
+                    for loan in user_data.get("loans", [])
+                    if loan.get("loan_id")
+                ],
+            )
+
+            _insert_transactions(conn, rows)
+
+        return True, "User data saved successfully"
+    except Exception as e:
+        print(f"Error saving user data: {e}")
+        return False, f"Error saving user data: {str(e)}"
+
+# Function to get the version of a user document
+def get_user_version(user_id):
+    """
+    Get the version number of a user document, bumped by every save
+    Returns the version or None if the user does not exist
+    """
+    if not user_id:
+        return None
+
+    row = _connect().execute(
+        "SELECT COALESCE(json_extract(doc, '$.version'), 0) FROM users WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+# Function to get all users
+def get_all_users():
+    """
+    Get all users
+    Returns dictionary of user_id -> user_data
+    """
+    try:
+        rows = _connect().execute("SELECT user_id, doc FROM users")
+        return {user_id: json.loads(doc) for user_id, doc in rows}
+    except Exception as e:
+        print(f"Error listing users: {e}")
+        return {}
+
+# Function to iterate over users
+def iter_users(fields=None, predicate=None, page_size=500, start_after=None):
+    """
+    Iterate over users one page at a time (keyset pagination on user_id)
+    fields limits each yielded document to those keys (plus user_id)
+    predicate is called with the full document; users it rejects are skipped
+    Yields (user_id, user_data) tuples in user ID order
+    """
+    conn = _connect()
+    last = start_after if start_after is not None else ""
+
+    while True:
+        rows = conn.execute(
+            "SELECT user_id, doc FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (last, page_size)
+        ).fetchall()
+        if not rows:
+            return
+
+        for user_id, doc in rows:
+            user_data = json.loads(doc)
+            if predicate is not None and not predicate(user_data):
+                continue
+            if fields is not None:
+                user_data = {field: user_data[field] for field in fields if field in user_data}
+                user_data["user_id"] = user_id
+            yield user_id, user_data
+
+        last = rows[-1][0]
+
+# Function to perform atomic transaction
+def atomic_transaction(user_id, transaction_func, *args, **kwargs):
+    """
+    Perform an atomic transaction on user data inside one SQLite transaction
+    transaction_func should be a function that takes user_data as first argument
+    and returns (success, modified_user_data, message)
+
+    Returns (success, message) tuple
+    """
+    if not user_id:
+        return False, "Invalid user ID"
+
+    try:
+        with transaction():
+            user_data = load_user_data(user_id)
+
+            if not user_data:
+                return False, "User not found"
+
+            success, modified_user_data, message = transaction_func(user_data, *args, **kwargs)
+
+            if not success:
+                return False, message
+
+            save_success, save_message = save_user_data(modified_user_data)
+
+            if not save_success:
+                # Undo anything written so far in this transaction
+                raise _SaveFailed(save_message)
+
+            return True, message
+    except sqlite3.OperationalError as e:
+        print(f"Error locking user data: {e}")
+        return False, "Account is busy, please try again"
+    except _SaveFailed as e:
+        return False, str(e)
+    finally:
+        if _local.depth == 0:
+            _take_pending()
+
+# Function to perform an atomic transaction on several users
+def atomic_multi_transaction(user_ids, transaction_func, *args, **kwargs):
+    """
+    Perform an atomic transaction on several users inside one SQLite transaction
+    transaction_func should be a function that takes a dictionary of user_id -> user_data
+    as first argument and returns (success, modified_users, message)
+
+    Returns (success, message) tuple
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids or not all(user_ids):
+        return False, "Invalid user ID"
+
+    try:
+        with transaction():
+            users = {}
+            for user_id in user_ids:
+                users[user_id] = load_user_data(user_id)
+                if not users[user_id]:
+                    return False, "User not found"
+
+            success, modified_users, message = transaction_func(users, *args, **kwargs)
+
+            if not success:
+                return False, message
+
+            # Queued transaction rows are inserted by the first save; all of them
+            # commit or roll back together with the documents
+            for user_data in modified_users.values():
+                save_success, save_message = save_user_data(user_data)
+                if not save_success:
+                    raise _SaveFailed(save_message)
+
+            return True, message
+    except sqlite3.OperationalError as e:
+        print(f"Error locking user data: {e}")
+        return False, "Account is busy, please try again"
+    except _SaveFailed as e:
+        return False, str(e)
+    finally:
+        if _local.depth == 0:
+            _take_pending()
+
+# Function to look up a user ID by email
+def get_user_id_by_email(email):
+    """
+    Look up a user ID by email
+    Returns user_id or None if not found
+    """
+    if not email:
+        return None
+
+    row = _connect().execute("SELECT user_id FROM users WHERE email = ?", (email,)).fetchone()
+    return row[0] if row else None
+
+# Function to load a user by email
+def get_user_by_email(email):
+    """
+    Load user data for an email
+    Returns user data dictionary or None if not found
+    """
+    if not email:
+        return None
+
+    row = _connect().execute("SELECT doc FROM users WHERE email = ?", (email,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+# Function to find loans
+def find_loans(status=None, loan_type=None, start=None, end=None):
+    """
+    Find loans using the loans table
+    start and end are ISO timestamps bounding the application date (inclusive)
+    Returns list of (user_id, loan) tuples, oldest application first
+    """
+    conditions = []
+    params = []
+    for column, operator, value in (("status", "=", status), ("type", "=", loan_type),
+                                    ("timestamp", ">=", start), ("timestamp", "<=", end)):
+        if value is not None:
+            conditions.append(f"{column} {operator} ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = _connect()
+    rows = conn.execute(f"SELECT loan_id, user_id FROM loans {where} ORDER BY timestamp, loan_id", params).fetchall()
+
+    loans = []
+    users = {}
+    for loan_id, user_id in rows:
+        if user_id not in users:
+            users[user_id] = load_user_data(user_id) or {}
+        for loan in users[user_id].get("loans", []):
+            if loan.get("loan_id") == loan_id:
+                loans.append((user_id, loan))
+                break
+    return loans
+
+# Function to find transactions in a time range
+def find_transactions(start=None, end=None):
+    """
+    Find the transactions of all accounts with start <= timestamp < end
+    using the timestamp index (ISO timestamps; None leaves that side open)
+    Returns list of (user_id, account_number, transaction) tuples, oldest first
+    """
+    conditions = []
+    params = []
+    for operator, value in ((">=", start), ("<", end)):
+        if value is not None:
+            conditions.append(f"t.timestamp {operator} ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    rows = _connect().execute(
+        f"SELECT a.user_id, t.account_number, t.doc FROM transactions t "
+        f"LEFT JOIN accounts a ON a.account_number = t.account_number {where} ORDER BY t.timestamp, t.seq",
+        params,
+    )
+    return [(user_id, account_number, json.loads(doc)) for user_id, account_number, doc in rows]
+
+# Function to resolve account numbers
+def resolve_accounts(account_numbers):
+    """
+    Resolve account numbers to their owners
+    Returns dictionary of account_number -> (user_id, account_index) or None if not found
+    """
+    account_numbers = list(dict.fromkeys(account_numbers))
+    resolved = {number: None for number in account_numbers}
+
+    conn = _connect()
+    # Stay well below SQLite's bound-parameter limit
+    for start in range(0, len(account_numbers), 500):
+        chunk = account_numbers[start:start + 500]
+        rows = conn.execute(
+            f"SELECT account_number, user_id, account_index FROM accounts WHERE account_number IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for number, user_id, account_index in rows:
+            resolved[number] = (user_id, account_index)
+
+    return resolved
@@ -0,0 +1,442 @@
+"""
+Streaming suspicious-transaction detection
+
+Every recorded transaction is checked against ALERT_RULES as it is written
+(Home.add_transaction, utils.db add_transaction, transfer_funds and
+batch_transfer). Each account keeps a small sliding window per rule: a deque
+of (time, value) pairs with a running total, so adding a transaction and
+expiring old ones is O(1) amortized and nothing is re-read from the history.
+
+The window state is shared by every worker process: one row per account in a
+SQLite table (MONITOR_STATE_PATH), read, updated and written back in a single
+BEGIN IMMEDIATE transaction per check, so spreading transactions over workers
+does not split the windows and a restart keeps them.
+
+Rule kinds:
+
+    large_amount    one transaction of at least min_amount
+    velocity        more than max_count transactions within window seconds
+    window_sum      more than max_amount in total within window seconds
+    round_amounts   more than max_count multiples of round_to within window seconds
+    new_recipients  transfers to more than max_count recipients not paid before
+                    within window seconds (an account remembers its last
+                    MONITOR_RECIPIENTS_SIZE recipients, each for
+                    MONITOR_RECIPIENT_DAYS after the last payment)
+
+A windowed rule alerts once when its threshold is crossed and again only after
+the window has dropped back below it, so a burst gives one alert, not one per
+transaction. Alerts are appended to day files in data/alerts (YYYY-MM-DD.jsonl)
+that the admin tab reads for the selected dates.
+
+Alerts and window state for transactions recorded before this existed (or
+after changing the rules) can be regenerated with:
+
+    python -m utils.transaction_monitor --backfill
+"""
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import argparse
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Base directory for alerts
+DATA_DIR = "data"
+ALERTS_DIR = os.path.join(DATA_DIR, "alerts")
+TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transactions.json")
+ACCOUNTS_FILE = os.path.join(DATA_DIR, "accounts.json")
+
+# Rules checked for every transaction; types limits a rule to credits and/or debits
+ALERT_RULES = [
+    {"name": "Large amount", "kind": "large_amount", "types": ("credit", "debit"), "min_amount": 50000},
+    {"name": "High velocity", "kind": "velocity", "types": ("debit",), "window": 600, "max_count": 10},
+    {"name": "High volume", "kind": "window_sum", "types": ("debit",), "window": 3600, "max_amount": 200000},
+    {"name": "Round-amount burst", "kind": "round_amounts", "types": ("credit", "debit"), "window": 3600,
+     "round_to": 1000, "max_count": 5},
+    {"name": "New-recipient spike", "kind": "new_recipients", "types": ("debit",), "window": 86400, "max_count": 3},
+]
+
+# Window state shared by all workers, and how long to wait for another writer (seconds)
+MONITOR_STATE_PATH = os.path.join(DATA_DIR, "monitor_state.db")
+MONITOR_BUSY_TIMEOUT = 10
+
+# Recipients remembered per account for the new_recipients rule (most recently
+# paid are kept), and days after the last payment until one counts as new again
+MONITOR_RECIPIENTS_SIZE = 200
+MONITOR_RECIPIENT_DAYS = 180
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS monitor_state (
+    account_number TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_state_encoder = json.JSONEncoder(separators=(",", ":"))
+
+# Function to turn a timestamp into seconds
+def _seconds(timestamp):
+    if timestamp is None:
+        return datetime.now().timestamp()
+    if isinstance(timestamp, str):
+        try:
+            return datetime.fromisoformat(timestamp).timestamp()
+        except ValueError:
+            return datetime.now().timestamp()
+    return timestamp.timestamp()
+
+# Function to get this thread's connection to the state database
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == MONITOR_STATE_PATH:
+        return conn
+
+    os.makedirs(os.path.dirname(MONITOR_STATE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(MONITOR_STATE_PATH, timeout=MONITOR_BUSY_TIMEOUT, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+
+    _local.conn = conn
+    _local.path = MONITOR_STATE_PATH
+    return conn
+
+# Function to run statements in one write transaction
+@contextmanager
+def _transaction():
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+# Function to create an empty window state
+def _new_state():
+    return {
+        "rules": [rule["name"] for rule in ALERT_RULES],
+        "windows": [[deque(), 0] for _ in ALERT_RULES],
+        "armed": [True] * len(ALERT_RULES),
+        "recipients": {},   # recipient -> time last paid, least recently paid first
+    }
+
+# Function to decode a stored window state
+def _decode_state(text):
+    state = json.loads(text)
+    # State saved under different rules does not line up with the current windows
+    if state.get("rules") != [rule["name"] for rule in ALERT_RULES]:
+        return _new_state()
+    state["windows"] = [[deque(values), total] for values, total in state["windows"]]
+    return state
+
+# Function to encode a window state for storage
+def _encode_state(state):
+    return _state_encoder.encode({
+        "rules": state["rules"],
+        "windows": [[list(values), total] for values, total in state["windows"]],
+        "armed": state["armed"],
+        "recipients": state["recipients"],
+    })
+
+# Function to lock and load an account's window state
+@contextmanager
+def _account_state(account_number):
+    """
+    Load an account's window state inside a write transaction, which keeps other
+    workers out of it, and store it back when the body completes
+    """
+    with _transaction() as conn:
+        row = conn.execute("SELECT state FROM monitor_state WHERE account_number = ?", (account_number,)).fetchone()
+        state = _decode_state(row[0]) if row else _new_state()
+        yield state
+        # An in-place UPDATE is much cheaper than INSERT OR REPLACE (a delete plus an insert)
+        if row:
+            conn.execute("UPDATE monitor_state SET state = ? WHERE account_number = ?",
+                         (_encode_state(state), account_number))
+        else:
+            conn.execute("INSERT INTO monitor_state (account_number, state) VALUES (?, ?)",
+                         (account_number, _encode_state(state)))
+
+# Function to add a value to a sliding window
+def _slide(window, now, length, value):
+    """
+    Add value at time now and drop what fell out of the last length seconds
+    Returns (number of values, total) in the window
+    """
+    values = window[0]
+    if value is not None:
+        values.append((now, value))
+        window[1] += value
+    while values and values[0][0] <= now - length:
+        window[1] -= values.popleft()[1]
+    return len(values), window[1]
+
+# Function to check one rule against a transaction
+def _check_rule(rule, window, state, now, amount, recipient):
+    """
+    Returns (over, detail): whether the account is over the rule's threshold, and
+    the alert detail if this transaction is one the rule counts, else None
+    """
+    kind = rule["kind"]
+    if kind == "large_amount":
+        over = amount >= rule["min_amount"]
+        return over, (f"Amount {amount:,.2f} is at least {rule['min_amount']:,}" if over else None)
+
+    if kind == "velocity":
+        count, _ = _slide(window, now, rule["window"], 1)
+        return count > rule["max_count"], f"{count} transactions within {rule['window'] // 60} minutes"
+
+    if kind == "window_sum":
+        _, total = _slide(window, now, rule["window"], amount)
+        return total > rule["max_amount"], f"{total:,.2f} moved within {rule['window'] // 60} minutes"
+
+    if kind == "round_amounts":
+        is_round = amount >= rule["round_to"] and amount % rule["round_to"] == 0
+        count, _ = _slide(window, now, rule["window"], 1 if is_round else None)
+        return count > rule["max_count"], (f"{count} round amounts within {rule['window'] // 60} minutes"
+                                            if is_round else None)
+
+    if kind == "new_recipients":
+        is_new = False
+        if recipient is not None:
+            recipients = state["recipients"]
+            last_paid = recipients.pop(recipient, None)
+            is_new = last_paid is None or last_paid <= now - MONITOR_RECIPIENT_DAYS * 86400
+            recipients[recipient] = now
+            if len(recipients) > MONITOR_RECIPIENTS_SIZE:
+                del recipients[next(iter(recipients))]
+        count, _ = _slide(window, now, rule["window"], 1 if is_new else None)
+        return count > rule["max_count"], (f"{count} new recipients within {rule['window'] // 3600} hours"
+                                           if is_new else None)
+
+    raise ValueError(f"Unknown rule kind: {kind}")
+
+# Function to check a transaction against the rules with a given window state
+def _evaluate(state, user_id, account_number, transaction, recipient):
+    transaction_type = transaction.get("type")
+    amount = transaction.get("amount") or 0
+    timestamp = transaction.get("timestamp")
+    # Whole seconds: the stored state encodes much faster without floats
+    now = int(_seconds(timestamp))
+
+    alerts = []
+    for index, rule in enumerate(ALERT_RULES):
+        if transaction_type not in rule["types"]:
+            continue
+        over, detail = _check_rule(rule, state["windows"][index], state, now, amount, recipient)
+        if not over or detail is None:
+            if not over:
+                state["armed"][index] = True
+            continue
+
+        if rule["kind"] != "large_amount":
+            # Windowed rules alert on crossing the threshold, then re-arm once back below it
+            if not state["armed"][index]:
+                continue
+            state["armed"][index] = False
+
+        alerts.append({
+            "alert_id": uuid.uuid4().hex,
+            "rule": rule["name"],
+            "user_id": user_id,
+            "account_number": account_number,
+            "transaction_id": transaction.get("transaction_id", transaction.get("id")),
+            "type": transaction_type,
+            "amount": amount,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "detail": detail,
+        })
+    return alerts
+
+# Function to evaluate a transaction against the rules
+def evaluate_transaction(user_id, account_number, transaction, recipient=None):
+    """
+    Update the account's windows with a transaction and check every rule
+    recipient is the account paid by a transfer (None for other transactions)
+    Returns list of alert dictionaries (not saved)
+    """
+    with _account_state(account_number) as state:
+        return _evaluate(state, user_id, account_number, transaction, recipient)
+
+# Function to check new transactions and save their alerts
+def monitor_transactions(user_id, account_number, transactions, recipient=None):
+    """
+    Evaluate recorded transactions and append any alerts to the alerts store
+    Errors are reported and swallowed so a monitoring problem never fails a payment
+    Returns list of the alerts raised
+    """
+    try:
+        alerts = []
+        with _account_state(account_number) as state:
+            for transaction in transactions:
+                alerts.extend(_evaluate(state, user_id, account_number, transaction, recipient))
+        if alerts:
+            append_alerts(alerts)
+        return alerts
+    except Exception as e:
+        print(f"Error monitoring transactions: {e}")
+        return []
+
+# Function to replace the window state of every account
+def _replace_states(states):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM monitor_state")
+        conn.executemany("INSERT INTO monitor_state (account_number, state) VALUES (?, ?)",
+                         ((account_number, _encode_state(state)) for account_number, state in states.items()))
+
+# Function to clear the window state
+def reset_monitor():
+    _replace_states({})
+
+# Function to get the path of a day's alert file
+def _day_path(day, alerts_dir=None):
+    return os.path.join(alerts_dir or ALERTS_DIR, f"{day}.jsonl")
+
+# Function to append alerts to their day files
+def append_alerts(alerts, alerts_dir=None):
+    """
+    Append alerts to the files of their days, one O_APPEND write per file
+    """
+    by_day = {}
+    for alert in alerts:
+        by_day.setdefault(alert["timestamp"][:10], []).append(json.dumps(alert, separators=(",", ":")) + "\n")
+
+    os.makedirs(alerts_dir or ALERTS_DIR, exist_ok=True)
+    with _write_lock:
+        for day, lines in by_day.items():
+            data = "".join(lines).encode()
+            fd = os.open(_day_path(day, alerts_dir), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+# Function to turn a date bound into an ISO timestamp string
+def _bound(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+# Function to read alerts
+def read_alerts(start=None, end=None, rule=None, account_number=None):
+    """
+    Read the alerts with start <= timestamp < end (datetime or ISO string; None
+    leaves that side open), newest first; only the days in the range are opened
+    Returns list of alert dictionaries
+    """
+    start, end = _bound(start), _bound(end)
+    try:
+        days = sorted((name[:-len(".jsonl")] for name in os.listdir(ALERTS_DIR) if name.endswith(".jsonl")),
+                      reverse=True)
+    except FileNotFoundError:
+        return []
+
+    alerts = []
+    for day in days:
+        if (start and day < start[:10]) or (end and f"{day}T00:00:00" >= end):
+            continue
+        day_alerts = []
+        try:
+            with open(_day_path(day), 'r') as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        alert = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        print(f"Error reading alerts for {day}: {e}")
+                        continue
+                    timestamp = alert.get("timestamp", "")
+                    if (start and timestamp < start) or (end and timestamp >= end):
+                        continue
+                    if rule is not None and alert.get("rule") != rule:
+                        continue
+                    if account_number is not None and alert.get("account_number") != account_number:
+                        continue
+                    day_alerts.append(alert)
+        except FileNotFoundError:
+            continue
+        day_alerts.sort(key=lambda alert: alert.get("timestamp", ""), reverse=True)
+        alerts.extend(day_alerts)
+    return alerts
+
+# Function to regenerate the alerts from the transaction history
+def backfill_alerts():
+    """
+    Replay the flat store (transactions.json) and the user store's ledgers through
+    the rules in time order and replace the alerts store and the window state with the result
+    Commits made while this runs are not replayed, so run it while the app is idle
+    Returns (success, message) tuple
+    """
+    # Imported here: utils.db imports this module for its write hooks
+    from utils.db import find_transactions
+
+    try:
+        events = []
+        try:
+            with open(TRANSACTIONS_FILE, 'r') as f:
+                flat_transactions = json.load(f)
+            with open(ACCOUNTS_FILE, 'r') as f:
+                flat_accounts = json.load(f)
+        except FileNotFoundError:
+            flat_transactions, flat_accounts = {}, {}
+        for username, transactions in flat_transactions.items():
+            account_number = flat_accounts.get(username, {}).get("account_number", username)
+            for transaction in transactions:
+                events.append((transaction.get("timestamp") or "", username, account_number, transaction))
+        for user_id, account_number, transaction in find_transactions():
+            events.append((transaction.get("timestamp") or "", user_id, account_number, transaction))
+        events.sort(key=lambda event: event[0])
+
+        temp_dir = f"{ALERTS_DIR}.{uuid.uuid4().hex}.tmp"
+        states = {}
+        alerts = []
+        for _, user_id, account_number, transaction in events:
+            recipient = transaction.get("counterparty") if transaction.get("type") == "debit" else None
+            state = states.get(account_number)
+            if state is None:
+                state = states[account_number] = _new_state()
+            alerts.extend(_evaluate(state, user_id, account_number, transaction, recipient))
+        append_alerts(alerts, temp_dir)
+
+        old_dir = None
+        if os.path.exists(ALERTS_DIR):
+            old_dir = f"{ALERTS_DIR}.{uuid.uuid4().hex}.old"
+            os.rename(ALERTS_DIR, old_dir)
+        os.rename(temp_dir, ALERTS_DIR)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        _replace_states(states)
+        return True, f"Replayed {len(events)} transactions, {len(alerts)} alerts"
+    except Exception as e:
+        print(f"Error backfilling alerts: {e}")
+        return False, f"Error backfilling alerts: {str(e)}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Suspicious-transaction alerts")
+    parser.add_argument("--backfill", action="store_true",
+                        help="replace the alerts with a replay of the whole transaction history")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    success, message = backfill_alerts()
+    print(message)
+    raise SystemExit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Columnar snapshot of the flat transaction store (data/transactions.json)
+
+The admin monitoring tab needs every transaction as typed columns. Instead of
+parsing transactions.json and building a dict per row on each rerun, Home's
+add_transaction also appends each transaction to fixed-width column files:
+
+    timestamp.bin  int64    microseconds since the epoch (datetime64[us])
+    amount.bin     float64
+    type.bin       int16    code into meta.json "types"
+    user.bin       int32    code into meta.json "users" (usernames)
+    seq.bin        int32    the transaction's id within its user's list
+    desc_end.bin   int64    end offset of the description in descriptions.bin
+
+The files are partitioned by day: a transaction goes to the directory of its
+date (YYYY-MM-DD), or to "undated" without a readable timestamp. Queries take a
+[start, end) range and only open the partitions it overlaps, so "Today" reads
+today's rows and nothing else.
+
+load_transaction_snapshot keeps the partitions it opened in memory and on later
+calls only reads the bytes appended since, so a rerun costs a few stat calls.
+Rows are complete once all fixed columns have them; a torn append (crash) is
+ignored. If the snapshot is missing or has drifted it is rebuilt from
+transactions.json:
+
+    python -m utils.transaction_snapshot
+"""
+import os
+import json
+import uuid
+import shutil
+import argparse
+import threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to in-process locks only
+    fcntl = None
+
+from utils.lazy_imports import lazy_import
+
+# NumPy is only needed when the snapshot is read
+np = lazy_import("numpy")
+
+# Locations
+DATA_DIR = "data"
+TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transactions.json")
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots", "transactions")
+
+# Fixed-width columns (name -> NumPy dtype)
+SNAPSHOT_COLUMNS = {
+    "timestamp": "<i8",
+    "amount": "<f8",
+    "type": "<i2",
+    "user": "<i4",
+    "seq": "<i4",
+    "desc_end": "<i8",
+}
+
+# Partition of transactions without a readable timestamp
+UNDATED_PARTITION = "undated"
+
+# On-disk layout written by this version; older snapshots are rebuilt
+SNAPSHOT_LAYOUT = "daily"
+
+_append_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_cache = None   # {"generation", "partitions": {day: {"columns", "sizes"}}}
+
+# Function to get the path of a snapshot file
+def _path(name, snapshot_dir=None):
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, name)
+
+# Function to read the snapshot metadata
+def _read_meta(snapshot_dir=None):
+    try:
+        with open(_path("meta.json", snapshot_dir), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+# Function to write the snapshot metadata
+def _write_meta(meta, snapshot_dir=None):
+    temp_path = _path(f"meta.json.{uuid.uuid4().hex}.tmp", snapshot_dir)
+    with open(temp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_path, _path("meta.json", snapshot_dir))
+
+# Function to hold the snapshot's append lock
+@contextmanager
+def _locked():
+    os.makedirs(os.path.dirname(SNAPSHOT_DIR), exist_ok=True)
+    with _append_lock:
+        lock_file = open(SNAPSHOT_DIR + ".lock", 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+# Function to encode values as codes into a growing list of distinct values
+def _codes(values, items):
+    positions = {value: code for code, value in enumerate(values)}
+    codes = []
+    for item in items:
+        code = positions.get(item)
+        if code is None:
+            code = positions[item] = len(values)
+            values.append(item)
+        codes.append(code)
+    return codes
+
+# Function to convert ISO timestamps to microseconds since the epoch
+def _micros(timestamps):
+    try:
+        return np.array([t or "NaT" for t in timestamps], dtype="datetime64[us]").view("<i8")
+    except (TypeError, ValueError):
+        # Parse one by one so a bad value only loses its own timestamp
+        parsed = []
+        for t in timestamps:
+            try:
+                parsed.append(np.datetime64(t, "us"))
+            except (TypeError, ValueError):
+                parsed.append(np.datetime64("NaT", "us"))
+        return np.array(parsed, dtype="datetime64[us]").view("<i8")
+
+# Function to get the partition name of each timestamp
+def _partition_names(micros):
+    days = micros.view("datetime64[us]").astype("datetime64[D]").astype(str)
+    days[np.isnat(micros.view("datetime64[us]"))] = UNDATED_PARTITION
+    return days
+
+# Function to list the partitions overlapping a time range
+def _partitions_in_range(start=None, end=None, snapshot_dir=None):
+    """
+    Names of the day partitions with transactions in [start, end), in date order
+    The undated partition is only part of an unbounded query
+    """
+    try:
+        names = sorted(os.listdir(snapshot_dir or SNAPSHOT_DIR))
+    except FileNotFoundError:
+        return []
+
+    first_day = start.strftime("%Y-%m-%d") if start is not None else None
+    # end is exclusive: a range ending at midnight does not touch that day
+    last_day = (end - timedelta(microseconds=1)).strftime("%Y-%m-%d") if end is not None else None
+
+    partitions = []
+    for name in names:
+        if name == UNDATED_PARTITION:
+            if start is None and end is None:
+                partitions.append(name)
+            continue
+        if len(name) != 10 or name[4] != "-":
+            continue
+        if (first_day and name < first_day) or (last_day and name > last_day):
+            continue
+        partitions.append(name)
+    return partitions
+
+# Function to append rows to snapshot files
+def _append_rows(rows, meta, snapshot_dir=None):
+    """
+    Encode (username, transaction) pairs and append them to the column files of their day
+    The description blob is written first, so every row's offset points at written bytes
+    """
+    if not rows:
+        return
+
+    users, types = meta["users"], meta["types"]
+    known = len(users), len(types)
+    user_codes = np.array(_codes(users, [username for username, _ in rows]))
+    type_codes = np.array(_codes(types, [transaction.get("type") for _, transaction in rows]))
+    if (len(users), len(types)) != known:
+        _write_meta(meta, snapshot_dir)
+
+    timestamps = _micros([transaction.get("timestamp") for _, transaction in rows])
+    amounts = np.array([transaction.get("amount", 0) for _, transaction in rows], dtype=float)
+    seqs = np.array([transaction.get("id", 0) for _, transaction in rows])
+    descriptions = [str(transaction.get("description", "")).encode() for _, transaction in rows]
+
+    names, inverse = np.unique(_partition_names(timestamps), return_inverse=True)
+    for index, name in enumerate(names):
+        members = np.flatnonzero(inverse == index)
+        partition_dir = _path(str(name), snapshot_dir)
+        os.makedirs(partition_dir, exist_ok=True)
+
+        blobs = [descriptions[i] for i in members]
+        with open(_path("descriptions.bin", partition_dir), 'ab') as f:
+            start = f.seek(0, os.SEEK_END)
+            f.write(b"".join(blobs))
+
+        values = {
+            "timestamp": timestamps[members],
+            "amount": amounts[members],
+            "type": type_codes[members],
+            "user": user_codes[members],
+            "seq": seqs[members],
+            "desc_end": np.cumsum([len(d) for d in blobs], dtype=np.int64) + start,
+        }
+        for column, dtype in SNAPSHOT_COLUMNS.items():
+            with open(_path(f"{column}.bin", partition_dir), 'ab') as f:
+                f.write(np.asarray(values[column], dtype=dtype).tobytes())
+
+# Function to append transactions to the snapshot
+def append_transactions(username, transactions):
+    """
+    Add newly recorded transactions of a user to the snapshot
+    Does nothing until the snapshot exists (the first load builds it from transactions.json)
+    Returns (success, message) tuple
+    """
+    try:
+        with _locked():
+            meta = _read_meta()
+            if meta is None or meta.get("layout") != SNAPSHOT_LAYOUT:
+                return True, "No snapshot yet"
+            # A rebuild that ran after these were saved to transactions.json already has them
+            rebuilt_seq = meta["rebuilt_seq"].get(username, 0)
+            rows = [(username, transaction) for transaction in transactions if transaction.get("id", 0) > rebuilt_seq]
+            _append_rows(rows, meta)
+        return True, "Snapshot updated"
+    except Exception as e:
+        print(f"Error updating transaction snapshot: {e}")
+        return False, f"Error updating transaction snapshot: {e}"
+
+# Function to rebuild the snapshot from transactions.json
+def rebuild_transaction_snapshot(transactions_file=TRANSACTIONS_FILE):
+    """
+    Write a fresh snapshot of every transaction in transactions.json and swap it in
+    Returns (success, message) tuple
+    """
+    with _locked():
+        # Read under the lock so no append slips in between reading and swapping
+        try:
+            with open(transactions_file, 'r') as f:
+                all_transactions = json.load(f)
+        except FileNotFoundError:
+            all_transactions = {}
+        except json.JSONDecodeError as e:
+            return False, f"Error reading {transactions_file}: {e}"
+
+        temp_dir = f"{SNAPSHOT_DIR}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(temp_dir)
+        try:
+            meta = {
+                "generation": uuid.uuid4().hex,
+                "layout": SNAPSHOT_LAYOUT,
+                "users": [],
+                "types": [],
+                "rebuilt_seq": {
+                    username: max((transaction.get("id", 0) for transaction in transactions), default=0)
+                    for username, transactions in all_transactions.items()
+                },
+            }
+            rows = [(username, transaction) for username, transactions in all_transactions.items()
+                    for transaction in transactions]
+            _append_rows(rows, meta, temp_dir)
+            _write_meta(meta, temp_dir)
+
+            old_dir = None
+            if os.path.exists(SNAPSHOT_DIR):
+                old_dir = f"{SNAPSHOT_DIR}.{uuid.uuid4().hex}.old"
+                os.rename(SNAPSHOT_DIR, old_dir)
+            os.rename(temp_dir, SNAPSHOT_DIR)
+        except Exception as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            print(f"Error rebuilding transaction snapshot: {e}")
+            return False, f"Error rebuilding transaction snapshot: {e}"
+
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return True, f"Snapshot rebuilt with {len(rows)} transactions"
+
+# Function to read the bytes appended to a column file
+def _read_tail(partition_dir, name, dtype, offset):
+    with open(_path(f"{name}.bin", partition_dir), 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    usable = len(data) - len(data) % np.dtype(dtype).itemsize
+    return np.frombuffer(data[:usable], dtype=dtype)
+
+# Function to bring one cached partition up to date
+def _load_partition(partitions, name):
+    cached = partitions.get(name)
+    if cached is None:
+        cached = partitions[name] = {
+            "columns": {column: np.zeros(0, dtype=dtype) for column, dtype in SNAPSHOT_COLUMNS.items()},
+            "sizes": dict.fromkeys(SNAPSHOT_COLUMNS, 0),
+        }
+
+    partition_dir = _path(name)
+    columns, sizes = cached["columns"], cached["sizes"]
+    for column, dtype in SNAPSHOT_COLUMNS.items():
+        try:
+            size = os.path.getsize(_path(f"{column}.bin", partition_dir))
+        except FileNotFoundError:
+            # Partition still being created by an append
+            size = 0
+        if size > sizes[column]:
+            tail = _read_tail(partition_dir, column, dtype, sizes[column])
+            columns[column] = np.concatenate((columns[column], tail))
+            sizes[column] += tail.nbytes
+
+    # Rows still being appended are not in every column yet
+    rows = min(len(values) for values in columns.values())
+    return {column: values[:rows] for column, values in columns.items()}
+
+# Function to concatenate partitions into one set of columns
+def _merge_partitions(parts):
+    if not parts:
+        merged = {column: np.zeros(0, dtype=dtype) for column, dtype in SNAPSHOT_COLUMNS.items()}
+        merged["desc_start"] = np.zeros(0, dtype=np.int64)
+        merged["partition"] = np.zeros(0, dtype=np.int32)
+        return merged
+
+    merged = {column: np.concatenate([part[column] for part in parts]) for column in SNAPSHOT_COLUMNS}
+    merged["desc_start"] = np.concatenate(
+        [np.concatenate(([0], part["desc_end"][:-1])).astype(np.int64) for part in parts]
+    )
+    merged["partition"] = np.repeat(np.arange(len(parts), dtype=np.int32), [len(part["seq"]) for part in parts])
+    for values in merged.values():
+        values.setflags(write=False)
+    return merged
+
+# Function to load the snapshot columns
+def load_transaction_snapshot(start=None, end=None):
+    """
+    Get the transactions in [start, end) (datetimes; None leaves that side open)
+    as NumPy columns, opening only the day partitions the range overlaps and
+    reading only what was appended to them since the last call
+    The snapshot is built from transactions.json the first time
+    Returns dictionary with the SNAPSHOT_COLUMNS arrays (timestamp as datetime64[us]),
+    desc_start, partition (code into "partitions"), "users" and "types"
+    (code -> value arrays) and "rows"; do not modify the arrays
+    """
+    global _cache
+    meta = _read_meta()
+    if meta is None or meta.get("layout") != SNAPSHOT_LAYOUT:
+        success, message = rebuild_transaction_snapshot()
+        if not success:
+            raise RuntimeError(message)
+        meta = _read_meta()
+
+    names = _partitions_in_range(start, end)
+    with _cache_lock:
+        if _cache is None or _cache["generation"] != meta["generation"]:
+            _cache = {"generation": meta["generation"], "partitions": {}, "merged": None}
+        parts = [_load_partition(_cache["partitions"], name) for name in names]
+
+        # The last merge is reused while the same partitions have the same rows
+        key = tuple((name, len(part["seq"])) for name, part in zip(names, parts))
+        if _cache["merged"] is not None and _cache["merged"][0] == key:
+            merged = _cache["merged"][1]
+        else:
+            merged = _merge_partitions(parts)
+            _cache["merged"] = (key, merged)
+
+    snapshot = dict(merged)
+
+    # Only the partitions at the edges of the range can hold rows outside it
+    keep = None
+    if start is not None:
+        keep = snapshot["timestamp"] >= np.datetime64(start, "us").astype(np.int64)
+    if end is not None:
+        before_end = snapshot["timestamp"] < np.datetime64(end, "us").astype(np.int64)
+        keep = before_end if keep is None else keep & before_end
+    if keep is not None and not keep.all():
+        snapshot = {column: values[keep] for column, values in snapshot.items()}
+
+    snapshot["timestamp"] = snapshot["timestamp"].view("datetime64[us]")
+    snapshot["users"] = np.array(meta["users"], dtype=object)
+    snapshot["types"] = np.array(meta["types"], dtype=object)
+    snapshot["partitions"] = names
+    snapshot["rows"] = len(snapshot["seq"])
+    return snapshot
+
+# Function to read the descriptions of some rows
+def read_descriptions(snapshot, rows):
+    """
+    Read the descriptions of the given row numbers only
+    Returns list of strings
+    """
+    result = [""] * len(rows)
+    files = {}
+    try:
+        for index, row in enumerate(rows):
+            name = snapshot["partitions"][snapshot["partition"][row]]
+            f = files.get(name)
+            if f is None:
+                f = files[name] = open(_path("descriptions.bin", _path(name)), 'rb')
+            start = snapshot["desc_start"][row]
+            f.seek(start)
+            result[index] = f.read(snapshot["desc_end"][row] - start).decode(errors="replace")
+    finally:
+        for f in files.values():
+            f.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the columnar transaction snapshot from transactions.json")
+    parser.parse_args()
+
+    success, message = rebuild_transaction_snapshot()
+    print(message)
+    raise SystemExit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
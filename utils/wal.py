@@ -0,0 +1,189 @@
+import os
+import json
+import glob
+import threading
+
+# Base directory for the write-ahead log
+DATA_DIR = "data"
+WAL_DIR = os.path.join(DATA_DIR, "wal")
+
+# How long the committing thread waits for more records to join its batch (seconds)
+# 0 still batches every record that arrives while the previous fsync is running
+WAL_GROUP_COMMIT_DELAY = 0.0
+
+# Ensure directories exist
+os.makedirs(WAL_DIR, exist_ok=True)
+
+# Log state, guarded by _wal_cond
+_wal_cond = threading.Condition()
+_pending = []   # encoded records waiting for the next flush
+_failed = []    # (first_seq, last_seq) ranges whose flush failed
+_state = {
+    "fd": None,           # descriptor of the segment being appended to
+    "segment": None,      # path of the segment being appended to
+    "next_seq": None,     # next sequence number to hand out
+    "durable_seq": 0,     # highest sequence number known to be on disk
+    "flushing": False,    # a thread is writing a batch right now
+    "records": 0,         # durable records in the current segment
+}
+
+# Function to get the path of a segment
+def _segment_path(first_seq):
+    return os.path.join(WAL_DIR, f"wal-{first_seq:020d}.log")
+
+# Function to fsync the log directory so segment creation and removal are durable
+def _fsync_dir():
+    try:
+        fd = os.open(WAL_DIR, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# Function to list the log segments
+def list_segments():
+    """
+    List log segment paths, oldest first
+    """
+    return sorted(glob.glob(os.path.join(WAL_DIR, "wal-*.log")))
+
+# Function to read log records
+def read_records(segments=None):
+    """
+    Iterate over the records in the given segments (all segments by default)
+    A torn last line (crash during a flush) is skipped
+    """
+    for path in segments if segments is not None else list_segments():
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        print(f"Error reading WAL segment {path}: {e}")
+        except FileNotFoundError:
+            continue
+
+# Function to open a new segment (caller holds _wal_cond)
+def _open_segment():
+    if _state["fd"] is not None:
+        os.close(_state["fd"])
+    _state["segment"] = _segment_path(_state["next_seq"])
+    _state["fd"] = os.open(_state["segment"], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    _state["records"] = 0
+    _fsync_dir()
+
+# Function to initialise the log state (caller holds _wal_cond)
+def _init():
+    if _state["next_seq"] is not None:
+        return
+
+    last_seq = 0
+    for record in read_records():
+        last_seq = max(last_seq, record.get("seq", 0))
+
+    _state["next_seq"] = last_seq + 1
+    _state["durable_seq"] = last_seq
+    _open_segment()
+
+# Function to append a record to the log
+def append(record):
+    """
+    Append a record to the log and wait until it is on disk
+    Records from concurrent callers are flushed together with one write and one
+    fsync (group commit)
+    Returns the sequence number assigned to the record; raises OSError if the flush fails
+    """
+    with _wal_cond:
+        _init()
+        seq = _state["next_seq"]
+        _state["next_seq"] += 1
+        _pending.append(json.dumps(dict(record, seq=seq), separators=(",", ":")) + "\n")
+
+        while True:
+            for first_seq, last_seq in _failed:
+                if first_seq <= seq <= last_seq:
+                    raise OSError(f"WAL flush failed for record {seq}")
+            if _state["durable_seq"] >= seq:
+                return seq
+            if _state["flushing"]:
+                _wal_cond.wait()
+                continue
+
+            # Become the leader for the next batch
+            _state["flushing"] = True
+            if WAL_GROUP_COMMIT_DELAY:
+                _wal_cond.wait(WAL_GROUP_COMMIT_DELAY)
+
+            batch = "".join(_pending).encode()
+            count = len(_pending)
+            last_seq = _state["next_seq"] - 1
+            _pending.clear()
+            fd = _state["fd"]
+
+            _wal_cond.release()
+            error = None
+            try:
+                view = memoryview(batch)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            except OSError as e:
+                error = e
+            finally:
+                _wal_cond.acquire()
+                _state["flushing"] = False
+                if error is None:
+                    _state["durable_seq"] = last_seq
+                    _state["records"] += count
+                else:
+                    print(f"Error flushing WAL: {error}")
+                    _failed.append((last_seq - count + 1, last_seq))
+                _wal_cond.notify_all()
+
+# Function to count records waiting for a checkpoint
+def records_since_rotate():
+    """
+    Number of durable records in the current segment
+    """
+    with _wal_cond:
+        return _state["records"]
+
+# Function to start a new segment
+def rotate():
+    """
+    Close the current segment and direct new records to a fresh one
+    Returns (closed_segments, last_seq) where every record with seq <= last_seq
+    is in one of the closed segments
+    """
+    with _wal_cond:
+        _init()
+        while _state["flushing"]:
+            _wal_cond.wait()
+
+        current = _state["segment"]
+        if _segment_path(_state["next_seq"]) != current:
+            # Records were handed out since the segment was opened
+            _open_segment()
+            closed = [path for path in list_segments() if path <= current]
+        else:
+            closed = [path for path in list_segments() if path < current]
+        return closed, _state["durable_seq"]
+
+# Function to remove checkpointed segments
+def remove_segments(segments):
+    """
+    Delete segments whose records have been checkpointed
+    """
+    for path in segments:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    _fsync_dir()